@@ -6,6 +6,7 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List
 
+import click
 from flask import Flask
 
 try:
@@ -13,8 +14,23 @@ try:
 except ModuleNotFoundError:  # pragma: no cover - optional dependency
     config = None  # type: ignore
 
-from .services.models import fetch_available_models
-from .settings import DEFAULT_SETTINGS, SettingsStore, load_settings, mask_api_key
+from . import metrics
+from .jobs import JobManager, JobStore
+from .services.budget import DailyUsageStore
+from .services.cache import DEFAULT_MAX_ENTRIES, DEFAULT_TTL_SECONDS, ExpansionCache
+from .services.checkpoints import CheckpointStore
+from .services.client import (
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_REQUEST_TIMEOUT,
+    DEFAULT_REQUESTS_PER_MINUTE,
+    DEFAULT_TOKENS_PER_MINUTE,
+    ChatClient,
+)
+from .services.models import DISCOVERY_TIMEOUT_SECONDS, MODEL_CACHE_TTL_SECONDS, ModelCatalog
+from .services.render import DEFAULT_NODE_BUDGET, RenderCache
+from .services.subtopics import DEFAULT_CONCURRENCY
+from .settings import DEFAULT_SETTINGS, load_settings, mask_api_key
+from .storage import BaseHistoryStore, HistoryStore, SQLiteHistoryStore, migrate_json_history
 
 
 def create_app(test_config: Dict[str, Any] | None = None) -> Flask:
@@ -28,9 +44,48 @@ def create_app(test_config: Dict[str, Any] | None = None) -> Flask:
             "OPENAI_API_KEY",
             getattr(config, "API_KEY", ""),
         ),
+        "HISTORY_BACKEND": os.environ.get("HISTORY_BACKEND", "sqlite"),
         "HISTORY_PATH": Path(app.instance_path) / "history.json",
+        "HISTORY_DB_PATH": Path(app.instance_path) / "history.sqlite3",
         "DEFAULT_TOPICS": getattr(config, "DEFAULT_TOPICS", []),
         "SETTINGS_PATH": Path(app.instance_path) / "settings.json",
+        "CACHE_PATH": Path(app.instance_path) / "expansion_cache.sqlite3",
+        "CACHE_MAX_ENTRIES": DEFAULT_MAX_ENTRIES,
+        "CACHE_TTL_SECONDS": DEFAULT_TTL_SECONDS,
+        "OPENAI_API_BASE": os.environ.get("OPENAI_API_BASE", ""),
+        "OPENAI_REQUESTS_PER_MINUTE": getattr(
+            config, "OPENAI_REQUESTS_PER_MINUTE", DEFAULT_REQUESTS_PER_MINUTE
+        ),
+        "OPENAI_TOKENS_PER_MINUTE": getattr(
+            config, "OPENAI_TOKENS_PER_MINUTE", DEFAULT_TOKENS_PER_MINUTE
+        ),
+        "OPENAI_MODEL_RATE_LIMITS": getattr(config, "OPENAI_MODEL_RATE_LIMITS", {}),
+        "OPENAI_MAX_RETRIES": DEFAULT_MAX_RETRIES,
+        "OPENAI_REQUEST_TIMEOUT": DEFAULT_REQUEST_TIMEOUT,
+        "JOBS_DB_PATH": Path(app.instance_path) / "jobs.sqlite3",
+        "JOB_WORKERS": int(os.environ.get("JOB_WORKERS", "2")),
+        "GENERATION_CONCURRENCY": getattr(
+            config,
+            "GENERATION_CONCURRENCY",
+            DEFAULT_CONCURRENCY,
+        ),
+        "GENERATION_BATCH_SIZE": getattr(config, "GENERATION_BATCH_SIZE", 1),
+        "GENERATION_ENGINE": getattr(config, "GENERATION_ENGINE", "threads"),
+        "REQUEST_MAX_CALLS": getattr(config, "REQUEST_MAX_CALLS", None),
+        "REQUEST_MAX_TOKENS": getattr(config, "REQUEST_MAX_TOKENS", None),
+        "REQUEST_MAX_SECONDS": getattr(config, "REQUEST_MAX_SECONDS", None),
+        "DAILY_MAX_CALLS": getattr(config, "DAILY_MAX_CALLS", None),
+        "DAILY_MAX_TOKENS": getattr(config, "DAILY_MAX_TOKENS", None),
+        "DAILY_MAX_SECONDS": getattr(config, "DAILY_MAX_SECONDS", None),
+        "USAGE_DB_PATH": Path(app.instance_path) / "usage.sqlite3",
+        "CHECKPOINT_DB_PATH": Path(app.instance_path) / "checkpoints.sqlite3",
+        "RENDER_CACHE_ENTRIES": 64,
+        "TREE_RENDER_NODE_BUDGET": DEFAULT_NODE_BUDGET,
+        "METRICS_ENABLED": os.environ.get("METRICS_ENABLED", "1") != "0",
+        "TRACE_REQUESTS": os.environ.get("TRACE_REQUESTS", "0") == "1",
+        "MODEL_CACHE_PATH": Path(app.instance_path) / "models.json",
+        "MODEL_REFRESH_SECONDS": MODEL_CACHE_TTL_SECONDS,
+        "MODEL_DISCOVERY_TIMEOUT": DISCOVERY_TIMEOUT_SECONDS,
         "AVAILABLE_MODELS": getattr(
             config,
             "AVAILABLE_MODELS",
@@ -50,20 +105,62 @@ def create_app(test_config: Dict[str, Any] | None = None) -> Flask:
     Path(app.instance_path).mkdir(parents=True, exist_ok=True)
 
     history_path: Path = app.config["HISTORY_PATH"]
-    if not history_path.exists():
-        history_path.write_text("[]", encoding="utf-8")
+    history_store: BaseHistoryStore
+    if app.config["HISTORY_BACKEND"] == "json":
+        if not history_path.exists():
+            history_path.write_text("[]", encoding="utf-8")
+        history_store = HistoryStore(history_path)
+    else:
+        history_db_path = Path(app.config["HISTORY_DB_PATH"])
+        is_new_database = not history_db_path.exists()
+        history_store = SQLiteHistoryStore(history_db_path)
+        if is_new_database and history_path.exists():
+            # One-shot import of the legacy JSON history; the file is kept as a backup.
+            migrate_json_history(history_path, history_store)
+    # Built once: opening the SQLite store runs its schema DDL and PRAGMAs.
+    app.extensions["history_store"] = history_store
 
     settings_path: Path = app.config["SETTINGS_PATH"]
     if not settings_path.exists():
         settings_path.write_text(json.dumps(DEFAULT_SETTINGS, indent=2), encoding="utf-8")
 
-    # Attempt to dynamically retrieve OpenAI models when an API key is available.
-    settings_store = SettingsStore(settings_path)
-    stored_settings = settings_store.load()
-    effective_api_key = stored_settings.get("api_key") or app.config.get("OPENAI_API_KEY", "")
-    dynamic_models = fetch_available_models(effective_api_key)
-    if dynamic_models:
-        app.config["AVAILABLE_MODELS"] = dynamic_models
+    app.extensions["expansion_cache"] = ExpansionCache(
+        Path(app.config["CACHE_PATH"]),
+        max_entries=app.config["CACHE_MAX_ENTRIES"],
+        ttl_seconds=app.config["CACHE_TTL_SECONDS"],
+    )
+
+    app.extensions["openai_client"] = ChatClient(
+        requests_per_minute=app.config["OPENAI_REQUESTS_PER_MINUTE"],
+        tokens_per_minute=app.config["OPENAI_TOKENS_PER_MINUTE"],
+        model_limits=app.config["OPENAI_MODEL_RATE_LIMITS"],
+        max_retries=app.config["OPENAI_MAX_RETRIES"],
+        api_base=app.config["OPENAI_API_BASE"],
+        request_timeout=app.config["OPENAI_REQUEST_TIMEOUT"],
+    )
+    app.extensions["daily_usage"] = DailyUsageStore(Path(app.config["USAGE_DB_PATH"]))
+    app.extensions["checkpoints"] = CheckpointStore(Path(app.config["CHECKPOINT_DB_PATH"]))
+    app.extensions["render_cache"] = RenderCache(
+        max_entries=app.config["RENDER_CACHE_ENTRIES"],
+        node_budget=app.config["TREE_RENDER_NODE_BUDGET"],
+    )
+    app.extensions["jobs"] = JobManager(
+        app,
+        JobStore(Path(app.config["JOBS_DB_PATH"])),
+        workers=app.config["JOB_WORKERS"],
+    )
+
+    # Models are discovered in the background on first use; until then the
+    # last listing saved on disk (or AVAILABLE_MODELS) is offered.
+    app.extensions["model_catalog"] = ModelCatalog(
+        Path(app.config["MODEL_CACHE_PATH"]),
+        fallback=app.config["AVAILABLE_MODELS"],
+        refresh_seconds=app.config["MODEL_REFRESH_SECONDS"],
+        timeout=app.config["MODEL_DISCOVERY_TIMEOUT"],
+        api_base=app.config["OPENAI_API_BASE"],
+    )
+
+    metrics.init_app(app)
 
     from .routes import main_bp
 
@@ -74,12 +171,67 @@ def create_app(test_config: Dict[str, Any] | None = None) -> Flask:
         dt = datetime.fromisoformat(value)
         return dt.strftime("%b %d, %Y %I:%M %p")
 
+    @app.cli.command("seed-cache")
+    def seed_cache() -> None:
+        """Pre-populate the expansion cache from saved history entries."""
+        from .storage import get_store
+
+        seeded = app.extensions["expansion_cache"].seed_from_history(get_store().load())
+        print(f"Seeded {seeded} expansions into the cache.")
+
+    @app.cli.command("migrate-history")
+    def migrate_history() -> None:
+        """Import entries from history.json into the SQLite history database."""
+        store = app.extensions["history_store"]
+        if not isinstance(store, SQLiteHistoryStore):
+            store = SQLiteHistoryStore(Path(app.config["HISTORY_DB_PATH"]))
+        imported = migrate_json_history(Path(app.config["HISTORY_PATH"]), store)
+        print(f"Imported {imported} history entries.")
+
+    @app.cli.command("compact-history")
+    def compact_history() -> None:
+        """Rewrite saved entries into the compact call-log and binary tree layouts."""
+        from .storage import get_store
+
+        compacted = get_store().compact()
+        print(f"Compacted {compacted} history entries.")
+
+    @app.cli.command("recover-generations")
+    @click.option(
+        "--idle-minutes",
+        default=10.0,
+        show_default=True,
+        help="Only recover generations with no progress for this long.",
+    )
+    def recover_generations(idle_minutes: float) -> None:
+        """Save the partial trees of interrupted generations to history."""
+        from .storage import get_store
+
+        checkpoints = app.extensions["checkpoints"]
+        job_store = app.extensions["jobs"].store
+        recovered = 0
+        for generation_id in checkpoints.unfinished(idle_seconds=idle_minutes * 60):
+            entry = checkpoints.restore(generation_id)
+            if entry is not None:
+                get_store().add_entry(entry)
+                job = job_store.get(generation_id)
+                if job and job["status"] in ("queued", "running"):
+                    job_store.update(
+                        generation_id,
+                        status="failed",
+                        error="Generation was interrupted; the partial tree was saved to history.",
+                        entry_id=entry["id"],
+                    )
+                recovered += 1
+            checkpoints.finish(generation_id)
+        print(f"Recovered {recovered} interrupted generations.")
+
     @app.context_processor
     def inject_defaults() -> Dict[str, Any]:
         settings = load_settings()
-        has_configured_key = bool(
-            settings.get("api_key") or app.config.get("OPENAI_API_KEY")
-        )
+        api_key = settings.get("api_key") or app.config.get("OPENAI_API_KEY", "")
+        has_configured_key = bool(api_key)
+        available_models = app.extensions["model_catalog"].models(api_key)
         public_settings = {
             key: value
             for key, value in settings.items()
@@ -89,10 +241,9 @@ def create_app(test_config: Dict[str, Any] | None = None) -> Flask:
             {
                 "api_key_masked": mask_api_key(settings.get("api_key", "")),
                 "has_api_key": has_configured_key,
-                "available_models": app.config["AVAILABLE_MODELS"],
+                "available_models": available_models,
             }
         )
-        available_models: List[str] = app.config.get("AVAILABLE_MODELS", [])
         default_model = public_settings.get("default_model")
         if available_models and default_model not in available_models:
             public_settings["default_model"] = available_models[0]
@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from flask import Flask, current_app
+
+from .services.async_subtopics import run_topic_tree
+from .services.budget import create_budget_tracker
+from .services.cache import get_cache
+from .services.checkpoints import get_checkpoints
+from .services.client import get_client
+from .services.subtopics import (
+    GenerationCancelled,
+    GenerationRequest,
+    SubtopicGenerationError,
+    generate_topic_tree,
+)
+from .storage import get_store
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+# Progress rows are written at most this often while a job is running.
+PROGRESS_INTERVAL_SECONDS = 0.5
+
+# Events that end a job's event stream.
+TERMINAL_EVENTS = ("done", "failure")
+
+
+class JobStore:
+    """SQLite table tracking generation jobs.
+
+    The table is shared by every worker process so status, progress and
+    cancellation requests are visible no matter which process serves the
+    poll. API keys are never persisted. ``total_nodes`` only counts nodes
+    found so far that the job will expand (leaves at the last level are
+    left out), so ``expanded_nodes / total_nodes`` tracks real progress.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    request TEXT NOT NULL,
+                    expanded_nodes INTEGER NOT NULL DEFAULT 0,
+                    total_nodes INTEGER NOT NULL DEFAULT 0,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    entry_id TEXT,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+                """
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)"
+            )
+
+    def create(self, generation_request: GenerationRequest) -> str:
+        job_id = uuid.uuid4().hex
+        now = datetime.utcnow().isoformat()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, status, request, total_nodes, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?)",
+                (
+                    job_id,
+                    json.dumps(asdict(generation_request)),
+                    len(generation_request.topics),
+                    now,
+                    now,
+                ),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as connection:
+            connection.row_factory = sqlite3.Row
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["request"] = json.loads(job["request"])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        fields["updated_at"] = datetime.utcnow().isoformat()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as connection:
+            connection.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?",
+                (*fields.values(), job_id),
+            )
+
+    def request_cancel(self, job_id: str) -> bool:
+        """Flag a job for cancellation; queued jobs are cancelled immediately."""
+
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET cancel_requested = 1, updated_at = ?, "
+                "status = CASE status WHEN 'queued' THEN 'cancelled' ELSE status END "
+                "WHERE id = ? AND status IN ('queued', 'running')",
+                (datetime.utcnow().isoformat(), job_id),
+            )
+        return cursor.rowcount > 0
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        return bool(row and row[0])
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(str(self.path), timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+
+class JobManager:
+    """In-process queue and worker pool that runs generation jobs.
+
+    Workers are started lazily on the first submission so CLI commands and
+    short-lived app instances never spawn threads. Completed jobs are saved
+    to the history store like any other generation. ``GENERATION_ENGINE``
+    picks the threaded or the asyncio engine for each job.
+
+    While a job submitted to this process is queued or running, its events
+    (``node`` and ``failed`` per expansion, then ``done`` or ``failure``)
+    are kept in a backlog and fanned out to every ``subscribe`` queue, so a
+    subscriber that arrives late still sees the whole tree.
+    """
+
+    def __init__(self, app: Flask, store: JobStore, workers: int = 2):
+        self.app = app
+        self.store = store
+        self.workers = max(1, int(workers))
+        self._queue: "queue.Queue[Tuple[str, GenerationRequest, str]]" = queue.Queue()
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self._backlogs: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+        self._subscribers: Dict[str, List["queue.Queue[Tuple[str, Dict[str, Any]]]"]] = {}
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def submit(self, generation_request: GenerationRequest, api_key: str) -> str:
+        job_id = self.store.create(generation_request)
+        with self._lock:
+            self._cancel_events[job_id] = threading.Event()
+            self._backlogs[job_id] = []
+            self._ensure_workers()
+        self._queue.put((job_id, generation_request, api_key))
+        return job_id
+
+    def subscribe(self, job_id: str) -> Optional["queue.Queue[Tuple[str, Dict[str, Any]]]"]:
+        """Return a queue of ``(event, payload)`` pairs for a job owned by this process.
+
+        The queue starts with every event published so far. ``None`` means
+        the job already finished or runs in another process; poll the
+        ``JobStore`` instead.
+        """
+
+        with self._lock:
+            backlog = self._backlogs.get(job_id)
+            if backlog is None:
+                return None
+            events: "queue.Queue[Tuple[str, Dict[str, Any]]]" = queue.Queue()
+            for item in backlog:
+                events.put(item)
+            self._subscribers.setdefault(job_id, []).append(events)
+        return events
+
+    def unsubscribe(self, job_id: str, events: "queue.Queue[Tuple[str, Dict[str, Any]]]") -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(job_id, [])
+            if events in subscribers:
+                subscribers.remove(events)
+
+    def cancel(self, job_id: str) -> bool:
+        if not self.store.request_cancel(job_id):
+            return False
+        event = self._cancel_events.get(job_id)
+        if event is not None:
+            event.set()
+        return True
+
+    def _ensure_workers(self) -> None:
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._work,
+                name=f"generation-worker-{len(self._threads) + 1}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self) -> None:
+        while True:
+            job_id, generation_request, api_key = self._queue.get()
+            try:
+                with self.app.app_context():
+                    self._run(job_id, generation_request, api_key)
+            except Exception:  # noqa: BLE001 - keep the worker alive
+                self.app.logger.exception("Generation job %s crashed", job_id)
+                self.store.update(job_id, status="failed", error="Generation failed unexpectedly.")
+            finally:
+                # A no-op when _run already published its outcome.
+                self._publish(job_id, "failure", {"message": "Generation failed unexpectedly."})
+                self._cancel_events.pop(job_id, None)
+                self._queue.task_done()
+
+    def _publish(self, job_id: str, event: str, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            backlog = self._backlogs.get(job_id)
+            if backlog is None:
+                return
+            backlog.append((event, payload))
+            for events in self._subscribers.get(job_id, []):
+                events.put((event, payload))
+            if event in TERMINAL_EVENTS:
+                # Subscribers already hold the final event; later ones poll the store.
+                self._backlogs.pop(job_id, None)
+                self._subscribers.pop(job_id, None)
+
+    def _run(self, job_id: str, generation_request: GenerationRequest, api_key: str) -> None:
+        cancel_event = self._cancel_events.get(job_id) or threading.Event()
+        if self.store.is_cancel_requested(job_id):
+            self.store.update(job_id, status="cancelled")
+            self._publish(job_id, "failure", {"message": "Generation was cancelled."})
+            return
+
+        self.store.update(job_id, status="running")
+        checkpoints = get_checkpoints()
+        checkpoints.begin(job_id, generation_request, generation_request.use_demo_mode or not api_key)
+        # Only nodes the job will expand count towards the total: the roots,
+        # plus the children of every node expanded above the last level.
+        max_level = 1 if generation_request.lazy else generation_request.max_level
+        progress = {"expanded": 0, "total": len(generation_request.topics), "flushed_at": 0.0}
+        progress_lock = threading.Lock()
+
+        def advance(expanded_path: Tuple[int, ...], new_nodes: int) -> None:
+            with progress_lock:
+                progress["expanded"] += 1
+                if len(expanded_path) < max_level:
+                    progress["total"] += new_nodes
+                now = time.monotonic()
+                if now - progress["flushed_at"] < PROGRESS_INTERVAL_SECONDS:
+                    return
+                progress["flushed_at"] = now
+                expanded, total = progress["expanded"], progress["total"]
+            self.store.update(job_id, expanded_nodes=expanded, total_nodes=total)
+            # Pick up cancellations issued by other worker processes.
+            if self.store.is_cancel_requested(job_id):
+                cancel_event.set()
+
+        def on_expand(path: Tuple[int, ...], topic: str, subtopics: List[str], metadata: Any) -> None:
+            checkpoints.record(job_id, path, subtopics, metadata)
+            self._publish(
+                job_id,
+                "node",
+                {
+                    "path": list(path),
+                    "topic": topic,
+                    "children": subtopics,
+                    "mode": (metadata or {}).get("mode"),
+                },
+            )
+            advance(path, len(subtopics))
+
+        def on_failure(path: Tuple[int, ...], topic: str, error: str) -> None:
+            checkpoints.fail(job_id, path, error)
+            self._publish(job_id, "failed", {"path": list(path), "topic": topic, "error": error})
+            advance(path, 0)
+
+        def on_mark(path: Tuple[int, ...], key: str, value: Any) -> None:
+            checkpoints.mark(job_id, path, key, value)
+
+        if self.app.config.get("GENERATION_ENGINE") == "asyncio":
+            engine = run_topic_tree
+        else:
+            engine = generate_topic_tree
+        try:
+            result = engine(
+                generation_request,
+                api_key=api_key,
+                cache=get_cache(),
+                client=get_client(),
+                on_expand=on_expand,
+                cancel_event=cancel_event,
+                budget=create_budget_tracker(),
+                on_failure=on_failure,
+                on_mark=on_mark,
+            )
+        except GenerationCancelled as exc:
+            checkpoints.finish(job_id)
+            self.store.update(job_id, status="cancelled")
+            self._publish(job_id, "failure", {"message": str(exc)})
+            return
+        except SubtopicGenerationError as exc:
+            checkpoints.finish(job_id)
+            self.store.update(job_id, status="failed", error=str(exc))
+            self._publish(job_id, "failure", {"message": str(exc)})
+            return
+
+        result["is_favorite"] = False
+        get_store().add_entry(result)
+        checkpoints.finish(job_id)
+        self.store.update(
+            job_id,
+            status="completed",
+            entry_id=result["id"],
+            expanded_nodes=progress["expanded"],
+            total_nodes=progress["total"],
+        )
+        self._publish(
+            job_id,
+            "done",
+            {"id": result["id"], "budget_exhausted": result.get("budget_exhausted")},
+        )
+
+
+def get_job_manager() -> JobManager:
+    return current_app.extensions["jobs"]
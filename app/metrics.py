@@ -0,0 +1,361 @@
+"""Process-local metrics in the Prometheus text format, plus optional trace spans.
+
+Hot paths record into the module-level ``Counter`` and ``Histogram`` objects
+below; ``/metrics`` renders them together with the hit/miss counters the
+caches already keep. Values are per worker process, which is how Prometheus
+expects multi-process servers to be scraped (one target per worker).
+
+When ``TRACE_REQUESTS`` is enabled every timed block inside a request is
+also kept as a span and returned in the response's ``Server-Timing``
+header, which browser developer tools show per request.
+"""
+
+from __future__ import annotations
+
+import bisect
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from flask import Flask, Response, before_render_template, g, request, template_rendered
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_LabelKey = Tuple[str, ...]
+# (name, labels, value) triples returned by collectors at scrape time.
+Sample = Tuple[str, Dict[str, str], float]
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> _LabelKey:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[_LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts..., +Inf count], sum.
+        self._values: Dict[_LabelKey, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the duration of the block and record it as a trace span."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(elapsed, **labels)
+            _record_span(self.name, labels, start, elapsed)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        samples: List[Sample] = []
+        for key, counts, total in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_bound(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Tuple[str, str, str, Callable[[], List[Sample]]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(
+        self,
+        name: str,
+        kind: str,
+        documentation: str,
+        collect: Callable[[], List[Sample]],
+    ) -> None:
+        """Add values read at scrape time, such as counters kept by a cache."""
+
+        self._collectors = [item for item in self._collectors if item[0] != name]
+        self._collectors.append((name, kind, documentation, collect))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        families = [(metric.name, metric.kind, metric.documentation, metric.samples) for metric in self._metrics]
+        for name, kind, documentation, collect in families + self._collectors:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in collect():
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "subtopics_http_request_seconds",
+    "Time spent handling HTTP requests.",
+    ("endpoint", "method", "status"),
+)
+HISTORY_OPERATION_SECONDS = REGISTRY.histogram(
+    "subtopics_history_operation_seconds",
+    "Duration of history store operations.",
+    ("backend", "operation"),
+)
+HISTORY_BYTES = REGISTRY.counter(
+    "subtopics_history_bytes_total",
+    "Bytes of serialized history read from or written to storage.",
+    ("backend", "direction"),
+)
+FETCH_TOTAL = REGISTRY.counter(
+    "subtopics_fetch_total",
+    "Expanded nodes by how they were answered (live, cache, demo or failed); a batched completion counts once per node it answered.",
+    ("mode",),
+)
+FETCH_SECONDS = REGISTRY.histogram(
+    "subtopics_fetch_seconds",
+    "Latency of live chat completions, retries included.",
+    ("model",),
+)
+FETCH_TOKENS = REGISTRY.counter(
+    "subtopics_fetch_tokens_total",
+    "Tokens reported by live chat completions.",
+    ("model", "kind"),
+)
+TEMPLATE_RENDER_SECONDS = REGISTRY.histogram(
+    "subtopics_template_render_seconds",
+    "Time spent rendering Jinja templates.",
+    ("template",),
+)
+SETTINGS_LOAD_SECONDS = REGISTRY.histogram(
+    "subtopics_settings_load_seconds",
+    "Time spent loading workspace settings.",
+    ("source",),
+)
+
+
+def observe_fetch(metadata: Optional[Dict[str, Any]], model: str) -> None:
+    """Record one completion's latency and token usage (cache and demo records are skipped)."""
+
+    if not metadata or metadata.get("mode") != "live":
+        return
+    FETCH_SECONDS.observe(float(metadata.get("elapsed_seconds") or 0.0), model=model)
+    FETCH_TOKENS.inc(int(metadata.get("prompt_tokens") or 0), model=model, kind="prompt")
+    FETCH_TOKENS.inc(int(metadata.get("completion_tokens") or 0), model=model, kind="completion")
+
+
+# Spans of the request being traced, or None when tracing is off.
+_spans: ContextVar[Optional[List[Tuple[str, Dict[str, Any], float, float]]]] = ContextVar(
+    "subtopics_trace_spans", default=None
+)
+
+
+def _record_span(name: str, labels: Dict[str, Any], start: float, elapsed: float) -> None:
+    spans = _spans.get()
+    if spans is not None:
+        spans.append((name, labels, start, elapsed))
+
+
+def init_app(app: Flask) -> None:
+    """Time requests and template renders, and register cache collectors."""
+
+    _register_app_collectors(app)
+
+    @app.before_request
+    def start_request_timer() -> None:
+        g.metrics_started_at = time.perf_counter()
+        if app.config.get("TRACE_REQUESTS"):
+            g.metrics_trace_token = _spans.set([])
+
+    @app.after_request
+    def finish_request_timer(response: Response) -> Response:
+        started_at = g.pop("metrics_started_at", None)
+        if started_at is not None:
+            elapsed = time.perf_counter() - started_at
+            HTTP_REQUEST_SECONDS.observe(
+                elapsed,
+                endpoint=request.url_rule.rule if request.url_rule else "unmatched",
+                method=request.method,
+                status=response.status_code,
+            )
+        token = g.pop("metrics_trace_token", None)
+        if token is not None:
+            spans = _spans.get() or []
+            _spans.reset(token)
+            response.headers["Server-Timing"] = _server_timing(spans)
+            app.logger.debug("Trace %s %s: %s", request.method, request.path, response.headers["Server-Timing"])
+        return response
+
+    @app.teardown_request
+    def discard_trace(exc: BaseException | None) -> None:
+        # after_request is skipped when a view raises; never leak a trace into the next request.
+        token = g.pop("metrics_trace_token", None)
+        if token is not None:
+            _spans.reset(token)
+
+    def before_render(sender: Flask, template: Any, context: Dict[str, Any], **extra: Any) -> None:
+        g.setdefault("metrics_render_starts", []).append(time.perf_counter())
+
+    def after_render(sender: Flask, template: Any, context: Dict[str, Any], **extra: Any) -> None:
+        starts = g.get("metrics_render_starts")
+        if not starts:
+            return
+        start = starts.pop()
+        elapsed = time.perf_counter() - start
+        name = template.name or "string"
+        TEMPLATE_RENDER_SECONDS.observe(elapsed, template=name)
+        _record_span(TEMPLATE_RENDER_SECONDS.name, {"template": name}, start, elapsed)
+
+    before_render_template.connect(before_render, app, weak=False)
+    template_rendered.connect(after_render, app, weak=False)
+
+
+def _register_app_collectors(app: Flask) -> None:
+    from .services.models import model_cache_stats
+    from .settings import settings_cache_stats
+
+    def expansion_cache() -> List[Sample]:
+        cache = app.extensions.get("expansion_cache")
+        if cache is None:
+            return []
+        return [
+            ("subtopics_expansion_cache_lookups_total", {"result": "hit"}, cache.hits),
+            ("subtopics_expansion_cache_lookups_total", {"result": "miss"}, cache.misses),
+        ]
+
+    def render_cache() -> List[Sample]:
+        cache = app.extensions.get("render_cache")
+        if cache is None:
+            return []
+        stats = cache.stats()
+        return [
+            ("subtopics_render_cache_lookups_total", {"result": "hit"}, stats["hits"]),
+            ("subtopics_render_cache_lookups_total", {"result": "miss"}, stats["misses"]),
+        ]
+
+    def settings_cache() -> List[Sample]:
+        stats = settings_cache_stats()
+        return [
+            ("subtopics_settings_cache_lookups_total", {"result": "hit"}, stats["cache_hits"]),
+            ("subtopics_settings_cache_lookups_total", {"result": "disk_read"}, stats["disk_reads"]),
+        ]
+
+    def model_cache() -> List[Sample]:
+        stats = model_cache_stats()
+        return [
+            ("subtopics_model_listing_lookups_total", {"result": "hit"}, stats["cache_hits"]),
+            ("subtopics_model_listing_lookups_total", {"result": "api_call"}, stats["api_calls"]),
+        ]
+
+    def client_retries() -> List[Sample]:
+        client = app.extensions.get("openai_client")
+        return [("subtopics_openai_retries_total", {}, getattr(client, "retries", 0))]
+
+    REGISTRY.register_collector(
+        "subtopics_expansion_cache_lookups_total", "counter", "Expansion cache lookups.", expansion_cache
+    )
+    REGISTRY.register_collector(
+        "subtopics_render_cache_lookups_total", "counter", "Rendered tree cache lookups.", render_cache
+    )
+    REGISTRY.register_collector(
+        "subtopics_settings_cache_lookups_total", "counter", "Settings cache lookups.", settings_cache
+    )
+    REGISTRY.register_collector(
+        "subtopics_model_listing_lookups_total", "counter", "Model listing lookups.", model_cache
+    )
+    REGISTRY.register_collector(
+        "subtopics_openai_retries_total", "counter", "Chat completion retries.", client_retries
+    )
+
+
+def _server_timing(spans: List[Tuple[str, Dict[str, Any], float, float]]) -> str:
+    parts = []
+    for index, (name, labels, _, elapsed) in enumerate(spans):
+        token = re.sub(r"[^A-Za-z0-9_-]", "_", name.removeprefix("subtopics_"))
+        description = ",".join(f"{key}={value}" for key, value in labels.items()).replace('"', "'")
+        parts.append(f'{index}-{token};desc="{description}";dur={elapsed * 1000:.2f}')
+    return ", ".join(parts)
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
@@ -1,7 +1,11 @@
 from __future__ import annotations
 
 import json
-from typing import Any, Dict, List
+import queue
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Tuple
 
 from flask import (
     Blueprint,
@@ -12,15 +16,47 @@ from flask import (
     redirect,
     render_template,
     request,
+    stream_with_context,
     url_for,
 )
 
-from .services.subtopics import GenerationRequest, SubtopicGenerationError, generate_topic_tree
-from .settings import get_settings_store, load_settings, mask_api_key
+from .jobs import FINISHED_STATUSES, TERMINAL_EVENTS, get_job_manager
+from .metrics import REGISTRY
+from .services.budget import create_budget_tracker
+from .services.cache import get_cache
+from .services.client import get_client
+from .services.models import get_model_catalog, model_cache_stats
+from .services.render import get_render_cache
+from .services.subtopics import (
+    DEFAULT_CONCURRENCY,
+    GenerationRequest,
+    SubtopicGenerationError,
+    expand_entry_nodes,
+    expansion_settings,
+    missing_expansions,
+    regenerate_subtree,
+    resume_entry,
+    validate_generation_request,
+)
+from .services.trees import has_refs, summarize_calls, summarize_trees
+from .settings import get_settings_store, load_settings, mask_api_key, settings_cache_stats
 from .storage import get_store
 
 main_bp = Blueprint("main", __name__)
 
+HISTORY_PAGE_SIZE = 25
+
+# Idle job streams send a comment this often; streams for jobs running in
+# another process poll the job store at JOB_STREAM_POLL_SECONDS.
+JOB_STREAM_KEEPALIVE_SECONDS = 15.0
+JOB_STREAM_POLL_SECONDS = 1.0
+
+# Export format -> (mimetype, file extension).
+EXPORT_FORMATS = {
+    "json": ("application/json", "json"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
 
 def _parse_topics(raw_topics: str, default_topics: List[str]) -> List[str]:
     if not raw_topics.strip():
@@ -37,121 +73,411 @@ def _parse_topics(raw_topics: str, default_topics: List[str]) -> List[str]:
 @main_bp.route("/")
 def dashboard() -> str:
     store = get_store()
-    entries = store.load()
-    for entry in entries:
-        if entry.get("summary") is None and entry.get("id"):
-            summary = _summarize_trees(entry.get("trees", []))
-            entry["summary"] = summary
-            store.update_entry(entry["id"], {"summary": summary})
-    history_entries = entries[:5]
-    favorite_entries = [entry for entry in entries if entry.get("is_favorite")][:3]
     settings = load_settings()
     return render_template(
         "home.html",
-        recent_history=history_entries,
-        favorite_entries=favorite_entries,
+        recent_history=store.list_entries(limit=5),
+        favorite_entries=store.list_entries(limit=3, favorites_only=True),
         settings=settings,
     )
 
 
 @main_bp.route("/generate", methods=["POST"])
 def generate() -> Response:
-    form_data = request.form
-    topics_input = form_data.get("topics", "")
+    """Queue a generation job and point the client at its status page.
+
+    Form posts with ``live`` set are sent to the streaming view instead.
+    """
+
     settings = load_settings()
-    try:
-        depth = int(form_data.get("depth") or settings.get("default_depth", 3))
-    except (TypeError, ValueError):
-        depth = settings.get("default_depth", 3)
-    depth = max(1, min(depth, 6))
+    values = request.get_json(silent=True) or request.form
+    generation_request = _build_generation_request(values, settings)
 
     try:
-        temperature = float(
-            form_data.get("temperature") or settings.get("default_temperature", 0.2)
-        )
-    except (TypeError, ValueError):
-        temperature = settings.get("default_temperature", 0.2)
-    temperature = max(0.0, min(temperature, 1.0))
-    available_models = current_app.config.get("AVAILABLE_MODELS", [])
-    model = form_data.get("model") or settings.get("default_model") or "gpt-3.5-turbo"
-    if available_models and model not in available_models:
-        model = available_models[0]
-    use_demo_mode = bool(form_data.get("demo_mode"))
+        validate_generation_request(generation_request)
+    except SubtopicGenerationError as exc:
+        if _wants_json():
+            return jsonify({"error": str(exc)}), 400
+        flash(str(exc), "danger")
+        return redirect(url_for("main.dashboard"))
 
-    topics = _parse_topics(
-        topics_input,
-        settings.get("default_topics")
-        or current_app.config.get("DEFAULT_TOPICS", []),
+    job_id = get_job_manager().submit(
+        generation_request,
+        api_key=_resolve_api_key(settings),
     )
+    if _wants_json():
+        return jsonify(_job_payload(get_job_manager().store.get(job_id))), 202
+    if values.get("live"):
+        return redirect(url_for("main.live_job", job_id=job_id))
+    return redirect(url_for("main.view_job", job_id=job_id))
+
+
+@main_bp.route("/jobs/<job_id>")
+def view_job(job_id: str) -> str:
+    job = get_job_manager().store.get(job_id)
+    if not job:
+        flash("Generation job not found.", "warning")
+        return redirect(url_for("main.dashboard"))
+    return render_template("job.html", job=_job_payload(job))
 
-    generation_request = GenerationRequest(
-        topics=topics,
-        max_level=depth,
-        temperature=temperature,
-        model=model,
-        use_demo_mode=use_demo_mode,
-    )
 
-    try:
-        result = generate_topic_tree(
-            generation_request,
-            api_key=(
-                settings.get("api_key")
-                or current_app.config.get("OPENAI_API_KEY", "")
-            ),
-        )
-    except SubtopicGenerationError as exc:
-        flash(str(exc), "danger")
+@main_bp.route("/jobs/<job_id>/progress")
+def job_progress(job_id: str) -> Response:
+    job = get_job_manager().store.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(_job_payload(job))
+
+
+@main_bp.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id: str) -> Response:
+    manager = get_job_manager()
+    job = manager.store.get(job_id)
+    if not job:
+        if _wants_json():
+            return jsonify({"error": "Job not found"}), 404
+        flash("Generation job not found.", "warning")
         return redirect(url_for("main.dashboard"))
 
-    store = get_store()
-    result["summary"] = _summarize_trees(result.get("trees", []))
-    result["is_favorite"] = False
-    store.add_entry(result)
+    cancelled = manager.cancel(job_id)
+    if _wants_json():
+        return jsonify(_job_payload(manager.store.get(job_id))), 202 if cancelled else 409
+    if cancelled:
+        flash("Cancelling generation…", "info")
+    else:
+        flash("This generation has already finished.", "warning")
+    return redirect(url_for("main.view_job", job_id=job_id))
+
+
+@main_bp.route("/jobs/<job_id>/result")
+def job_result(job_id: str) -> Response:
+    job = get_job_manager().store.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] != "completed":
+        return jsonify(_job_payload(job)), 409
+    entry = get_store().get_entry(job["entry_id"])
+    if not entry:
+        return jsonify({"error": "Entry not found"}), 404
+    return jsonify(entry)
+
+
+@main_bp.route("/jobs/<job_id>/live")
+def live_job(job_id: str) -> str:
+    """Show a job's topic map growing node by node, fed by ``job_stream``."""
 
-    flash("Subtopics generated successfully!", "success")
-    return redirect(url_for("main.view_history_entry", entry_id=result["id"]))
+    job = get_job_manager().store.get(job_id)
+    if not job:
+        flash("Generation job not found.", "warning")
+        return redirect(url_for("main.dashboard"))
+    return render_template(
+        "live.html",
+        job=_job_payload(job),
+        use_demo_mode=job["request"].get("use_demo_mode") or not _resolve_api_key(load_settings()),
+    )
+
+
+@main_bp.route("/jobs/<job_id>/stream")
+def job_stream(job_id: str) -> Response:
+    """Stream a job's progress as Server-Sent Events.
+
+    A ``start`` event lists the root topics, one ``node`` (or ``failed``)
+    event follows each finished expansion, and the stream ends with ``done``
+    once the entry has been saved to history or with ``failure`` if the job
+    failed or was cancelled. Node events replay from the start of the job
+    when it was submitted to this process; otherwise the job is followed
+    through ``progress`` events polled from the job store.
+    """
+
+    manager = get_job_manager()
+    job = manager.store.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    events = manager.subscribe(job_id)
+
+    def stream() -> Iterator[str]:
+        try:
+            yield _sse_event(
+                "start",
+                {"topics": job["request"].get("topics", []), "max_level": job["request"].get("max_level")},
+            )
+            if events is None:
+                yield from _poll_job_events(job_id)
+                return
+            while True:
+                try:
+                    event, payload = events.get(timeout=JOB_STREAM_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    # Lets the server notice a client that has gone away.
+                    yield ": keep-alive\n\n"
+                    continue
+                if event == "done":
+                    payload = dict(payload, url=url_for("main.view_history_entry", entry_id=payload["id"]))
+                yield _sse_event(event, payload)
+                if event in TERMINAL_EVENTS:
+                    break
+        finally:
+            if events is not None:
+                manager.unsubscribe(job_id, events)
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@main_bp.route("/metrics")
+def metrics() -> Response:
+    """Expose this worker's counters and histograms in the Prometheus text format."""
+
+    if not current_app.config.get("METRICS_ENABLED", True):
+        return Response("Metrics are disabled.\n", status=404, mimetype="text/plain")
+    return Response(REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @main_bp.route("/history")
 def history() -> str:
     store = get_store()
     query = request.args.get("q", "").strip()
-    entries = store.load()
-    for entry in entries:
-        if entry.get("summary") is None and entry.get("id"):
-            summary = _summarize_trees(entry.get("trees", []))
-            entry["summary"] = summary
-            store.update_entry(entry["id"], {"summary": summary})
-    favorites = [entry for entry in entries if entry.get("is_favorite")]
+    page = max(1, request.args.get("page", 1, type=int))
+    offset = (page - 1) * HISTORY_PAGE_SIZE
+    total_count = store.count_entries()
+    matched_paths: Dict[str, List[List[str]]] = {}
     if query:
-        filtered_entries = [
-            entry for entry in entries if _entry_matches_query(entry, query)
-        ]
+        results = store.search(query)
+        matched_paths = {entry["id"]: paths for entry, paths in results}
+        filtered_count = len(results)
+        entries = [entry for entry, _ in results[offset : offset + HISTORY_PAGE_SIZE]]
     else:
-        filtered_entries = entries
+        filtered_count = total_count
+        entries = store.list_entries(limit=HISTORY_PAGE_SIZE, offset=offset)
     return render_template(
         "history.html",
-        entries=filtered_entries,
-        favorites=favorites,
+        entries=entries,
+        favorites=store.list_entries(favorites_only=True),
+        matched_paths=matched_paths,
         query=query,
-        total_count=len(entries),
-        filtered_count=len(filtered_entries),
+        page=page,
+        page_count=max(1, -(-filtered_count // HISTORY_PAGE_SIZE)),
+        total_count=total_count,
+        filtered_count=filtered_count,
     )
 
 
 @main_bp.route("/history/<entry_id>")
 def view_history_entry(entry_id: str) -> str:
     store = get_store()
-    entry = store.get_entry(entry_id)
-    if not entry:
+    loaded = store.get_flat_entry(entry_id)
+    if not loaded:
         flash("History entry not found.", "warning")
         return redirect(url_for("main.history"))
+    entry, tree = loaded
     summary = entry.get("summary")
     if summary is None:
-        summary = _summarize_trees(entry.get("trees", []))
+        summary = tree.summary()
         store.update_entry(entry_id, {"summary": summary})
-    return render_template("detail.html", entry=entry, summary=summary)
+    return render_template(
+        "detail.html",
+        entry=entry,
+        available_models=get_model_catalog().models(_resolve_api_key(load_settings())),
+        missing_count=len(missing_expansions(entry, tree)),
+        tree_html=get_render_cache().render(entry, tree=tree),
+        summary=summary,
+        usage=summarize_calls(entry.get("call_log", [])),
+    )
+
+
+@main_bp.route("/history/<entry_id>/subtree")
+def history_subtree(entry_id: str) -> Response:
+    """Return the rendered children of a collapsed node as an HTML fragment.
+
+    Only the requested branch is read. A branch holding shared (``ref``)
+    nodes, which may point outside it, is rendered from the whole tree.
+    """
+
+    path = _parse_node_path(request.args.get("path"))
+    if path is None:
+        return jsonify({"error": "A node path such as '0.2' is required."}), 400
+    store = get_store()
+    loaded = store.get_subtree(entry_id, path)
+    if not loaded:
+        return jsonify({"error": "Entry not found"}), 404
+    entry, node = loaded
+    if node is not None and has_refs([node]):
+        loaded_tree = store.get_flat_entry(entry_id)
+        if not loaded_tree:
+            return jsonify({"error": "Entry not found"}), 404
+        entry, tree = loaded_tree
+        return Response(get_render_cache().render(entry, path, tree), mimetype="text/html")
+    return Response(get_render_cache().render_subtree(entry, path, node), mimetype="text/html")
+
+
+@main_bp.route("/history/<entry_id>/expand", methods=["POST"])
+def expand_history_node(entry_id: str) -> Response:
+    """Expand one node of a saved entry by a single level and persist it."""
+
+    store = get_store()
+    entry = store.get_entry(entry_id)
+    if not entry:
+        return jsonify({"error": "Entry not found"}), 404
+
+    values = request.get_json(silent=True) or request.form
+    path = _parse_node_path(values.get("path"))
+    if path is None:
+        return jsonify({"error": "A node path such as '0.2' is required."}), 400
+
+    settings = load_settings()
+    budget = create_budget_tracker()
+    try:
+        (node,) = expand_entry_nodes(
+            entry,
+            [path],
+            api_key=_resolve_api_key(settings),
+            levels=1,
+            cache=get_cache(),
+            client=get_client(),
+            concurrency=current_app.config.get("GENERATION_CONCURRENCY", DEFAULT_CONCURRENCY),
+            batch_size=current_app.config.get("GENERATION_BATCH_SIZE", 1),
+            budget=budget,
+        )
+    except SubtopicGenerationError as exc:
+        return jsonify({"error": str(exc)}), 400
+    if not node["children"]:
+        # Nothing is saved, so the node can simply be expanded again.
+        if budget.exhausted:
+            return jsonify({"error": budget.exhausted}), 429
+        message = node.get("error") or f"No subtopics were generated for '{node['topic']}'."
+        return jsonify({"error": message}), 502
+
+    summary = summarize_trees(entry["trees"])
+    store.update_entry(
+        entry_id,
+        {"trees": entry["trees"], "call_log": entry["call_log"], "summary": summary},
+    )
+    return jsonify(
+        {
+            "path": list(path),
+            "topic": node["topic"],
+            "children": [child["topic"] for child in node["children"]],
+            "expandable": len(path) + 1 <= entry.get("max_level", 0),
+            "summary": summary,
+        }
+    )
+
+
+@main_bp.route("/history/<entry_id>/resume", methods=["POST"])
+def resume_history_entry(entry_id: str) -> Response:
+    """Re-issue the expansions a saved entry is missing and persist the result."""
+
+    store = get_store()
+    entry = store.get_entry(entry_id)
+    if not entry:
+        flash("History entry not found.", "warning")
+        return redirect(url_for("main.history"))
+
+    settings = load_settings()
+    try:
+        resumed = resume_entry(
+            entry,
+            api_key=_resolve_api_key(settings),
+            cache=get_cache(),
+            client=get_client(),
+            concurrency=current_app.config.get("GENERATION_CONCURRENCY", DEFAULT_CONCURRENCY),
+            batch_size=current_app.config.get("GENERATION_BATCH_SIZE", 1),
+            budget=create_budget_tracker(),
+        )
+    except SubtopicGenerationError as exc:
+        flash(str(exc), "danger")
+        return redirect(url_for("main.view_history_entry", entry_id=entry_id))
+
+    store.update_entry(
+        entry_id,
+        {
+            "trees": entry["trees"],
+            "call_log": entry["call_log"],
+            "summary": summarize_trees(entry["trees"]),
+            "budget_exhausted": entry.get("budget_exhausted"),
+            "interrupted": False,
+        },
+    )
+    remaining = len(missing_expansions(entry))
+    if remaining:
+        flash(f"Resumed {resumed} nodes; {remaining} expansions are still missing.", "warning")
+    else:
+        flash(f"Resumed {resumed} nodes; the map is complete.", "success")
+    return redirect(url_for("main.view_history_entry", entry_id=entry_id))
+
+
+@main_bp.route("/history/<entry_id>/regenerate", methods=["POST"])
+def regenerate_history_subtree(entry_id: str) -> Response:
+    """Save a new version of an entry with one node's subtree generated again."""
+
+    store = get_store()
+    entry = store.get_entry(entry_id)
+    if not entry:
+        if _wants_json():
+            return jsonify({"error": "Entry not found"}), 404
+        flash("History entry not found.", "warning")
+        return redirect(url_for("main.history"))
+
+    def fail(message: str, status: int = 400) -> Response:
+        if _wants_json():
+            return jsonify({"error": message}), status
+        flash(message, "danger")
+        return redirect(url_for("main.view_history_entry", entry_id=entry_id))
+
+    values = request.get_json(silent=True) or request.form
+    path = _parse_node_path(values.get("path"))
+    if path is None:
+        return fail("A node path such as '0.2' is required.")
+    settings = load_settings()
+    api_key = _resolve_api_key(settings)
+    default_model, default_temperature = expansion_settings(entry, path)
+    model = values.get("model") or default_model
+    available_models = get_model_catalog().models(api_key)
+    if available_models and model not in available_models:
+        return fail(f"Unknown model '{model}'.")
+    raw_temperature = values.get("temperature")
+    if raw_temperature is None or raw_temperature == "":
+        raw_temperature = default_temperature
+    try:
+        temperature = max(0.0, min(float(raw_temperature), 1.0))
+    except (TypeError, ValueError):
+        return fail("Temperature must be a number between 0 and 1.")
+
+    budget = create_budget_tracker()
+    try:
+        version = regenerate_subtree(
+            entry,
+            path,
+            api_key=api_key,
+            model=model,
+            temperature=temperature,
+            client=get_client(),
+            concurrency=current_app.config.get("GENERATION_CONCURRENCY", DEFAULT_CONCURRENCY),
+            batch_size=current_app.config.get("GENERATION_BATCH_SIZE", 1),
+            budget=budget,
+            cache=get_cache(),
+        )
+    except SubtopicGenerationError as exc:
+        return fail(str(exc), 429 if budget.exhausted else 400)
+
+    store.add_entry(version)
+    url = url_for("main.view_history_entry", entry_id=version["id"])
+    if _wants_json():
+        return jsonify(
+            {
+                "id": version["id"],
+                "parent_id": entry_id,
+                "version": version["version"],
+                "path": list(path),
+                "summary": version["summary"],
+                "url": url,
+            }
+        )
+    flash(f"Saved version {version['version']} with a regenerated branch.", "success")
+    return redirect(url)
 
 
 @main_bp.route("/history/<entry_id>/json")
@@ -169,12 +495,39 @@ def download_history_entry(entry_id: str) -> Response:
 
 @main_bp.route("/history/export")
 def export_history() -> Response:
-    store = get_store()
-    entries = store.load()
+    """Stream history as a JSON array (default) or NDJSON, optionally gzipped.
+
+    ``since``/``until`` accept ISO dates or timestamps (a bare ``until`` date
+    covers that whole day) and ``favorites=1`` limits the export to pinned
+    entries. Entries are serialized one at a time, so memory use does not
+    grow with the size of the history.
+    """
+
+    export_format = request.args.get("format", "json")
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": "format must be 'json' or 'ndjson'"}), 400
+    try:
+        since = _parse_export_date(request.args.get("since"))
+        until = _parse_export_date(request.args.get("until"), end_of_day=True)
+    except ValueError:
+        return jsonify({"error": "since/until must be ISO dates, e.g. 2024-01-31"}), 400
+
+    entries = get_store().iter_entries(
+        since=since,
+        until=until,
+        favorites_only=request.args.get("favorites") == "1",
+    )
+    chunks = _export_chunks(entries, export_format)
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f"topic-history.{extension}"
+    if request.args.get("gzip") == "1":
+        chunks = _gzip_chunks(chunks)
+        mimetype = "application/gzip"
+        filename += ".gz"
     return Response(
-        response=json.dumps(entries, indent=2),
-        mimetype="application/json",
-        headers={"Content-Disposition": "attachment; filename=topic-history.json"},
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
 
 
@@ -234,51 +587,169 @@ def settings() -> str:
         flash("Settings updated successfully.", "success")
         return redirect(url_for("main.settings"))
 
+    cache = get_cache()
     return render_template(
         "settings.html",
         settings=settings_data,
-        available_models=current_app.config.get("AVAILABLE_MODELS", []),
+        available_models=get_model_catalog().models(_resolve_api_key(settings_data)),
         masked_api_key=mask_api_key(settings_data.get("api_key", "")),
+        cache_stats=cache.stats() if cache else None,
+        settings_cache_stats=settings_cache_stats(),
+        model_cache_stats=model_cache_stats(),
     )
 
 
-def _entry_matches_query(entry: Dict[str, Any], query: str) -> bool:
-    lowered = query.casefold()
-    for topic in entry.get("topics", []):
-        if lowered in topic.casefold():
-            return True
-    for tree in entry.get("trees", []):
-        if _node_contains(tree, lowered):
-            return True
-    return False
+def _build_generation_request(
+    values: Mapping[str, Any],
+    settings: Dict[str, Any],
+) -> GenerationRequest:
+    try:
+        depth = int(values.get("depth") or settings.get("default_depth", 3))
+    except (TypeError, ValueError):
+        depth = settings.get("default_depth", 3)
+    depth = max(1, min(depth, 6))
 
+    try:
+        temperature = float(
+            values.get("temperature") or settings.get("default_temperature", 0.2)
+        )
+    except (TypeError, ValueError):
+        temperature = settings.get("default_temperature", 0.2)
+    temperature = max(0.0, min(temperature, 1.0))
+    available_models = get_model_catalog().models(_resolve_api_key(settings))
+    model = values.get("model") or settings.get("default_model") or "gpt-3.5-turbo"
+    if available_models and model not in available_models:
+        model = available_models[0]
 
-def _node_contains(node: Dict[str, Any], query: str) -> bool:
-    if query in str(node.get("topic", "")).casefold():
-        return True
-    for child in node.get("children", []) or []:
-        if _node_contains(child, query):
-            return True
-    return False
+    topics = _parse_topics(
+        values.get("topics", ""),
+        settings.get("default_topics")
+        or current_app.config.get("DEFAULT_TOPICS", []),
+    )
 
+    return GenerationRequest(
+        topics=topics,
+        max_level=depth,
+        temperature=temperature,
+        model=model,
+        use_demo_mode=bool(values.get("demo_mode")),
+        concurrency=current_app.config.get("GENERATION_CONCURRENCY", DEFAULT_CONCURRENCY),
+        lazy=bool(values.get("lazy")),
+        dedupe=bool(values.get("dedupe")),
+        batch_size=current_app.config.get("GENERATION_BATCH_SIZE", 1),
+    )
 
-def _summarize_trees(trees: List[Dict[str, Any]]) -> Dict[str, int]:
-    summary = {
-        "total_nodes": 0,
-        "leaf_nodes": 0,
-        "max_depth": 0,
-    }
 
-    def visit(node: Dict[str, Any], depth: int) -> None:
-        summary["total_nodes"] += 1
-        summary["max_depth"] = max(summary["max_depth"], depth)
-        children = node.get("children", []) or []
-        if not children:
-            summary["leaf_nodes"] += 1
-        for child in children:
-            visit(child, depth + 1)
+def _parse_node_path(raw: Any) -> Tuple[int, ...] | None:
+    if isinstance(raw, list):
+        segments = raw
+    elif isinstance(raw, str) and raw.strip():
+        segments = raw.strip().split(".")
+    else:
+        return None
+    try:
+        path = tuple(int(segment) for segment in segments)
+    except (TypeError, ValueError):
+        return None
+    return path if path and all(index >= 0 for index in path) else None
 
-    for tree in trees or []:
-        visit(tree, 1)
 
-    return summary
+def _wants_json() -> bool:
+    if request.is_json:
+        return True
+    best = request.accept_mimetypes.best_match(["application/json", "text/html"])
+    return best == "application/json" and not request.accept_mimetypes.accept_html
+
+
+def _job_payload(job: Dict[str, Any]) -> Dict[str, Any]:
+    payload = {
+        "id": job["id"],
+        "status": job["status"],
+        "finished": job["status"] in FINISHED_STATUSES,
+        "topics": job["request"].get("topics", []),
+        "max_level": job["request"].get("max_level"),
+        "model": job["request"].get("model"),
+        "expanded_nodes": job["expanded_nodes"],
+        "total_nodes": job["total_nodes"],
+        "error": job["error"],
+        "entry_id": job["entry_id"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "progress_url": url_for("main.job_progress", job_id=job["id"]),
+        "cancel_url": url_for("main.cancel_job", job_id=job["id"]),
+        "result_url": url_for("main.job_result", job_id=job["id"]),
+        "stream_url": url_for("main.job_stream", job_id=job["id"]),
+        "live_url": url_for("main.live_job", job_id=job["id"]),
+    }
+    if job["entry_id"]:
+        payload["entry_url"] = url_for("main.view_history_entry", entry_id=job["entry_id"])
+    return payload
+
+
+def _resolve_api_key(settings: Dict[str, Any]) -> str:
+    return settings.get("api_key") or current_app.config.get("OPENAI_API_KEY", "")
+
+
+def _sse_event(event: str, payload: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def _poll_job_events(job_id: str) -> Iterator[str]:
+    """Follow a job owned by another worker process through the job store."""
+
+    store = get_job_manager().store
+    while True:
+        job = store.get(job_id)
+        if job is None:
+            yield _sse_event("failure", {"message": "Generation job not found."})
+            return
+        if job["status"] == "completed":
+            yield _sse_event(
+                "done",
+                {
+                    "id": job["entry_id"],
+                    "url": url_for("main.view_history_entry", entry_id=job["entry_id"]),
+                },
+            )
+            return
+        if job["status"] in FINISHED_STATUSES:
+            message = job["error"] or "Generation was cancelled."
+            yield _sse_event("failure", {"message": message})
+            return
+        yield _sse_event(
+            "progress",
+            {"expanded_nodes": job["expanded_nodes"], "total_nodes": job["total_nodes"]},
+        )
+        time.sleep(JOB_STREAM_POLL_SECONDS)
+
+
+def _parse_export_date(raw: str | None, end_of_day: bool = False) -> str | None:
+    if not raw or not raw.strip():
+        return None
+    value = raw.strip()
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return parsed.isoformat()
+
+
+def _export_chunks(entries: Iterable[Dict[str, Any]], export_format: str) -> Iterator[str]:
+    if export_format == "ndjson":
+        for entry in entries:
+            yield json.dumps(entry) + "\n"
+        return
+    yield "["
+    separator = "\n"
+    for entry in entries:
+        yield separator + json.dumps(entry, indent=2)
+        separator = ",\n"
+    yield "\n]\n"
+
+
+def _gzip_chunks(chunks: Iterable[str]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,441 @@
+"""Asyncio variant of the subtopic generation pipeline.
+
+``agenerate_topic_tree`` mirrors ``generate_topic_tree`` but runs every
+level's requests as tasks on one event loop instead of a thread pool. All
+completions for a generation share one pooled aiohttp session with
+keep-alive connections, and every request carries its own API key, so
+concurrent generations with different keys never touch global state.
+Cancelling the awaiting task (for example when a client disconnects)
+cancels every in-flight request of the generation before the cancellation
+propagates. ``run_topic_tree`` drives it from a synchronous worker thread
+(background jobs with ``GENERATION_ENGINE = "asyncio"``) and turns a set
+cancel event into that cancellation.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Awaitable, Dict, List, Tuple
+
+import aiohttp
+import openai
+
+from .client import ChatClient, get_client
+from .flat_tree import FlatTree
+from .subtopics import (
+    BATCH_PROMPT_TEMPLATE,
+    BATCH_SYSTEM_PROMPT,
+    PROMPT_TEMPLATE,
+    SYSTEM_PROMPT,
+    BudgetRefused,
+    ExpansionCallback,
+    FailureCallback,
+    FrontierItem,
+    GenerationCancelled,
+    GenerationRequest,
+    MarkCallback,
+    SubtopicGenerationError,
+    charge_records,
+    chat_messages,
+    chunk_siblings,
+    count_expansions,
+    demo_subtopics,
+    expansion_key,
+    fill_refused,
+    mark_failed,
+    new_entry,
+    park_spent,
+    parse_batch,
+    parse_response,
+    parse_subtopics,
+    raise_if_nothing_expanded,
+    share_duplicates,
+    unlogged_records,
+    validate_generation_request,
+)
+
+if TYPE_CHECKING:  # pragma: no cover - imported for type hints only
+    from .budget import BudgetTracker
+    from .cache import ExpansionCache
+
+_Outcome = Tuple[List[str], Dict[str, Any]]
+
+# How often ``run_topic_tree`` checks its cancel event.
+CANCEL_POLL_SECONDS = 0.2
+
+
+def run_topic_tree(
+    request: GenerationRequest,
+    api_key: str,
+    cancel_event: threading.Event | None = None,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """Run ``agenerate_topic_tree`` on a fresh event loop and return its entry.
+
+    Meant for worker threads. Setting ``cancel_event`` cancels the
+    generation task, which cancels every in-flight request, and raises
+    ``GenerationCancelled`` like the threaded engine does.
+    """
+
+    return asyncio.run(_generate_until_cancelled(request, api_key, cancel_event, kwargs))
+
+
+async def _generate_until_cancelled(
+    request: GenerationRequest,
+    api_key: str,
+    cancel_event: threading.Event | None,
+    kwargs: Dict[str, Any],
+) -> Dict[str, Any]:
+    task = asyncio.ensure_future(agenerate_topic_tree(request, api_key, **kwargs))
+    while cancel_event is not None and not task.done():
+        await asyncio.wait({task}, timeout=CANCEL_POLL_SECONDS)
+        if cancel_event.is_set() and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise GenerationCancelled("Generation was cancelled.")
+    return await task
+
+
+async def agenerate_topic_tree(
+    request: GenerationRequest,
+    api_key: str,
+    cache: ExpansionCache | None = None,
+    client: ChatClient | None = None,
+    on_expand: ExpansionCallback | None = None,
+    session: aiohttp.ClientSession | None = None,
+    budget: BudgetTracker | None = None,
+    on_failure: FailureCallback | None = None,
+    on_mark: MarkCallback | None = None,
+) -> Dict[str, Any]:
+    """Generate a subtopic entry like ``generate_topic_tree``, on the event loop.
+
+    ``session`` lets long-lived callers reuse their own connection pool;
+    otherwise one sized to ``request.concurrency`` is opened for the call.
+    ``on_expand``, ``on_failure`` and ``on_mark`` run in worker threads, as they do with
+    the threaded engine, so callbacks that write to SQLite never stall the
+    event loop.
+    """
+
+    validate_generation_request(request)
+
+    use_demo_mode = request.use_demo_mode or not api_key
+    tree = FlatTree()
+    roots = [tree.add(topic) for topic in request.topics]
+    context = _Context(
+        tree=tree,
+        api_key=api_key,
+        temperature=request.temperature,
+        model=request.model,
+        use_demo_mode=use_demo_mode,
+        cache=cache,
+        client=client or get_client(),
+        on_expand=on_expand,
+        semaphore=asyncio.Semaphore(max(1, request.concurrency)),
+        budget=budget,
+        on_failure=on_failure,
+        on_mark=on_mark,
+    )
+    frontier = [(root, (), (index,)) for index, root in enumerate(roots)]
+    max_level = 1 if request.lazy else request.max_level
+
+    shared = {} if request.dedupe else None
+
+    if use_demo_mode:
+        await _expand_levels(frontier, max_level, 1, context, shared)
+    else:
+        work = _expand_levels(frontier, max_level, request.batch_size, context, shared)
+        if session is not None:
+            await _with_session(session, work)
+        else:
+            connector = aiohttp.TCPConnector(limit=max(1, request.concurrency))
+            async with aiohttp.ClientSession(connector=connector) as owned:
+                await _with_session(owned, work)
+
+    trees = tree.to_dicts()
+    raise_if_nothing_expanded(trees)
+    return new_entry(request, trees, use_demo_mode, budget)
+
+
+@dataclass
+class _Context:
+    """Per-generation settings shared by every fetch task."""
+
+    tree: FlatTree
+    api_key: str
+    temperature: float
+    model: str
+    use_demo_mode: bool
+    cache: ExpansionCache | None
+    client: ChatClient
+    on_expand: ExpansionCallback | None
+    semaphore: asyncio.Semaphore
+    budget: BudgetTracker | None = None
+    on_failure: FailureCallback | None = None
+    on_mark: MarkCallback | None = None
+
+
+async def _with_session(session: aiohttp.ClientSession, work: Awaitable[None]) -> None:
+    # ``openai.aiosession`` is a ContextVar: tasks created below inherit it,
+    # and callers outside this generation are unaffected.
+    token = openai.aiosession.set(session)
+    try:
+        await work
+    finally:
+        openai.aiosession.reset(token)
+
+
+async def _expand_levels(
+    frontier: List[FrontierItem],
+    max_level: int,
+    batch_size: int,
+    context: _Context,
+    shared: Dict[Tuple[str, int], Tuple[int, ...]] | None = None,
+) -> None:
+    level = 1
+    while frontier and level <= max_level:
+        if context.budget is not None and context.budget.exhausted:
+            break
+        if shared is not None:
+            refs: List[Tuple[Tuple[int, ...], str, Any]] = []
+            frontier = share_duplicates(
+                context.tree, frontier, level, shared, lambda *mark: refs.append(mark)
+            )
+            await _notify_marks(context, refs)
+        chunks = chunk_siblings(frontier, batch_size)
+        results = await _gather_or_cancel([_fetch_chunk(chunk, context) for chunk in chunks])
+        next_frontier: List[FrontierItem] = []
+        tree = context.tree
+        for chunk, outcomes in zip(chunks, results):
+            for (node, ancestry, path), (subtopics, metadata) in zip(chunk, outcomes):
+                if metadata:
+                    tree.set(node, "_call", metadata)
+                child_ancestry = ancestry + (tree.topic(node),)
+                for index, subtopic in enumerate(subtopics):
+                    next_frontier.append((tree.add(subtopic, node), child_ancestry, path + (index,)))
+        frontier = next_frontier
+        level += 1
+
+
+async def _gather_or_cancel(coroutines: List[Awaitable[Any]]) -> List[Any]:
+    """Await ``coroutines`` concurrently; if any fails or we are cancelled, cancel the rest."""
+
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def _fetch_chunk(items: List[FrontierItem], context: _Context) -> List[_Outcome]:
+    topics = [context.tree.topic(node) for node, _, _ in items]
+    ancestry = items[0][1]
+    spent: List[Dict[str, Any]] = []
+    try:
+        if len(items) == 1:
+            outcomes = [await _fetch_subtopics(topics[0], ancestry, context)]
+        else:
+            outcomes, spent = await _fetch_subtopics_batch(topics, ancestry, context)
+    except BudgetRefused:
+        return [([], None) for _ in items]
+    except SubtopicGenerationError as exc:
+        failed = mark_failed(context.tree, items, str(exc), None, exc.records)
+        if exc.records:
+            await _notify_marks(context, [(items[0][2], "_spent", list(exc.records))])
+        if context.on_failure is not None:
+            on_failure = context.on_failure
+            await asyncio.to_thread(
+                lambda: [on_failure(path, topic, str(exc)) for (_, _, path), topic in zip(items, topics)]
+            )
+        return failed
+    count_expansions(outcomes)
+    if spent:
+        park_spent(context.tree, items, spent)
+        await _notify_marks(context, [(items[0][2], "_spent", list(spent))])
+    if context.on_expand is not None:
+        on_expand = context.on_expand
+        await asyncio.to_thread(
+            lambda: [
+                on_expand(path, topic, list(subtopics), metadata)
+                for (_, _, path), topic, (subtopics, metadata) in zip(items, topics, outcomes)
+                if metadata is not None
+            ]
+        )
+    return outcomes
+
+
+async def _notify_marks(context: _Context, marks: List[Tuple[Tuple[int, ...], str, Any]]) -> None:
+    if context.on_mark is not None and marks:
+        on_mark = context.on_mark
+        await asyncio.to_thread(lambda: [on_mark(*mark) for mark in marks])
+
+
+async def _charge(records: List[Dict[str, Any]], context: _Context) -> None:
+    # Budgets may write the daily usage table, which is SQLite as well.
+    if context.budget is None or not records:
+        charge_records(records, context.model, None)
+    else:
+        await asyncio.to_thread(charge_records, records, context.model, context.budget)
+
+
+async def _fetch_subtopics(topic: str, ancestry: Tuple[str, ...], context: _Context) -> _Outcome:
+    parent_path = " > ".join(ancestry) if ancestry else "ROOT"
+
+    if context.use_demo_mode:
+        return demo_subtopics(topic), {
+            "mode": "demo",
+            "topic": topic,
+            "parent_path": parent_path,
+        }
+
+    cache_key = expansion_key(context.model, context.temperature, topic, ancestry)
+    [cached] = await _cache_lookup(context, [cache_key])
+    if cached:
+        return cached, {"mode": "cache", "topic": topic, "parent_path": parent_path}
+
+    payload, response_metadata = await _request_json(
+        context,
+        SYSTEM_PROMPT,
+        PROMPT_TEMPLATE.format(topic=topic, parent_path=parent_path),
+    )
+    response_metadata.update({"topic": topic, "parent_path": parent_path})
+    cleaned = parse_subtopics(payload, response_metadata)
+    await _cache_store(context, [(cache_key, cleaned)])
+    return cleaned, response_metadata
+
+
+async def _fetch_subtopics_batch(
+    topics: List[str],
+    ancestry: Tuple[str, ...],
+    context: _Context,
+) -> Tuple[List[_Outcome], List[Dict[str, Any]]]:
+    """Async twin of ``subtopics._fetch_subtopics_batch`` with the same fallbacks."""
+
+    parent_path = " > ".join(ancestry) if ancestry else "ROOT"
+    outcomes: Dict[int, _Outcome] = {}
+    spent: List[Dict[str, Any]] = []
+    pending: List[int] = []
+    keys = [expansion_key(context.model, context.temperature, topic, ancestry) for topic in topics]
+    for index, (topic, cached) in enumerate(zip(topics, await _cache_lookup(context, keys))):
+        if cached:
+            outcomes[index] = (cached, {"mode": "cache", "topic": topic, "parent_path": parent_path})
+        else:
+            pending.append(index)
+
+    if len(pending) > 1:
+        batch_topics = [topics[index] for index in pending]
+        try:
+            payload, response_metadata = await _request_json(
+                context,
+                BATCH_SYSTEM_PROMPT,
+                BATCH_PROMPT_TEMPLATE.format(
+                    topics=json.dumps(batch_topics, ensure_ascii=False),
+                    parent_path=parent_path,
+                ),
+            )
+        except BudgetRefused:
+            return fill_refused(outcomes, len(topics)), spent
+        except SubtopicGenerationError as exc:
+            payload, response_metadata = {}, {}
+            spent.extend(exc.records)
+        else:
+            if not isinstance(payload.get("subtopics"), dict):
+                response_metadata["error"] = "Response JSON does not include a 'subtopics' object."
+        answers = parse_batch(payload, response_metadata, batch_topics, parent_path)
+        answered: List[Tuple[str, List[str]]] = []
+        for index in pending:
+            cleaned = answers.get(topics[index])
+            if not cleaned:
+                continue
+            outcomes[index] = (cleaned, response_metadata)
+            answered.append((keys[index], cleaned))
+        await _cache_store(context, answered)
+        if response_metadata.get("mode") == "live" and not answers:
+            spent.append(response_metadata)
+
+    missing = [index for index in range(len(topics)) if index not in outcomes]
+    fallbacks = await _gather_or_cancel(
+        [_fallback(topics[index], ancestry, context) for index in missing]
+    )
+    errors = [fallback for fallback in fallbacks if isinstance(fallback, SubtopicGenerationError)]
+    outcomes.update(
+        (index, fallback)
+        for index, fallback in zip(missing, fallbacks)
+        if not isinstance(fallback, SubtopicGenerationError)
+    )
+    if errors:
+        records = unlogged_records(outcomes.values(), spent)
+        raise SubtopicGenerationError(
+            str(errors[0]), records=[*records, *(record for error in errors for record in error.records)]
+        ) from errors[0]
+    return [outcomes[index] for index in range(len(topics))], spent
+
+
+async def _fallback(
+    topic: str, ancestry: Tuple[str, ...], context: _Context
+) -> _Outcome | SubtopicGenerationError:
+    # Failures are returned so the sibling requests still finish and get
+    # logged; a topic the budget refuses is left without an outcome record.
+    try:
+        return await _fetch_subtopics(topic, ancestry, context)
+    except BudgetRefused:
+        return [], None
+    except SubtopicGenerationError as exc:
+        return exc
+
+
+async def _cache_lookup(context: _Context, keys: List[str]) -> List[List[str] | None]:
+    # The cache is SQLite-backed, so its reads and writes run in a worker
+    # thread instead of blocking every other request on the event loop.
+    cache = context.cache
+    if cache is None:
+        return [None for _ in keys]
+    return await asyncio.to_thread(lambda: [cache.get(key) for key in keys])
+
+
+async def _cache_store(context: _Context, items: List[Tuple[str, List[str]]]) -> None:
+    if context.cache is not None and items:
+        await asyncio.to_thread(context.cache.put_many, items)
+
+
+async def _request_json(
+    context: _Context,
+    system_prompt: str,
+    user_prompt: str,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    # Reserved once the request can actually be sent, and charged before the
+    # reservation is released, as in ``subtopics._request_json``.
+    budget = context.budget
+    async with context.semaphore:
+        if budget is not None and not budget.reserve():
+            raise BudgetRefused(budget.exhausted or "Budget reached.")
+        try:
+            try:
+                start_time = time.monotonic()
+                response = await context.client.acreate_chat_completion(
+                    api_key=context.api_key,
+                    model=context.model,
+                    messages=chat_messages(system_prompt, user_prompt),
+                    temperature=context.temperature,
+                )
+                elapsed = time.monotonic() - start_time
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # pragma: no cover - network errors not unit tested
+                raise SubtopicGenerationError(str(exc)) from exc
+            try:
+                payload, response_metadata = parse_response(response, elapsed)
+            except SubtopicGenerationError as exc:
+                await _charge(exc.records, context)
+                raise
+            await _charge([response_metadata], context)
+            return payload, response_metadata
+        finally:
+            if budget is not None:
+                budget.release()
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from flask import current_app
+
+# Usage totals kept for each limit, matching the keys of ``Budget``.
+_METRICS = ("calls", "tokens", "seconds")
+
+
+@dataclass
+class Budget:
+    """Ceilings on live completions; ``None`` means unlimited."""
+
+    max_calls: Optional[int] = None
+    max_tokens: Optional[int] = None
+    max_seconds: Optional[float] = None
+
+    def limit(self, metric: str) -> Optional[float]:
+        return getattr(self, f"max_{metric}")
+
+    @property
+    def is_unlimited(self) -> bool:
+        return all(self.limit(metric) is None for metric in _METRICS)
+
+
+class DailyUsageStore:
+    """SQLite table of live completion usage per UTC day, shared by all workers."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            str(self.path),
+            timeout=30,
+            check_same_thread=False,
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS daily_usage (
+                day TEXT PRIMARY KEY,
+                calls INTEGER NOT NULL DEFAULT 0,
+                tokens INTEGER NOT NULL DEFAULT 0,
+                seconds REAL NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._connection.commit()
+
+    def get(self, day: str | None = None) -> Dict[str, float]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT calls, tokens, seconds FROM daily_usage WHERE day = ?",
+                (day or _today(),),
+            ).fetchone()
+        return dict(zip(_METRICS, row or (0, 0, 0.0)))
+
+    def add(self, calls: int, tokens: int, seconds: float, day: str | None = None) -> Dict[str, float]:
+        """Add usage to ``day`` (today by default) and return the new totals."""
+
+        with self._lock:
+            row = self._connection.execute(
+                "INSERT INTO daily_usage (day, calls, tokens, seconds) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(day) DO UPDATE SET calls = calls + excluded.calls, "
+                "tokens = tokens + excluded.tokens, seconds = seconds + excluded.seconds "
+                "RETURNING calls, tokens, seconds",
+                (day or _today(), calls, tokens, seconds),
+            ).fetchone()
+            self._connection.commit()
+        return dict(zip(_METRICS, row))
+
+
+class BudgetTracker:
+    """Enforces a per-request and a per-day ``Budget`` during one generation.
+
+    Engines call ``reserve`` before each fetch, ``record`` with the metadata
+    of every completion it made and ``release`` once it finished.
+    Reservations count in-flight fetches against the call limits so parallel
+    workers cannot overshoot them; token and time limits are checked against
+    the usage reported so far. Once any limit is reached ``exhausted`` holds
+    a human-readable reason and every later ``reserve`` is refused, leaving
+    the remaining nodes unexpanded.
+    """
+
+    def __init__(
+        self,
+        request_budget: Budget | None = None,
+        daily_budget: Budget | None = None,
+        daily_store: DailyUsageStore | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.request_budget = request_budget or Budget()
+        self.daily_budget = daily_budget or Budget()
+        self.daily_store = daily_store if not self.daily_budget.is_unlimited else None
+        self.exhausted: Optional[str] = None
+        self.used: Dict[str, float] = {metric: 0 for metric in _METRICS}
+        self._daily_used = self.daily_store.get() if self.daily_store else {}
+        self._in_flight = 0
+        self._clock = clock
+        self._started_at = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> bool:
+        """Claim one completion if every budget still has room."""
+
+        with self._lock:
+            if self.exhausted is None:
+                self.exhausted = self._check(pending=self._in_flight)
+            if self.exhausted is not None:
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+
+    def record(self, metadata: Dict[str, Any] | None) -> None:
+        """Charge one completion's usage; cache hits and demo calls are free."""
+
+        if not metadata or metadata.get("mode") != "live":
+            return
+        tokens = int(metadata.get("total_tokens") or 0)
+        seconds = float(metadata.get("elapsed_seconds") or 0.0)
+        daily = self.daily_store.add(1, tokens, seconds) if self.daily_store else None
+        with self._lock:
+            self.used["calls"] += 1
+            self.used["tokens"] += tokens
+            self.used["seconds"] += seconds
+            if daily is not None:
+                self._daily_used = daily
+            if self.exhausted is None:
+                self.exhausted = self._check(pending=0)
+
+    def _check(self, pending: int) -> Optional[str]:
+        """Return why a limit is reached, counting ``pending`` unrecorded calls.
+
+        A limit is reached once usage meets it, so ``max_calls=3`` lets
+        exactly three completions through.
+        """
+
+        elapsed = self._clock() - self._started_at
+        request_usage = {
+            "calls": self.used["calls"] + pending,
+            "tokens": self.used["tokens"],
+            "seconds": elapsed,
+        }
+        for metric in _METRICS:
+            limit = self.request_budget.limit(metric)
+            if limit is not None and request_usage[metric] >= limit:
+                return f"Request {_LABELS[metric]} budget of {limit:g} reached."
+        for metric in _METRICS:
+            limit = self.daily_budget.limit(metric)
+            if limit is None:
+                continue
+            used = self._daily_used.get(metric, 0) + (pending if metric == "calls" else 0)
+            if used >= limit:
+                return f"Daily {_LABELS[metric]} budget of {limit:g} reached."
+        return None
+
+
+_LABELS = {"calls": "call", "tokens": "token", "seconds": "time (seconds)"}
+
+
+def create_budget_tracker() -> BudgetTracker:
+    """Build a tracker from the ``REQUEST_MAX_*`` and ``DAILY_MAX_*`` settings."""
+
+    config = current_app.config
+    return BudgetTracker(
+        request_budget=Budget(
+            max_calls=config.get("REQUEST_MAX_CALLS"),
+            max_tokens=config.get("REQUEST_MAX_TOKENS"),
+            max_seconds=config.get("REQUEST_MAX_SECONDS"),
+        ),
+        daily_budget=Budget(
+            max_calls=config.get("DAILY_MAX_CALLS"),
+            max_tokens=config.get("DAILY_MAX_TOKENS"),
+            max_seconds=config.get("DAILY_MAX_SECONDS"),
+        ),
+        daily_store=current_app.extensions.get("daily_usage"),
+    )
+
+
+def _today() -> str:
+    return datetime.utcnow().date().isoformat()
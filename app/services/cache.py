@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
+
+from .subtopics import iter_expansions
+
+DEFAULT_MAX_ENTRIES = 50_000
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+
+
+class ExpansionCache:
+    """Disk-backed LRU/TTL cache of subtopic expansions.
+
+    Entries are keyed by ``expansion_key`` (a hash of the rendered prompt and
+    sampling parameters) and hold the cleaned subtopic list returned by the
+    model. The cache lives in a single SQLite file so it is shared by every
+    worker process and survives restarts. ``hits`` and ``misses`` count
+    lookups made through this instance.
+
+    Eviction is approximate so that lookups stay read-only. Hits are noted
+    in memory and written back in batches of ``TOUCH_BATCH``, and eviction
+    only runs once this instance's running row estimate passes
+    ``max_entries`` by a small slack, then trims the table back to
+    ``max_entries`` least recently used rows.
+    """
+
+    TOUCH_BATCH = 64
+
+    def __init__(
+        self,
+        path: Path,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float | None = DEFAULT_TTL_SECONDS,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            str(self.path),
+            timeout=30,
+            check_same_thread=False,
+        )
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS expansions (
+                key TEXT PRIMARY KEY,
+                subtopics TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS expansions_accessed_at ON expansions (accessed_at)"
+        )
+        self._connection.commit()
+        (self._estimated_rows,) = self._connection.execute("SELECT COUNT(*) FROM expansions").fetchone()
+        self._evict_slack = max(1, self.max_entries // 100)
+        self._touched: Dict[str, float] = {}
+
+    def get(self, key: str) -> Optional[List[str]]:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT subtopics, created_at FROM expansions WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is not None and self._is_expired(row[1], now):
+                self._connection.execute("DELETE FROM expansions WHERE key = ?", (key,))
+                self._connection.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = now
+            if len(self._touched) >= self.TOUCH_BATCH:
+                self._flush_touches()
+                self._connection.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, subtopics: Iterable[str]) -> None:
+        self.put_many([(key, list(subtopics))])
+
+    def put_many(self, items: Iterable[Tuple[str, List[str]]]) -> int:
+        now = time.time()
+        rows = [(key, json.dumps(list(subtopics)), now, now) for key, subtopics in items]
+        if not rows:
+            return 0
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO expansions (key, subtopics, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            # Replaced keys are counted too, so the estimate only errs high.
+            self._estimated_rows += len(rows)
+            if self._estimated_rows > self.max_entries + self._evict_slack:
+                self._evict(now)
+            self._connection.commit()
+        return len(rows)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM expansions")
+            self._connection.commit()
+            self._touched.clear()
+            self._estimated_rows = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._flush_touches()
+            self._connection.commit()
+            (entries,) = self._connection.execute(
+                "SELECT COUNT(*) FROM expansions"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def seed_from_history(self, entries: Iterable[Dict[str, Any]]) -> int:
+        """Store every live expansion found in ``entries`` and return the count.
+
+        Demo-mode entries are skipped because demo expansions are free and
+        would otherwise shadow real model output for the same prompt.
+        Regenerated branches are keyed by their regeneration's model and
+        temperature.
+        """
+
+        items: List[Tuple[str, List[str]]] = []
+        for entry in entries:
+            if entry.get("use_demo_mode"):
+                continue
+            items.extend(iter_expansions(entry))
+        return self.put_many(items)
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _flush_touches(self) -> None:
+        """Write pending hit times back; callers hold the lock and commit."""
+
+        if self._touched:
+            self._connection.executemany(
+                "UPDATE expansions SET accessed_at = MAX(accessed_at, ?) WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict(self, now: float) -> None:
+        self._flush_touches()
+        if self.ttl_seconds is not None:
+            self._connection.execute(
+                "DELETE FROM expansions WHERE created_at < ?",
+                (now - self.ttl_seconds,),
+            )
+        (count,) = self._connection.execute("SELECT COUNT(*) FROM expansions").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._connection.execute(
+                "DELETE FROM expansions WHERE key IN ("
+                "SELECT key FROM expansions ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,),
+            )
+            count -= overflow
+        self._estimated_rows = count
+
+
+def get_cache() -> ExpansionCache | None:
+    return current_app.extensions.get("expansion_cache")
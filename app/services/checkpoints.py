@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import current_app
+
+from .subtopics import GenerationRequest, new_entry
+from .trees import find_node
+
+
+class CheckpointStore:
+    """SQLite journal of the node expansions of generations still running.
+
+    Every expansion (or failure) is written as soon as it completes, so a
+    generation interrupted by a crash or restart loses nothing that was
+    already paid for: ``restore`` rebuilds the partial entry, which can then
+    be saved to history and finished with ``resume_entry``. Node marks
+    (``ref`` links to shared subtrees and ``_spent`` records of unusable
+    completions) are kept too, so a resumed generation neither re-expands
+    shared nodes nor drops paid calls from its log. A generation's rows are
+    dropped by ``finish`` once its entry is saved.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            str(self.path),
+            timeout=30,
+            check_same_thread=False,
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS generations (
+                id TEXT PRIMARY KEY,
+                request TEXT NOT NULL,
+                use_demo_mode INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS expansions (
+                generation_id TEXT NOT NULL,
+                path TEXT NOT NULL,
+                subtopics TEXT,
+                metadata TEXT,
+                error TEXT,
+                PRIMARY KEY (generation_id, path)
+            );
+            CREATE TABLE IF NOT EXISTS marks (
+                generation_id TEXT NOT NULL,
+                path TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (generation_id, path, key)
+            );
+            """
+        )
+        self._connection.commit()
+
+    def begin(self, generation_id: str, request: GenerationRequest, use_demo_mode: bool) -> None:
+        now = datetime.utcnow().isoformat()
+        self._execute(
+            "INSERT OR REPLACE INTO generations (id, request, use_demo_mode, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (generation_id, json.dumps(asdict(request)), int(use_demo_mode), now, now),
+        )
+
+    def record(
+        self,
+        generation_id: str,
+        path: Tuple[int, ...],
+        subtopics: List[str],
+        metadata: Optional[Dict[str, Any]],
+    ) -> None:
+        self._save(generation_id, path, json.dumps(subtopics), json.dumps(metadata), None)
+
+    def fail(self, generation_id: str, path: Tuple[int, ...], error: str) -> None:
+        self._save(generation_id, path, None, None, error)
+
+    def mark(self, generation_id: str, path: Tuple[int, ...], key: str, value: Any) -> None:
+        """Keep a node's ``ref`` or ``_spent`` value (see ``subtopics.MarkCallback``)."""
+
+        self._execute(
+            "INSERT OR REPLACE INTO marks (generation_id, path, key, value) VALUES (?, ?, ?, ?)",
+            (generation_id, _path_key(path), key, json.dumps(value)),
+        )
+
+    def finish(self, generation_id: str) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM expansions WHERE generation_id = ?", (generation_id,))
+            self._connection.execute("DELETE FROM marks WHERE generation_id = ?", (generation_id,))
+            self._connection.execute("DELETE FROM generations WHERE id = ?", (generation_id,))
+
+    def unfinished(self, idle_seconds: float = 0.0) -> List[str]:
+        """Return generations with no checkpoint written in the last ``idle_seconds``."""
+
+        cutoff = (datetime.utcnow() - timedelta(seconds=idle_seconds)).isoformat()
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id FROM generations WHERE updated_at <= ? ORDER BY created_at",
+                (cutoff,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def restore(self, generation_id: str) -> Optional[Dict[str, Any]]:
+        """Rebuild the partial entry of a generation from its checkpoints."""
+
+        with self._lock:
+            generation = self._connection.execute(
+                "SELECT request, use_demo_mode FROM generations WHERE id = ?",
+                (generation_id,),
+            ).fetchone()
+            rows = self._connection.execute(
+                "SELECT path, subtopics, metadata, error FROM expansions WHERE generation_id = ?",
+                (generation_id,),
+            ).fetchall()
+            marks = self._connection.execute(
+                "SELECT path, key, value FROM marks WHERE generation_id = ?",
+                (generation_id,),
+            ).fetchall()
+        if generation is None:
+            return None
+
+        request = GenerationRequest(**json.loads(generation[0]))
+        trees: List[Dict[str, Any]] = [{"topic": topic, "children": []} for topic in request.topics]
+        # Parents are restored before their children; batch siblings share one record again.
+        records: Dict[str, Dict[str, Any]] = {}
+        parsed = [(_parse_path(path), *rest) for path, *rest in rows]
+        for path, subtopics, metadata, error in sorted(parsed, key=lambda row: (len(row[0]), row[0])):
+            located = find_node(trees, path)
+            if located is None:
+                continue
+            node = located[0]
+            if error is not None:
+                node["error"] = error
+                continue
+            node["children"] = [{"topic": topic, "children": []} for topic in json.loads(subtopics)]
+            if metadata not in (None, "null"):
+                node["_call"] = records.setdefault(metadata, json.loads(metadata))
+        for path, key, value in marks:
+            located = find_node(trees, _parse_path(path))
+            if located is not None:
+                located[0][key] = json.loads(value)
+
+        entry = new_entry(request, trees, bool(generation[1]))
+        entry["interrupted"] = True
+        return entry
+
+    def _save(
+        self,
+        generation_id: str,
+        path: Tuple[int, ...],
+        subtopics: Optional[str],
+        metadata: Optional[str],
+        error: Optional[str],
+    ) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO expansions (generation_id, path, subtopics, metadata, error) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (generation_id, _path_key(path), subtopics, metadata, error),
+            )
+            self._connection.execute(
+                "UPDATE generations SET updated_at = ? WHERE id = ?",
+                (datetime.utcnow().isoformat(), generation_id),
+            )
+
+    def _execute(self, sql: str, parameters: Tuple[Any, ...]) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(sql, parameters)
+
+
+def get_checkpoints() -> CheckpointStore:
+    return current_app.extensions["checkpoints"]
+
+
+def _path_key(path: Tuple[int, ...]) -> str:
+    return ".".join(str(index) for index in path)
+
+
+def _parse_path(key: str) -> Tuple[int, ...]:
+    return tuple(int(part) for part in key.split("."))
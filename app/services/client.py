@@ -0,0 +1,345 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Mapping
+
+import openai
+from flask import current_app
+
+DEFAULT_REQUESTS_PER_MINUTE = 3500
+DEFAULT_TOKENS_PER_MINUTE = 90_000
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_REQUEST_TIMEOUT = 60.0
+
+# Completion size assumed when reserving tokens before a request is sent.
+COMPLETION_TOKEN_ESTIMATE = 200
+
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+    openai.error.APIError,
+)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at a fixed rate."""
+
+    def __init__(
+        self,
+        capacity: float,
+        refill_per_second: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float) -> float:
+        """Block until ``amount`` tokens are available and return the seconds waited.
+
+        Requests larger than the bucket are clamped to its capacity so they
+        can still proceed once the bucket is full.
+        """
+
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(amount)
+            if delay <= 0:
+                return waited
+            self._sleep(delay)
+            waited += delay
+
+    def try_acquire(self, amount: float) -> float:
+        """Take ``amount`` tokens if available and return 0, else the seconds to wait.
+
+        Non-blocking building block for ``acquire`` and for asyncio callers.
+        """
+
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.refill_per_second
+
+    def adjust(self, delta: float) -> None:
+        """Refund (positive) or charge (negative) tokens after the fact.
+
+        Charges may push the bucket below zero, which delays later callers
+        until the overdraft has been refilled.
+        """
+
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + delta)
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed = max(0.0, now - self._updated_at)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.refill_per_second)
+        self._updated_at = now
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budget for one model."""
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60, clock, sleep)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60, clock, sleep)
+        self._clock = clock
+        self._sleep = sleep
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens: float) -> None:
+        while True:
+            with self._lock:
+                delay = self._resume_at - self._clock()
+            if delay <= 0:
+                break
+            self._sleep(delay)
+        self.requests.acquire(1)
+        self.tokens.acquire(estimated_tokens)
+
+    async def acquire_async(self, estimated_tokens: float) -> None:
+        """Like ``acquire`` but waits with ``asyncio.sleep`` instead of blocking."""
+
+        while True:
+            with self._lock:
+                delay = self._resume_at - self._clock()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        for bucket, amount in ((self.requests, 1), (self.tokens, estimated_tokens)):
+            while True:
+                delay = bucket.try_acquire(amount)
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+
+    def settle(self, estimated_tokens: float, actual_tokens: float | None) -> None:
+        """Reconcile a reservation with the usage reported by the API."""
+
+        if actual_tokens is not None:
+            self.tokens.adjust(estimated_tokens - actual_tokens)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller for ``seconds``, e.g. after the API returned 429."""
+
+        with self._lock:
+            self._resume_at = max(self._resume_at, self._clock() + seconds)
+
+
+class ChatClient:
+    """OpenAI chat completion client with per-model rate limits and retries.
+
+    Each request first reserves one request and an estimated number of
+    tokens from the model's ``RateLimiter``. Transient failures are retried
+    with jittered exponential backoff, and ``Retry-After`` headers are
+    honoured and applied to every caller of the same model. ``api_base``
+    points the client at an OpenAI-compatible server, such as a local stub.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+        model_limits: Mapping[str, Mapping[str, float]] | None = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        api_base: str | None = None,
+        request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.model_limits = dict(model_limits or {})
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.api_base = api_base or None
+        self.request_timeout = request_timeout
+        self.retries = 0
+        self._clock = clock
+        self._sleep = sleep
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def limiter_for(self, model: str) -> RateLimiter:
+        with self._lock:
+            limiter = self._limiters.get(model)
+            if limiter is None:
+                limits = self.model_limits.get(model, {})
+                limiter = RateLimiter(
+                    limits.get("rpm", self.requests_per_minute),
+                    limits.get("tpm", self.tokens_per_minute),
+                    self._clock,
+                    self._sleep,
+                )
+                self._limiters[model] = limiter
+        return limiter
+
+    def create_chat_completion(
+        self,
+        api_key: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+    ) -> Any:
+        limiter = self.limiter_for(model)
+        estimate = estimate_tokens(messages)
+        attempt = 0
+        while True:
+            limiter.acquire(estimate)
+            try:
+                response = openai.ChatCompletion.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    api_key=api_key,
+                    api_base=self.api_base,
+                    request_timeout=self.request_timeout,
+                )
+            except RETRYABLE_ERRORS as exc:
+                self._sleep(self._prepare_retry(exc, attempt, limiter, estimate))
+                attempt += 1
+                continue
+            except Exception:
+                limiter.settle(estimate, 0)
+                raise
+
+            usage = getattr(response, "usage", None) or {}
+            limiter.settle(estimate, usage.get("total_tokens"))
+            return response
+
+    async def acreate_chat_completion(
+        self,
+        api_key: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+    ) -> Any:
+        """Asyncio counterpart of ``create_chat_completion``.
+
+        Uses ``openai.ChatCompletion.acreate``, which sends the request over
+        the aiohttp session set in ``openai.aiosession`` when there is one,
+        and shares this client's rate limits and retry policy.
+        """
+
+        limiter = self.limiter_for(model)
+        estimate = estimate_tokens(messages)
+        attempt = 0
+        while True:
+            await limiter.acquire_async(estimate)
+            try:
+                response = await openai.ChatCompletion.acreate(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    api_key=api_key,
+                    api_base=self.api_base,
+                    request_timeout=self.request_timeout,
+                )
+            except RETRYABLE_ERRORS as exc:
+                await asyncio.sleep(self._prepare_retry(exc, attempt, limiter, estimate))
+                attempt += 1
+                continue
+            except Exception:
+                limiter.settle(estimate, 0)
+                raise
+
+            usage = getattr(response, "usage", None) or {}
+            limiter.settle(estimate, usage.get("total_tokens"))
+            return response
+
+    def _prepare_retry(
+        self,
+        exc: Exception,
+        attempt: int,
+        limiter: RateLimiter,
+        estimate: float,
+    ) -> float:
+        """Re-raise ``exc`` when it is final, else return the delay before the next attempt."""
+
+        # The failed attempt may not have consumed quota; give the tokens back,
+        # whether or not it is retried.
+        limiter.settle(estimate, 0)
+        if attempt >= self.max_retries or not _is_retryable(exc):
+            raise exc
+        delay = self._retry_delay(exc, attempt)
+        if isinstance(exc, openai.error.RateLimitError):
+            limiter.pause(delay)
+        with self._lock:
+            self.retries += 1
+        return delay
+
+    def _retry_delay(self, exc: Exception, attempt: int) -> float:
+        retry_after = _retry_after_seconds(exc)
+        backoff = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        jittered = random.uniform(0, backoff)
+        if retry_after is not None:
+            return max(retry_after, jittered)
+        return jittered
+
+
+def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    """Roughly estimate prompt plus completion tokens (about four characters per token)."""
+
+    characters = sum(len(message.get("content", "")) for message in messages)
+    return math.ceil(characters / 4) + COMPLETION_TOKEN_ESTIMATE
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if type(exc) is openai.error.APIError:
+        status = getattr(exc, "http_status", None)
+        return status is None or status >= 500
+    return True
+
+
+def _retry_after_seconds(exc: Exception) -> float | None:
+    headers = getattr(exc, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+_default_client: ChatClient | None = None
+_default_client_lock = threading.Lock()
+
+
+def get_client() -> ChatClient:
+    """Return the application's shared client, or a process-wide default."""
+
+    global _default_client
+    try:
+        return current_app.extensions["openai_client"]
+    except (RuntimeError, KeyError):
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = ChatClient()
+            return _default_client
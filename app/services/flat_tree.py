@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from .tree_codec import NO_CALL, TreeColumns
+
+# Index used for "no node": the parent of a root, the end of a sibling chain.
+NONE = -1
+
+_REF_HOPS = 64  # refs never form cycles; bound the walk anyway
+
+
+class FlatTree:
+    """Topic trees stored as parallel index arrays instead of nested dicts.
+
+    Nodes are plain integer indices rather than objects, which is what keeps
+    large trees small. Node ``i`` has the topic ``topics[topic_ids[i]]`` (topics are interned),
+    a ``parents[i]`` index and ``first_child``/``next_sibling`` links, so
+    children are walked in order without any per-node list. Keys other than
+    ``topic`` and ``children`` (``call``, ``error``, ``ref`` and the parked
+    ``_call`` record) live in the sparse ``attrs`` mapping. Every traversal
+    uses an explicit stack, so depth never hits the recursion limit.
+    """
+
+    __slots__ = (
+        "topics",
+        "topic_ids",
+        "parents",
+        "first_child",
+        "last_child",
+        "next_sibling",
+        "attrs",
+        "_topic_index",
+        "_first_root",
+        "_last_root",
+    )
+
+    def __init__(self) -> None:
+        self.topics: List[str] = []
+        self.topic_ids = array("i")
+        self.parents = array("i")
+        self.first_child = array("i")
+        self.last_child = array("i")
+        self.next_sibling = array("i")
+        self.attrs: Dict[int, Dict[str, Any]] = {}
+        self._topic_index: Dict[str, int] | None = {}
+        self._first_root = NONE
+        self._last_root = NONE
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    @classmethod
+    def from_dicts(cls, trees: Iterable[Dict[str, Any]]) -> "FlatTree":
+        """Build a flat tree from the nested ``{"topic", "children", ...}`` layout."""
+
+        tree = cls()
+        stack: List[Tuple[Dict[str, Any], int]] = [(node, NONE) for node in reversed(list(trees or []))]
+        while stack:
+            node, parent = stack.pop()
+            attrs = {key: value for key, value in node.items() if key not in ("topic", "children")}
+            index = tree.add(str(node.get("topic", "")), parent, **attrs)
+            stack.extend((child, index) for child in reversed(node.get("children") or []))
+        return tree
+
+    @classmethod
+    def from_blob(cls, blob: bytes) -> "FlatTree":
+        """Load a flat tree straight from ``tree_codec`` output, without building dicts."""
+
+        columns = TreeColumns(blob)
+        tree = cls()
+        count = columns.count
+        tree.topics = columns.topics
+        tree._topic_index = None  # built on the first ``add``
+        # The codec's unsigned ROOT sentinel reads back as NONE when reinterpreted as signed.
+        tree.parents = array("i", columns.parents.tobytes())
+        tree.topic_ids = array("i", columns.topic_ids.tobytes())
+        tree.first_child = array("i", [NONE]) * count
+        tree.last_child = array("i", [NONE]) * count
+        tree.next_sibling = array("i", [NONE]) * count
+        parents, first_child, last_child, next_sibling = (
+            tree.parents,
+            tree.first_child,
+            tree.last_child,
+            tree.next_sibling,
+        )
+        for index in range(count - 1, -1, -1):
+            parent = parents[index]
+            if parent == NONE:
+                next_sibling[index] = tree._first_root
+                if tree._first_root == NONE:
+                    tree._last_root = index
+                tree._first_root = index
+            else:
+                next_sibling[index] = first_child[parent]
+                if first_child[parent] == NONE:
+                    last_child[parent] = index
+                first_child[parent] = index
+        for index, call in enumerate(columns.calls):
+            if call != NO_CALL:
+                tree.attrs[index] = {"call": call}
+        for key, extra in columns.extras.items():
+            tree.attrs.setdefault(int(key), {}).update(extra)
+        return tree
+
+    def add(self, topic: str, parent: int = NONE, **attrs: Any) -> int:
+        """Append ``topic`` as the last child of ``parent`` (or as a new root)."""
+
+        if self._topic_index is None:
+            self._topic_index = {value: position for position, value in enumerate(self.topics)}
+        topic_id = self._topic_index.get(topic)
+        if topic_id is None:
+            topic_id = self._topic_index[topic] = len(self.topics)
+            self.topics.append(topic)
+
+        index = len(self.parents)
+        self.topic_ids.append(topic_id)
+        self.parents.append(parent)
+        self.first_child.append(NONE)
+        self.last_child.append(NONE)
+        self.next_sibling.append(NONE)
+        if parent == NONE:
+            if self._last_root == NONE:
+                self._first_root = index
+            else:
+                self.next_sibling[self._last_root] = index
+            self._last_root = index
+        else:
+            if self.last_child[parent] == NONE:
+                self.first_child[parent] = index
+            else:
+                self.next_sibling[self.last_child[parent]] = index
+            self.last_child[parent] = index
+        if attrs:
+            self.attrs[index] = attrs
+        return index
+
+    def topic(self, index: int) -> str:
+        return self.topics[self.topic_ids[index]]
+
+    def get(self, index: int, key: str, default: Any = None) -> Any:
+        attrs = self.attrs.get(index)
+        return default if attrs is None else attrs.get(key, default)
+
+    def set(self, index: int, key: str, value: Any) -> None:
+        self.attrs.setdefault(index, {})[key] = value
+
+    def children(self, index: int = NONE) -> Iterator[int]:
+        """Yield the children of ``index`` in order (the roots for ``NONE``)."""
+
+        child = self._first_root if index == NONE else self.first_child[index]
+        next_sibling = self.next_sibling
+        while child != NONE:
+            yield child
+            child = next_sibling[child]
+
+    def has_children(self, index: int) -> bool:
+        return self.first_child[index] != NONE
+
+    def path(self, index: int) -> Tuple[int, ...]:
+        """Return the child-index path of ``index`` from the root list."""
+
+        path: List[int] = []
+        while index != NONE:
+            position = 0
+            for sibling in self.children(self.parents[index]):
+                if sibling == index:
+                    break
+                position += 1
+            path.append(position)
+            index = self.parents[index]
+        return tuple(reversed(path))
+
+    def find(self, path: Iterable[int]) -> int | None:
+        """Return the node at ``path`` (child indices from the roots), if any."""
+
+        index = NONE
+        for position in path:
+            if position < 0:
+                return None
+            child = self._first_root if index == NONE else self.first_child[index]
+            for _ in range(position):
+                if child == NONE:
+                    return None
+                child = self.next_sibling[child]
+            if child == NONE:
+                return None
+            index = child
+        return None if index == NONE else index
+
+    def resolve(self, index: int) -> int:
+        """Return the node whose subtree ``index`` shares through ``ref``, or ``index``."""
+
+        for _ in range(_REF_HOPS):
+            ref = self.get(index, "ref")
+            target = self.find(ref) if ref else None
+            if target is None:
+                break
+            index = target
+        return index
+
+    def walk(self, root: int = NONE) -> Iterator[Tuple[int, Tuple[int, ...]]]:
+        """Yield ``(index, path)`` for every node below ``root`` in depth-first order."""
+
+        base = self.path(root) if root != NONE else ()
+        stack = [
+            (child, base + (position,))
+            for position, child in reversed(list(enumerate(self.children(root))))
+        ]
+        while stack:
+            index, path = stack.pop()
+            yield index, path
+            stack.extend(
+                (child, path + (position,))
+                for position, child in reversed(list(enumerate(self.children(index))))
+            )
+
+    def summary(self) -> Dict[str, int]:
+        """Return the same totals as ``trees.summarize_trees``."""
+
+        summary = {"total_nodes": len(self), "leaf_nodes": 0, "max_depth": 0}
+        depths = array("i", [0]) * len(self)
+        parents, first_child = self.parents, self.first_child
+        # Parents always precede their children, so one forward pass suffices.
+        for index in range(len(self)):
+            parent = parents[index]
+            depths[index] = 1 if parent == NONE else depths[parent] + 1
+            if first_child[index] == NONE:
+                summary["leaf_nodes"] += 1
+        if depths:
+            summary["max_depth"] = max(depths)
+        return summary
+
+    def to_dicts(self, roots: Iterable[int] | None = None) -> List[Dict[str, Any]]:
+        """Build nested dicts for ``roots`` (default: every root) and their subtrees."""
+
+        indexes = list(self.children() if roots is None else roots)
+        top = [self._to_dict(index) for index in indexes]
+        stack = list(zip(indexes, top))
+        while stack:
+            index, node = stack.pop()
+            for child in self.children(index):
+                converted = self._to_dict(child)
+                node["children"].append(converted)
+                stack.append((child, converted))
+        return top
+
+    def _to_dict(self, index: int) -> Dict[str, Any]:
+        node: Dict[str, Any] = {"topic": self.topic(index), "children": []}
+        attrs = self.attrs.get(index)
+        if attrs:
+            node.update(attrs)
+        return node
+
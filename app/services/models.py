@@ -1,31 +1,197 @@
 from __future__ import annotations
 
-from typing import List
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Tuple
 
-import openai
+from flask import current_app
+from openai import api_requestor
 
+from ..fileio import atomic_write_text
 
-def fetch_available_models(api_key: str | None) -> List[str]:
+# How long a successful model listing is reused before asking the API again.
+MODEL_CACHE_TTL_SECONDS = 3600
+# Failed lookups are remembered briefly so an unreachable API is not retried
+# on every call.
+MODEL_FAILURE_TTL_SECONDS = 60
+
+# Upper bound on a single model listing request made by the discovery thread.
+DISCOVERY_TIMEOUT_SECONDS = 10.0
+
+_cache: Dict[str, Tuple[float, List[str]]] = {}
+_cache_lock = threading.Lock()
+_stats = {"api_calls": 0, "cache_hits": 0}
+
+
+def fetch_available_models(
+    api_key: str | None,
+    ttl_seconds: float = MODEL_CACHE_TTL_SECONDS,
+    clock: Callable[[], float] = time.monotonic,
+    api_base: str | None = None,
+    timeout: float = DISCOVERY_TIMEOUT_SECONDS,
+) -> List[str]:
     """Return a sorted list of chat-capable OpenAI models.
 
     Falls back to an empty list if no API key is provided or if the
     request to the OpenAI API fails for any reason. Only models whose
     identifiers start with ``gpt-`` are returned since the application
-    uses chat completion endpoints for generation.
+    uses chat completion endpoints for generation. Results are cached per
+    API key for ``ttl_seconds``.
     """
 
     if not api_key:
         return []
 
-    openai.api_key = api_key
+    key = _key_digest(api_key)
+    now = clock()
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] > now:
+            _stats["cache_hits"] += 1
+            return list(cached[1])
+        _stats["api_calls"] += 1
+
+    models = _list_models(api_key, api_base, timeout)
+    ttl = ttl_seconds if models else min(ttl_seconds, MODEL_FAILURE_TTL_SECONDS)
+    with _cache_lock:
+        _cache[key] = (now + ttl, models)
+    return list(models)
+
+
+def model_cache_stats() -> Dict[str, int]:
+    with _cache_lock:
+        return dict(_stats)
+
+
+class ModelCatalog:
+    """Chat models offered in the UI, discovered off the request path.
+
+    The last successful listing is persisted to ``cache_path`` so a restart
+    serves it immediately. ``models`` never blocks on the network: when the
+    listing is older than ``refresh_seconds`` it starts a daemon thread that
+    queries the API (bounded by ``timeout``) and returns the current list,
+    or ``fallback`` until the first discovery succeeds.
+    """
+
+    def __init__(
+        self,
+        cache_path: Path,
+        fallback: Sequence[str],
+        refresh_seconds: float = MODEL_CACHE_TTL_SECONDS,
+        timeout: float = DISCOVERY_TIMEOUT_SECONDS,
+        api_base: str | None = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.cache_path = Path(cache_path)
+        self.fallback = list(fallback)
+        self.refresh_seconds = refresh_seconds
+        self.timeout = timeout
+        self.api_base = api_base or None
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._models: List[str] = []
+        self._fetched_at = 0.0
+        self._key = ""
+        self._refresh_started_at: float | None = None
+        self._load_cache()
+
+    def models(self, api_key: str | None) -> List[str]:
+        if api_key and self._is_stale(api_key):
+            self.refresh_async(api_key)
+        with self._lock:
+            return list(self._models or self.fallback)
+
+    def refresh_async(self, api_key: str) -> threading.Thread | None:
+        """Start a background discovery unless one is already running."""
+
+        now = self._clock()
+        with self._lock:
+            started = self._refresh_started_at
+            # A refresh stuck past its timeout no longer blocks a new attempt.
+            if started is not None and now - started < self.timeout:
+                return None
+            self._refresh_started_at = now
+        thread = threading.Thread(
+            target=self.refresh,
+            args=(api_key,),
+            name="model-discovery",
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+    def refresh(self, api_key: str) -> List[str]:
+        try:
+            models = fetch_available_models(
+                api_key,
+                ttl_seconds=self.refresh_seconds,
+                api_base=self.api_base,
+                timeout=self.timeout,
+            )
+        finally:
+            with self._lock:
+                self._refresh_started_at = None
+        key = _key_digest(api_key)
+        with self._lock:
+            if models:
+                self._models = models
+                self._fetched_at = self._clock()
+                self._key = key
+            else:
+                # Keep serving the previous list; retry after the failure TTL.
+                self._fetched_at = max(
+                    self._fetched_at,
+                    self._clock() - self.refresh_seconds + MODEL_FAILURE_TTL_SECONDS,
+                )
+        if models:
+            self._save_cache(models, key)
+        return models
+
+    def _is_stale(self, api_key: str) -> bool:
+        with self._lock:
+            if self._key and self._key != _key_digest(api_key):
+                return True
+            return self._clock() - self._fetched_at >= self.refresh_seconds
+
+    def _load_cache(self) -> None:
+        try:
+            payload = json.loads(self.cache_path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return
+        models = payload.get("models")
+        if isinstance(models, list) and all(isinstance(model, str) for model in models):
+            self._models = models
+            self._fetched_at = float(payload.get("fetched_at") or 0.0)
+            self._key = str(payload.get("key") or "")
+
+    def _save_cache(self, models: List[str], key: str) -> None:
+        payload = {"models": models, "fetched_at": self._clock(), "key": key}
+        try:
+            atomic_write_text(self.cache_path, json.dumps(payload, indent=2))
+        except OSError:  # pragma: no cover - a read-only instance folder is not fatal
+            pass
+
+
+def get_model_catalog() -> ModelCatalog:
+    return current_app.extensions["model_catalog"]
+
+
+def _key_digest(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
 
+def _list_models(api_key: str, api_base: str | None, timeout: float) -> List[str]:
+    requestor = api_requestor.APIRequestor(key=api_key, api_base=api_base)
     try:  # pragma: no cover - network interaction is not unit tested
-        response = openai.Model.list()
+        response, _, _ = requestor.request("get", "/models", request_timeout=timeout)
     except Exception:  # noqa: BLE001 - propagate as graceful fallback
         return []
 
     candidates = []
-    for item in response.get("data", []):
+    for item in (response.data or {}).get("data", []):
         model_id = item.get("id")
         if isinstance(model_id, str) and model_id.startswith("gpt-"):
             candidates.append(model_id)
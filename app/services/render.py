@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+
+from flask import current_app
+from markupsafe import Markup, escape
+
+from .flat_tree import FlatTree
+
+# Roughly how many nodes the detail page renders up front; deeper levels are
+# sent collapsed and fetched when opened.
+DEFAULT_NODE_BUDGET = 1500
+DEFAULT_MAX_ENTRIES = 64
+
+
+def render_tree_html(
+    entry: Dict[str, Any],
+    root_path: Tuple[int, ...] = (),
+    node_budget: int = DEFAULT_NODE_BUDGET,
+    tree: FlatTree | None = None,
+) -> Markup:
+    """Render an entry's topic tree (or one node's children) as nested ``<li>`` HTML.
+
+    The walk uses an explicit stack, so deep or large trees never recurse.
+    Whole levels are rendered while they fit in ``node_budget`` (the first
+    level always does); nodes on the last rendered level that have children
+    are marked ``data-deferred`` and their subtree is fetched on demand by
+    rendering again from that node's ``root_path``. Shared (``ref``) nodes
+    are resolved so their subtree appears under every copy. ``tree`` is the
+    entry's trees as a ``FlatTree``; it is built from ``entry["trees"]``
+    when omitted.
+    """
+
+    if tree is None:
+        tree = FlatTree.from_dicts(entry.get("trees") or [])
+    if root_path:
+        located = tree.find(root_path)
+        if located is None:
+            return Markup("")
+        roots = list(tree.children(tree.resolve(located)))
+    else:
+        roots = list(tree.children())
+    return _render_nodes(entry, tree, roots, root_path, node_budget)
+
+
+def render_subtree_html(
+    entry: Dict[str, Any],
+    root_path: Tuple[int, ...],
+    node: Dict[str, Any] | None,
+    node_budget: int = DEFAULT_NODE_BUDGET,
+) -> Markup:
+    """Render the children of ``node``, the already loaded node at ``root_path``.
+
+    Used when only that branch was read from the store. Shared (``ref``)
+    nodes can point anywhere in the entry, so entries with them must be
+    rendered with ``render_tree_html`` from their whole tree instead.
+    """
+
+    if node is None:
+        return Markup("")
+    tree = FlatTree.from_dicts([node])
+    roots = list(tree.children(next(tree.children())))
+    return _render_nodes(entry, tree, roots, root_path, node_budget)
+
+
+def _render_nodes(
+    entry: Dict[str, Any],
+    tree: FlatTree,
+    roots: List[int],
+    root_path: Tuple[int, ...],
+    node_budget: int,
+) -> Markup:
+    base_depth = len(root_path)
+    max_depth = base_depth + _levels_within_budget(tree, roots, node_budget)
+    lazy = bool(entry.get("lazy"))
+    max_level = int(entry.get("max_level", 0))
+
+    parts: List[str] = []
+    stack: List[Any] = [
+        (node, root_path + (index,)) for index, node in reversed(list(enumerate(roots)))
+    ]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+            continue
+        node, path = item
+        ref = tree.get(node, "ref")
+        source = tree.resolve(node) if ref else node
+        source_path = tuple(ref) if ref else path
+        children = list(tree.children(source))
+        deferred = bool(children) and len(path) >= max_depth
+
+        if deferred:
+            parts.append(f'<li class="collapsed" data-deferred="1" data-path="{_dotted(source_path)}">')
+        else:
+            parts.append(f'<li data-path="{_dotted(source_path)}">')
+        parts.append(f'<div class="tree-node"><span class="tree-toggle">{escape(tree.topic(node))}</span>')
+        if children:
+            parts.append(f'<span class="badge bg-light text-dark ms-2">{len(children)} subtopics</span>')
+            if ref:
+                parts.append(
+                    '<span class="badge bg-info text-dark ms-1" '
+                    'title="Same subtopics as another branch">shared</span>'
+                )
+        elif lazy and len(path) <= max_level:
+            parts.append(
+                '<button type="button" class="btn btn-sm btn-outline-primary py-0 expand-node">Expand</button>'
+            )
+        error = tree.get(node, "error")
+        if error:
+            parts.append(f'<span class="badge bg-danger ms-1" title="{escape(error)}">failed</span>')
+        parts.append("</div>")
+
+        if children and not deferred:
+            parts.append("<ul>")
+            stack.append("</ul></li>")
+            stack.extend(
+                (child, source_path + (index,))
+                for index, child in reversed(list(enumerate(children)))
+            )
+        else:
+            parts.append("</li>")
+    return Markup("".join(parts))
+
+
+def _levels_within_budget(tree: FlatTree, roots: List[int], node_budget: int) -> int:
+    levels, rendered, level = 0, 0, list(roots)
+    while level and (levels == 0 or rendered + len(level) <= node_budget):
+        rendered += len(level)
+        levels += 1
+        level = [
+            child
+            for node in level
+            for child in tree.children(tree.resolve(node) if tree.get(node, "ref") else node)
+        ]
+    return levels
+
+
+def _dotted(path: Tuple[int, ...]) -> str:
+    return ".".join(str(index) for index in path)
+
+
+class RenderCache:
+    """In-process LRU of rendered tree HTML.
+
+    Keys include the entry's ``tree_version``, which the history stores bump
+    whenever an entry's trees are rewritten, so a cached render can never be
+    stale and nothing has to be invalidated explicitly.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, node_budget: int = DEFAULT_NODE_BUDGET):
+        self.max_entries = max(1, int(max_entries))
+        self.node_budget = node_budget
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[Tuple[Any, ...], Markup]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(
+        self,
+        entry: Dict[str, Any],
+        root_path: Tuple[int, ...] = (),
+        tree: FlatTree | None = None,
+    ) -> Markup:
+        return self._cached(
+            entry, root_path, lambda: render_tree_html(entry, root_path, self.node_budget, tree)
+        )
+
+    def render_subtree(
+        self,
+        entry: Dict[str, Any],
+        root_path: Tuple[int, ...],
+        node: Dict[str, Any] | None,
+    ) -> Markup:
+        return self._cached(
+            entry, root_path, lambda: render_subtree_html(entry, root_path, node, self.node_budget)
+        )
+
+    def _cached(
+        self,
+        entry: Dict[str, Any],
+        root_path: Tuple[int, ...],
+        build: Callable[[], Markup],
+    ) -> Markup:
+        key = (entry.get("id"), int(entry.get("tree_version", 0)), root_path, self.node_budget)
+        with self._lock:
+            html = self._items.get(key)
+            if html is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+        html = build()
+        with self._lock:
+            self._items[key] = html
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return html
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+def get_render_cache() -> RenderCache:
+    return current_app.extensions["render_cache"]
@@ -1,14 +1,23 @@
 from __future__ import annotations
 
 import json
+import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
-from hashlib import md5
-from typing import Any, Dict, Iterable, List, Tuple
+from hashlib import md5, sha256
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
-import openai
+from ..metrics import FETCH_TOTAL, observe_fetch
+from .client import ChatClient, get_client
+from .flat_tree import FlatTree
+from .trees import find_node
+
+if TYPE_CHECKING:  # pragma: no cover - imported for type hints only
+    from .budget import BudgetTracker
+    from .cache import ExpansionCache
 
 PROMPT_TEMPLATE = """
 You must reply with a single JSON object containing one property named "subtopics" whose value is a list of concise child topics.\n
@@ -17,9 +26,59 @@ Parent topic path: {parent_path}\n
 Topic: {topic}
 """.strip()
 
+SYSTEM_PROMPT = "You respond only with valid JSON objects containing a 'subtopics' array."
+
+BATCH_PROMPT_TEMPLATE = """
+You must reply with a single JSON object containing one property named "subtopics" whose value is an object. Use every topic listed below, spelled exactly as given, as a key and map it to a list of concise child topics.\n
+Return only valid JSON without commentary, markdown fences, or trailing text.\n
+Parent topic path: {parent_path}\n
+Topics: {topics}
+""".strip()
+
+BATCH_SYSTEM_PROMPT = (
+    "You respond only with valid JSON objects containing a 'subtopics' object "
+    "keyed by topic."
+)
+
+DEFAULT_CONCURRENCY = 8
+
+# Called with (node_path, topic, subtopics, metadata) as soon as a node is expanded.
+# ``node_path`` holds child indices from the root list down to the expanded node.
+ExpansionCallback = Callable[
+    [Tuple[int, ...], str, List[str], Optional[Dict[str, Any]]],
+    None,
+]
+
+# Called with (node_path, topic, error_message) when a node's expansion fails.
+FailureCallback = Callable[[Tuple[int, ...], str, str], None]
+
+# Called with (node_path, key, value) when a node gets a ``ref`` to the node
+# whose subtree it shares, or the ``_spent`` records of completions whose
+# reply could not be used. Neither reaches ``on_expand`` or ``on_failure``.
+MarkCallback = Callable[[Tuple[int, ...], str, Any], None]
+
+# (node index in the generation's FlatTree, ancestor topics, path in the entry)
+FrontierItem = Tuple[int, Tuple[str, ...], Tuple[int, ...]]
+
 
 class SubtopicGenerationError(RuntimeError):
-    """Raised when subtopics cannot be generated."""
+    """Raised when subtopics cannot be generated.
+
+    ``records`` holds the call records of completions that were made, and
+    paid for, before the failure, so they can still be logged and charged.
+    """
+
+    def __init__(self, message: str = "", records: List[Dict[str, Any]] | None = None):
+        super().__init__(message)
+        self.records = list(records or [])
+
+
+class GenerationCancelled(SubtopicGenerationError):
+    """Raised when a generation is cancelled before it completes."""
+
+
+class BudgetRefused(RuntimeError):
+    """Raised instead of sending a completion the budget has no room for."""
 
 
 @dataclass
@@ -29,96 +88,751 @@ class GenerationRequest:
     temperature: float
     model: str
     use_demo_mode: bool
+    concurrency: int = DEFAULT_CONCURRENCY
+    # Only expand the roots' direct children; deeper levels are expanded on demand.
+    lazy: bool = False
+    # Number of sibling topics expanded per chat completion (1 disables batching).
+    batch_size: int = 1
+    # Expand each repeated topic once per level and store later copies as refs.
+    dedupe: bool = False
 
 
-def generate_topic_tree(
-    request: GenerationRequest,
-    api_key: str,
-) -> Dict[str, Any]:
-    """Generate a nested subtopic structure for the provided topics."""
+def expansion_key(
+    model: str,
+    temperature: float,
+    topic: str,
+    ancestry: Tuple[str, ...],
+) -> str:
+    """Return a stable hash of everything that shapes a single expansion prompt."""
+
+    parent_path = " > ".join(ancestry) if ancestry else "ROOT"
+    payload = json.dumps(
+        [
+            model,
+            round(float(temperature), 2),
+            SYSTEM_PROMPT,
+            PROMPT_TEMPLATE.format(topic=topic, parent_path=parent_path),
+        ],
+        ensure_ascii=False,
+    )
+    return sha256(payload.encode("utf-8")).hexdigest()
 
+
+def validate_generation_request(request: GenerationRequest) -> None:
     if not request.topics:
         raise SubtopicGenerationError("At least one topic is required.")
 
     if request.max_level < 1 or request.max_level > 6:
         raise SubtopicGenerationError("Depth must be between 1 and 6 levels.")
 
-    trees = []
-    for topic in request.topics:
-        children, metadata = _build_tree(
-            topic=topic,
-            level=1,
-            max_level=request.max_level,
-            api_key=api_key,
-            temperature=request.temperature,
-            model=request.model,
-            use_demo_mode=request.use_demo_mode or not api_key,
-            ancestry=(),
-        )
-        tree = {
-            "topic": topic,
-            "children": children,
-            "metadata": metadata or [],
-        }
-        trees.append(tree)
 
-    return {
+def generate_topic_tree(
+    request: GenerationRequest,
+    api_key: str,
+    cache: ExpansionCache | None = None,
+    client: ChatClient | None = None,
+    on_expand: ExpansionCallback | None = None,
+    cancel_event: threading.Event | None = None,
+    budget: BudgetTracker | None = None,
+    on_failure: FailureCallback | None = None,
+    on_mark: MarkCallback | None = None,
+) -> Dict[str, Any]:
+    """Generate a nested subtopic structure for the provided topics.
+
+    ``on_expand`` is invoked from worker threads each time a node's
+    subtopics arrive, which lets callers stream partial trees. A node whose
+    expansion fails keeps its ``error`` and no children while the rest of
+    the tree carries on; ``on_failure`` is told about it, and
+    ``resume_entry`` can retry it later. ``on_mark`` hears about shared
+    (``ref``) nodes and unusable completions, so that checkpoints can
+    restore them. The generation only raises when every root failed. Setting
+    ``cancel_event`` stops the generation with ``GenerationCancelled``
+    before any further subtopic requests are issued. When ``budget`` runs
+    out, the remaining nodes are left unexpanded and the entry's
+    ``budget_exhausted`` explains which limit was hit.
+    """
+
+    validate_generation_request(request)
+
+    use_demo_mode = request.use_demo_mode or not api_key
+    tree = FlatTree()
+    roots = [tree.add(topic) for topic in request.topics]
+    _expand_levels(
+        tree=tree,
+        frontier=[(root, (), (index,)) for index, root in enumerate(roots)],
+        level=1,
+        max_level=1 if request.lazy else request.max_level,
+        api_key=api_key,
+        temperature=request.temperature,
+        model=request.model,
+        use_demo_mode=use_demo_mode,
+        concurrency=request.concurrency,
+        batch_size=request.batch_size,
+        cache=cache,
+        client=client,
+        on_expand=on_expand,
+        cancel_event=cancel_event,
+        shared={} if request.dedupe else None,
+        budget=budget,
+        on_failure=on_failure,
+        on_mark=on_mark,
+    )
+    trees = tree.to_dicts()
+    raise_if_nothing_expanded(trees)
+    return new_entry(request, trees, use_demo_mode, budget)
+
+
+def new_entry(
+    request: GenerationRequest,
+    trees: List[Dict[str, Any]],
+    use_demo_mode: bool,
+    budget: BudgetTracker | None = None,
+) -> Dict[str, Any]:
+    """Build the history entry for generated ``trees``, collecting their call log."""
+
+    entry = {
         "id": uuid.uuid4().hex,
         "topics": request.topics,
         "max_level": request.max_level,
         "temperature": request.temperature,
         "model": request.model,
-        "use_demo_mode": request.use_demo_mode or not api_key,
+        "use_demo_mode": use_demo_mode,
         "created_at": datetime.utcnow().isoformat(),
         "trees": trees,
+        "call_log": _collect_call_log(trees),
     }
+    if request.lazy:
+        entry["lazy"] = True
+    if request.dedupe:
+        entry["dedupe"] = True
+    if budget is not None and budget.exhausted:
+        entry["budget_exhausted"] = budget.exhausted
+    return entry
 
 
-def _build_tree(
-    topic: str,
+def raise_if_nothing_expanded(trees: List[Dict[str, Any]]) -> None:
+    """Raise the first root's error when every root failed to expand."""
+
+    if trees and all(tree.get("error") for tree in trees):
+        raise SubtopicGenerationError(trees[0]["error"])
+
+
+def expansion_settings(entry: Dict[str, Any], path: Tuple[int, ...]) -> Tuple[str, float]:
+    """Return the model and temperature that expand the node at ``path``.
+
+    Nodes in a regenerated branch (the regenerated node included) use that
+    regeneration's settings, the latest regeneration covering ``path``
+    winning; every other node uses the entry's own.
+    """
+
+    model = str(entry.get("model", ""))
+    temperature = float(entry.get("temperature", 0.0))
+    for change in entry.get("regenerations") or []:
+        prefix = tuple(change.get("path") or ())
+        if tuple(path[: len(prefix)]) == prefix:
+            model = str(change.get("model") or model)
+            if change.get("temperature") is not None:
+                temperature = float(change["temperature"])
+    return model, temperature
+
+
+def iter_expansions(
+    entry: Dict[str, Any],
+    root_path: Tuple[int, ...] = (),
+) -> Iterator[Tuple[str, List[str]]]:
+    """Yield ``(expansion_key, child topics)`` for each expanded node of an entry.
+
+    Only the node at ``root_path`` and its subtree are walked when a path is
+    given. Keys use ``expansion_settings``, so regenerated branches are
+    keyed by the model and temperature that actually produced them.
+    """
+
+    trees = entry.get("trees") or []
+    if root_path:
+        located = find_node(trees, root_path)
+        if located is None:
+            return
+        node, ancestry = located
+        stack = [(node, ancestry, tuple(root_path))]
+    else:
+        stack = [(tree, (), (index,)) for index, tree in enumerate(trees)]
+    while stack:
+        node, ancestry, path = stack.pop()
+        children = node.get("children") or []
+        if not children:
+            continue
+        topic = str(node.get("topic", ""))
+        model, temperature = expansion_settings(entry, path)
+        yield (
+            expansion_key(model, temperature, topic, ancestry),
+            [str(child.get("topic", "")) for child in children],
+        )
+        stack.extend(
+            (child, ancestry + (topic,), path + (index,)) for index, child in enumerate(children)
+        )
+
+
+def missing_expansions(entry: Dict[str, Any], tree: FlatTree | None = None) -> List[Tuple[int, ...]]:
+    """Return the paths of nodes a complete generation would have expanded.
+
+    These are nodes above ``max_level`` that have neither children nor a
+    ``ref``: expansions that failed, were refused by a budget or were lost
+    when a generation was interrupted. In lazy entries only failed nodes
+    count, since the rest are expanded on demand. Pass ``tree`` when the
+    entry's trees are already loaded as a ``FlatTree``.
+    """
+
+    if tree is None:
+        tree = FlatTree.from_dicts(entry.get("trees", []))
+    max_level = int(entry.get("max_level", 1))
+    lazy = bool(entry.get("lazy"))
+    return [
+        path
+        for index, path in tree.walk()
+        if len(path) <= max_level
+        and not tree.has_children(index)
+        and not tree.get(index, "ref")
+        and (tree.get(index, "error") or not lazy)
+    ]
+
+
+def resume_entry(
+    entry: Dict[str, Any],
+    api_key: str,
+    cache: ExpansionCache | None = None,
+    client: ChatClient | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    batch_size: int = 1,
+    budget: BudgetTracker | None = None,
+) -> int:
+    """Re-issue only the expansions listed by ``missing_expansions``.
+
+    The entry is updated in place (down to ``max_level``, or one level for
+    lazy entries) and the number of resumed nodes is returned. Raises
+    ``SubtopicGenerationError`` when none of them could be expanded, in
+    which case the entry should not be saved.
+    """
+
+    paths = missing_expansions(entry)
+    if not paths:
+        raise SubtopicGenerationError("Every node of this entry is already expanded.")
+    nodes = expand_entry_nodes(
+        entry,
+        paths,
+        api_key=api_key,
+        levels=1 if entry.get("lazy") else None,
+        cache=cache,
+        client=client,
+        concurrency=concurrency,
+        batch_size=batch_size,
+        budget=budget,
+    )
+    if not any(node["children"] for node in nodes):
+        if budget is not None and budget.exhausted:
+            raise SubtopicGenerationError(budget.exhausted)
+        raise SubtopicGenerationError(nodes[0].get("error") or "No subtopics were generated.")
+    entry.pop("interrupted", None)
+    entry["budget_exhausted"] = budget.exhausted if budget is not None else None
+    return len(paths)
+
+
+def expand_entry_nodes(
+    entry: Dict[str, Any],
+    paths: Iterable[Tuple[int, ...]],
+    api_key: str,
+    levels: int | None = None,
+    cache: ExpansionCache | None = None,
+    client: ChatClient | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    batch_size: int = 1,
+    budget: BudgetTracker | None = None,
+    model: str | None = None,
+    temperature: float | None = None,
+) -> List[Dict[str, Any]]:
+    """Expand unexpanded nodes of a saved entry in place and return them.
+
+    Each path addresses a node by child indices starting from the entry's
+    root list. Nodes are expanded ``levels`` deep (by default down to the
+    entry's ``max_level``) using the entry's mode and each node's
+    ``expansion_settings`` (``model`` and ``temperature`` override those),
+    with the correct topic ancestry in the prompt. New fetch records are
+    appended to the entry's ``call_log``.
+    """
+
+    max_level = int(entry.get("max_level", 1))
+    tree = FlatTree()
+    frontiers: Dict[Tuple[int, str, float], List[FrontierItem]] = {}
+    expanded: List[Tuple[Dict[str, Any], int]] = []
+    for path in paths:
+        path = tuple(path)
+        located = find_node(entry.get("trees", []), path)
+        if located is None:
+            raise SubtopicGenerationError("The requested node does not exist.")
+        node, ancestry = located
+        if node.get("ref"):
+            raise SubtopicGenerationError(f"'{node['topic']}' shares its subtopics with another node.")
+        if node.get("children"):
+            raise SubtopicGenerationError(f"'{node['topic']}' is already expanded.")
+        if len(path) > max_level:
+            raise SubtopicGenerationError(f"'{node['topic']}' is already at the maximum depth.")
+        node.pop("error", None)
+        root = tree.add(node["topic"])
+        node_model, node_temperature = expansion_settings(entry, path)
+        settings = (
+            len(path),
+            model or node_model,
+            node_temperature if temperature is None else temperature,
+        )
+        frontiers.setdefault(settings, []).append((root, ancestry, path))
+        expanded.append((node, root))
+
+    for (depth, frontier_model, frontier_temperature), frontier in sorted(frontiers.items()):
+        _expand_levels(
+            tree=tree,
+            frontier=frontier,
+            level=depth,
+            max_level=max_level if levels is None else min(max_level, depth + levels - 1),
+            api_key=api_key,
+            temperature=frontier_temperature,
+            model=frontier_model,
+            use_demo_mode=bool(entry.get("use_demo_mode")) or not api_key,
+            concurrency=concurrency,
+            batch_size=batch_size,
+            cache=cache,
+            client=client,
+            budget=budget,
+        )
+    # Graft each expanded subtree back onto the entry's own node.
+    nodes = [node for node, _ in expanded]
+    for node, converted in zip(nodes, tree.to_dicts(root for _, root in expanded)):
+        node.update((key, value) for key, value in converted.items() if key != "topic")
+    _collect_call_log(nodes, entry.setdefault("call_log", []), int(entry.get("call_log_offset", 0)))
+    return nodes
+
+
+def regenerate_subtree(
+    entry: Dict[str, Any],
+    path: Tuple[int, ...],
+    api_key: str,
+    model: str | None = None,
+    temperature: float | None = None,
+    client: ChatClient | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    batch_size: int = 1,
+    budget: BudgetTracker | None = None,
+    cache: ExpansionCache | None = None,
+) -> Dict[str, Any]:
+    """Return a new version of ``entry`` whose subtree at ``path`` is generated again.
+
+    The node keeps its topic; its children are requested afresh with its
+    real ancestry, ``model`` and ``temperature`` (by default the node's
+    ``expansion_settings``), down to the entry's ``max_level`` or one level
+    for lazy entries. The expansion cache is never read, but the new
+    answers are stored in ``cache`` under the settings that produced them.
+    ``entry`` itself is not modified. Only the nodes on the way down to
+    ``path`` are copied in memory; every other subtree is shared with
+    ``entry``. The version's ``call_log`` holds only its own calls:
+    ``call_log_offset`` is the length of its ancestors' logs, so ``call``
+    indexes below it point into the ``parent_id`` chain. Refs that pointed
+    below the replaced node are dropped, which leaves those nodes for
+    ``resume_entry``. The version records ``parent_id``, ``version`` and
+    the list of ``regenerations`` applied so far.
+    """
+
+    path = tuple(path)
+    trees = entry.get("trees") or []
+    located = find_node(trees, path)
+    if located is None:
+        raise SubtopicGenerationError("The requested node does not exist.")
+    node, _ = located
+    if node.get("ref"):
+        raise SubtopicGenerationError(f"'{node['topic']}' shares its subtopics with another node.")
+    if len(path) > int(entry.get("max_level", 1)):
+        raise SubtopicGenerationError(f"'{node['topic']}' is already at the maximum depth.")
+
+    dangling = [
+        node_path
+        for node_path, ref in _iter_refs(trees)
+        if len(ref) > len(path) and tuple(ref[: len(path)]) == path
+    ]
+    version_trees = _copy_paths(trees, [path, *dangling])
+    for node_path in dangling:
+        located_ref = find_node(version_trees, node_path)
+        if located_ref is not None:
+            located_ref[0].pop("ref", None)
+    target = find_node(version_trees, path)[0]
+    target["children"] = []
+    for key in ("call", "error", "ref"):
+        target.pop(key, None)
+
+    created_at = datetime.utcnow().isoformat()
+    skipped = ("id", "created_at", "trees", "call_log", "summary", "tree_version", "is_favorite", "interrupted")
+    version: Dict[str, Any] = {key: value for key, value in entry.items() if key not in skipped}
+    version.update(
+        id=uuid.uuid4().hex,
+        created_at=created_at,
+        trees=version_trees,
+        # Untouched nodes keep their ``call`` indexes into the parent's log;
+        # new records are numbered after it instead of copying it.
+        call_log=[],
+        call_log_offset=int(entry.get("call_log_offset", 0)) + len(entry.get("call_log") or []),
+        parent_id=entry.get("id"),
+        version=int(entry.get("version", 1)) + 1,
+    )
+    default_model, default_temperature = expansion_settings(entry, path)
+    model = model or default_model
+    temperature = default_temperature if temperature is None else temperature
+    expand_entry_nodes(
+        version,
+        [path],
+        api_key=api_key,
+        levels=1 if entry.get("lazy") else None,
+        client=client,
+        concurrency=concurrency,
+        batch_size=batch_size,
+        budget=budget,
+        model=model,
+        temperature=temperature,
+    )
+    if not target["children"]:
+        if budget is not None and budget.exhausted:
+            raise SubtopicGenerationError(budget.exhausted)
+        raise SubtopicGenerationError(target.get("error") or f"No subtopics were generated for '{target['topic']}'.")
+
+    version["regenerations"] = [
+        *(entry.get("regenerations") or []),
+        {
+            "path": list(path),
+            "topic": target["topic"],
+            "model": model,
+            "temperature": temperature,
+            "created_at": created_at,
+        },
+    ]
+    version["budget_exhausted"] = budget.exhausted if budget is not None else None
+    if cache is not None and api_key and not version.get("use_demo_mode"):
+        cache.put_many(iter_expansions(version, path))
+    return version
+
+
+def _iter_refs(trees: List[Dict[str, Any]]) -> Iterator[Tuple[Tuple[int, ...], List[int]]]:
+    stack = [((index,), tree) for index, tree in enumerate(trees)]
+    while stack:
+        path, node = stack.pop()
+        if node.get("ref"):
+            yield path, node["ref"]
+        stack.extend((path + (index,), child) for index, child in enumerate(node.get("children") or []))
+
+
+def _copy_paths(
+    trees: List[Dict[str, Any]],
+    paths: Iterable[Tuple[int, ...]],
+) -> List[Dict[str, Any]]:
+    """Return ``trees`` with only the nodes along ``paths`` shallow-copied."""
+
+    copied = list(trees)
+    fresh = set()
+    for path in paths:
+        siblings = copied
+        for index in path:
+            node = siblings[index]
+            if id(node) not in fresh:
+                node = dict(node, children=list(node.get("children") or []))
+                siblings[index] = node
+                fresh.add(id(node))
+            siblings = node["children"]
+    return copied
+
+
+def _expand_levels(
+    tree: FlatTree,
+    frontier: List[FrontierItem],
     level: int,
     max_level: int,
     api_key: str,
     temperature: float,
     model: str,
     use_demo_mode: bool,
-    ancestry: Tuple[str, ...],
-) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
-    if level > max_level:
-        return [], []
+    concurrency: int,
+    batch_size: int = 1,
+    cache: ExpansionCache | None = None,
+    client: ChatClient | None = None,
+    on_expand: ExpansionCallback | None = None,
+    cancel_event: threading.Event | None = None,
+    shared: Dict[Tuple[str, int], Tuple[int, ...]] | None = None,
+    budget: BudgetTracker | None = None,
+    on_failure: FailureCallback | None = None,
+    on_mark: MarkCallback | None = None,
+) -> None:
+    """Expand ``frontier`` nodes of ``tree`` in place, one depth level at a time.
 
-    subtopics, metadata = _fetch_subtopics(
-        topic=topic,
-        api_key=api_key,
-        temperature=temperature,
-        model=model,
-        use_demo_mode=use_demo_mode,
-        ancestry=ancestry,
-    )
+    All subtopic requests for a level are submitted to a bounded thread pool
+    together, so wall-clock time grows with the depth of the tree rather than
+    with its node count. With ``batch_size`` above one, up to that many
+    siblings share a single chat completion. Results are consumed in
+    submission order, which keeps children in the same order as a
+    depth-first walk. The fetch metadata of each expanded node is parked
+    under ``_call`` until ``_collect_call_log`` moves it into the entry's
+    flat call log. Passing a ``shared`` dict turns on deduplication (see
+    ``share_duplicates``). Nodes refused by ``budget`` keep no children.
+    """
 
-    children: List[Dict[str, Any]] = []
-    call_metadata: List[Dict[str, Any]] = []
-    for subtopic in subtopics:
-        grand_children, call_stats = _build_tree(
-            topic=subtopic,
-            level=level + 1,
-            max_level=max_level,
-            api_key=api_key,
-            temperature=temperature,
-            model=model,
-            use_demo_mode=use_demo_mode,
-            ancestry=ancestry + (topic,),
-        )
-        children.append(
-            {
-                "topic": subtopic,
-                "children": grand_children,
-                "metadata": call_stats or [],
-            }
-        )
-        call_metadata.extend(call_stats)
+    if use_demo_mode:
+        batch_size = 1
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        while frontier and level <= max_level:
+            _raise_if_cancelled(cancel_event)
+            if budget is not None and budget.exhausted:
+                break
+            if shared is not None:
+                frontier = share_duplicates(tree, frontier, level, shared, on_mark)
+            chunks = chunk_siblings(frontier, batch_size)
+            futures = [
+                executor.submit(
+                    _fetch_and_notify,
+                    tree=tree,
+                    items=chunk,
+                    on_expand=on_expand,
+                    cancel_event=cancel_event,
+                    budget=budget,
+                    on_failure=on_failure,
+                    on_mark=on_mark,
+                    api_key=api_key,
+                    temperature=temperature,
+                    model=model,
+                    use_demo_mode=use_demo_mode,
+                    cache=cache,
+                    client=client,
+                )
+                for chunk in chunks
+            ]
+            next_frontier: List[FrontierItem] = []
+            try:
+                for chunk, future in zip(chunks, futures):
+                    for (node, ancestry, path), (subtopics, metadata) in zip(
+                        chunk, future.result()
+                    ):
+                        if metadata:
+                            tree.set(node, "_call", metadata)
+                        child_ancestry = ancestry + (tree.topic(node),)
+                        for index, subtopic in enumerate(subtopics):
+                            next_frontier.append(
+                                (tree.add(subtopic, node), child_ancestry, path + (index,))
+                            )
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+            frontier = next_frontier
+            level += 1
+
+
+def share_duplicates(
+    tree: FlatTree,
+    frontier: List[FrontierItem],
+    level: int,
+    shared: Dict[Tuple[str, int], Tuple[int, ...]],
+    on_mark: MarkCallback | None = None,
+) -> List[FrontierItem]:
+    """Drop nodes whose topic was already expanded at this level and return the rest.
+
+    Nodes are keyed by normalized topic and level, so shared subtrees always
+    have the same remaining depth. A dropped node keeps no children; its
+    ``ref`` holds the index path of the node whose subtree it shares, and
+    renderers resolve it with ``FlatTree.resolve``.
+    """
+
+    unique: List[FrontierItem] = []
+    for node, ancestry, path in frontier:
+        key = (normalize_topic(tree.topic(node)), level)
+        if key in shared:
+            tree.set(node, "ref", list(shared[key]))
+            if on_mark is not None:
+                on_mark(path, "ref", list(shared[key]))
+        else:
+            shared[key] = path
+            unique.append((node, ancestry, path))
+    return unique
+
+
+def normalize_topic(topic: str) -> str:
+    return " ".join(str(topic).split()).casefold()
+
+
+def chunk_siblings(
+    frontier: List[FrontierItem],
+    batch_size: int,
+) -> List[List[FrontierItem]]:
+    """Split ``frontier`` into runs of at most ``batch_size`` siblings.
+
+    Siblings are adjacent in the frontier and share the same ancestry, so a
+    run only needs to be broken when the ancestry changes or it is full.
+    """
+
+    chunks: List[List[FrontierItem]] = []
+    for item in frontier:
+        current = chunks[-1] if chunks else None
+        if (
+            current is not None
+            and len(current) < batch_size
+            and current[0][1] == item[1]
+        ):
+            current.append(item)
+        else:
+            chunks.append([item])
+    return chunks
+
+
+def _fetch_and_notify(
+    tree: FlatTree,
+    items: List[FrontierItem],
+    on_expand: ExpansionCallback | None,
+    cancel_event: threading.Event | None,
+    budget: BudgetTracker | None = None,
+    on_failure: FailureCallback | None = None,
+    on_mark: MarkCallback | None = None,
+    **kwargs: Any,
+) -> List[Tuple[List[str], Dict[str, Any] | None]]:
+    _raise_if_cancelled(cancel_event)
+    topics = [tree.topic(node) for node, _, _ in items]
+    ancestry = items[0][1]
+    spent: List[Dict[str, Any]] = []
+    try:
+        if len(items) == 1:
+            outcomes = [
+                _fetch_subtopics(topic=topics[0], ancestry=ancestry, budget=budget, **kwargs)
+            ]
+        else:
+            outcomes, spent = _fetch_subtopics_batch(
+                topics=topics, ancestry=ancestry, budget=budget, **kwargs
+            )
+    except GenerationCancelled:
+        raise
+    except BudgetRefused:
+        return [([], None) for _ in items]
+    except SubtopicGenerationError as exc:
+        return mark_failed(tree, items, str(exc), on_failure, exc.records, on_mark)
+    count_expansions(outcomes)
+    if spent:
+        park_spent(tree, items, spent, on_mark)
+
+    results: List[Tuple[List[str], Dict[str, Any] | None]] = []
+    for (_, _, path), topic, (subtopics, metadata) in zip(items, topics, outcomes):
+        subtopics = list(subtopics)
+        if on_expand is not None and metadata is not None:
+            on_expand(path, topic, subtopics, metadata)
+        results.append((subtopics, metadata))
+    return results
+
+
+def mark_failed(
+    tree: FlatTree,
+    items: List[FrontierItem],
+    error: str,
+    on_failure: FailureCallback | None,
+    spent: List[Dict[str, Any]] | None = None,
+    on_mark: MarkCallback | None = None,
+) -> List[Tuple[List[str], Dict[str, Any] | None]]:
+    """Flag ``items`` as failed with ``error`` and return empty outcomes for them.
+
+    Failed nodes stay in the tree without children so they can be resumed.
+    ``spent`` records are parked on the first node for the call log.
+    """
+
+    FETCH_TOTAL.inc(len(items), mode="failed")
+    if spent:
+        park_spent(tree, items, spent, on_mark)
+    for node, _, path in items:
+        tree.set(node, "error", error)
+        if on_failure is not None:
+            on_failure(path, tree.topic(node), error)
+    return [([], None) for _ in items]
+
+
+def park_spent(
+    tree: FlatTree,
+    items: List[FrontierItem],
+    spent: List[Dict[str, Any]],
+    on_mark: MarkCallback | None = None,
+) -> None:
+    """Park a chunk's ``spent`` records on its first node until the call log is collected."""
 
-    return children, [metadata] + call_metadata if metadata else call_metadata
+    node, _, path = items[0]
+    tree.set(node, "_spent", list(spent))
+    if on_mark is not None:
+        on_mark(path, "_spent", list(spent))
+
+
+def charge_records(
+    records: Iterable[Dict[str, Any]],
+    model: str,
+    budget: BudgetTracker | None,
+) -> None:
+    """Record completions' latency and tokens in the fetch metrics and charge them to ``budget``."""
+
+    for record in records:
+        observe_fetch(record, model)
+        if budget is not None:
+            budget.record(record)
+
+
+def count_expansions(outcomes: List[Tuple[Iterable[str], Dict[str, Any] | None]]) -> None:
+    """Count each expanded node once, by how it was answered; refused nodes are not counted."""
+
+    for _, metadata in outcomes:
+        if metadata is not None:
+            FETCH_TOTAL.inc(mode=str(metadata.get("mode") or "unknown"))
+
+
+def distinct_records(
+    outcomes: List[Tuple[Iterable[str], Dict[str, Any] | None]],
+) -> Iterator[Dict[str, Any]]:
+    """Yield each outcome's record once; batched siblings share a single record."""
+
+    seen = set()
+    for _, metadata in outcomes:
+        if metadata is not None and id(metadata) not in seen:
+            seen.add(id(metadata))
+            yield metadata
+
+
+def _raise_if_cancelled(cancel_event: threading.Event | None) -> None:
+    if cancel_event is not None and cancel_event.is_set():
+        raise GenerationCancelled("Generation was cancelled.")
+
+
+def _collect_call_log(
+    trees: List[Dict[str, Any]],
+    call_log: List[Dict[str, Any]] | None = None,
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
+    """Move parked fetch records into a flat, depth-first ordered call log.
+
+    Each expanded node keeps only ``call``, the index of its record in the
+    returned list, so a record is stored once no matter how deep the node
+    sits. Aggregates are derived from the log on demand. Records are
+    appended to ``call_log`` when an existing log is passed in. Records of
+    completions whose reply could not be used (parked under ``_spent``) are
+    logged too, without any node pointing at them. ``offset`` is added to
+    every index, for logs that continue a parent version's.
+    """
+
+    if call_log is None:
+        call_log = []
+    # Siblings expanded by one batched completion share a single record.
+    indexes: Dict[int, int] = {}
+    stack = list(reversed(trees))
+    while stack:
+        node = stack.pop()
+        record = node.pop("_call", None)
+        if record:
+            if id(record) not in indexes:
+                indexes[id(record)] = offset + len(call_log)
+                call_log.append(record)
+            node["call"] = indexes[id(record)]
+        call_log.extend(node.pop("_spent", None) or [])
+        stack.extend(reversed(node["children"]))
+    return call_log
 
 
 def _fetch_subtopics(
@@ -128,11 +842,14 @@ def _fetch_subtopics(
     model: str,
     use_demo_mode: bool,
     ancestry: Tuple[str, ...],
+    cache: ExpansionCache | None = None,
+    client: ChatClient | None = None,
+    budget: BudgetTracker | None = None,
 ) -> Tuple[Iterable[str], Dict[str, Any] | None]:
     parent_path = " > ".join(ancestry) if ancestry else "ROOT"
 
     if use_demo_mode:
-        return _demo_subtopics(topic), {
+        return demo_subtopics(topic), {
             "mode": "demo",
             "topic": topic,
             "parent_path": parent_path,
@@ -143,29 +860,208 @@ def _fetch_subtopics(
             "No OpenAI API key configured. Provide one in config.py or set OPENAI_API_KEY."
         )
 
-    openai.api_key = api_key
-    try:
-        start_time = time.monotonic()
-        response = openai.ChatCompletion.create(
-            model=model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You respond only with valid JSON objects containing a 'subtopics' array.",
-                },
-                {
-                    "role": "user",
-                    "content": PROMPT_TEMPLATE.format(
-                        topic=topic,
-                        parent_path=parent_path,
-                    ),
-                },
-            ],
+    cache_key = None
+    if cache is not None:
+        cache_key = expansion_key(model, temperature, topic, ancestry)
+        cached = cache.get(cache_key)
+        if cached:
+            return cached, {
+                "mode": "cache",
+                "topic": topic,
+                "parent_path": parent_path,
+            }
+
+    payload, response_metadata = _request_json(
+        client=client,
+        api_key=api_key,
+        model=model,
+        temperature=temperature,
+        system_prompt=SYSTEM_PROMPT,
+        user_prompt=PROMPT_TEMPLATE.format(topic=topic, parent_path=parent_path),
+        budget=budget,
+    )
+    response_metadata.update({"topic": topic, "parent_path": parent_path})
+    cleaned = parse_subtopics(payload, response_metadata)
+
+    if cache is not None and cache_key is not None:
+        cache.put(cache_key, cleaned)
+
+    return cleaned, response_metadata
+
+
+def _fetch_subtopics_batch(
+    topics: List[str],
+    api_key: str,
+    temperature: float,
+    model: str,
+    use_demo_mode: bool,
+    ancestry: Tuple[str, ...],
+    cache: ExpansionCache | None = None,
+    client: ChatClient | None = None,
+    budget: BudgetTracker | None = None,
+) -> Tuple[List[Tuple[List[str], Dict[str, Any] | None]], List[Dict[str, Any]]]:
+    """Expand several sibling topics with one chat completion.
+
+    Cached topics are answered from the cache first. The remaining topics
+    share one request whose JSON reply maps each topic to its children;
+    every topic missing from (or malformed in) that reply falls back to a
+    regular single-topic request. Topics answered by the batch share one
+    call record carrying the request's usage. Every completion, fallbacks
+    included, is reserved against ``budget`` on its own; topics it refuses
+    get an empty outcome without a record. The outcomes are returned with
+    the records of completions no topic could use, which still have to be
+    logged.
+    """
+
+    def fetch_one(topic: str) -> Tuple[List[str], Dict[str, Any] | None]:
+        subtopics, metadata = _fetch_subtopics(
+            topic=topic,
+            api_key=api_key,
             temperature=temperature,
+            model=model,
+            use_demo_mode=use_demo_mode,
+            ancestry=ancestry,
+            cache=cache,
+            client=client,
+            budget=budget,
         )
-        elapsed = time.monotonic() - start_time
-    except Exception as exc:  # pragma: no cover - network errors not unit tested
-        raise SubtopicGenerationError(str(exc)) from exc
+        return list(subtopics), metadata
+
+    if use_demo_mode or not api_key:
+        return [fetch_one(topic) for topic in topics], []
+
+    parent_path = " > ".join(ancestry) if ancestry else "ROOT"
+    outcomes: Dict[int, Tuple[List[str], Dict[str, Any] | None]] = {}
+    spent: List[Dict[str, Any]] = []
+    pending: List[int] = []
+    for index, topic in enumerate(topics):
+        cached = cache.get(expansion_key(model, temperature, topic, ancestry)) if cache else None
+        if cached:
+            outcomes[index] = (
+                cached,
+                {"mode": "cache", "topic": topic, "parent_path": parent_path},
+            )
+        else:
+            pending.append(index)
+
+    if len(pending) > 1:
+        batch_topics = [topics[index] for index in pending]
+        try:
+            payload, response_metadata = _request_json(
+                client=client,
+                api_key=api_key,
+                model=model,
+                temperature=temperature,
+                system_prompt=BATCH_SYSTEM_PROMPT,
+                user_prompt=BATCH_PROMPT_TEMPLATE.format(
+                    topics=json.dumps(batch_topics, ensure_ascii=False),
+                    parent_path=parent_path,
+                ),
+                budget=budget,
+            )
+        except BudgetRefused:
+            return fill_refused(outcomes, len(topics)), spent
+        except SubtopicGenerationError as exc:
+            payload, response_metadata = {}, {}
+            spent.extend(exc.records)
+        else:
+            if not isinstance(payload.get("subtopics"), dict):
+                response_metadata["error"] = "Response JSON does not include a 'subtopics' object."
+        answers = parse_batch(payload, response_metadata, batch_topics, parent_path)
+        for index in pending:
+            cleaned = answers.get(topics[index])
+            if not cleaned:
+                continue
+            outcomes[index] = (cleaned, response_metadata)
+            if cache is not None:
+                cache.put(expansion_key(model, temperature, topics[index], ancestry), cleaned)
+        if response_metadata.get("mode") == "live" and not answers:
+            spent.append(response_metadata)
+
+    for index, topic in enumerate(topics):
+        if index not in outcomes:
+            try:
+                outcomes[index] = fetch_one(topic)
+            except BudgetRefused:
+                return fill_refused(outcomes, len(topics)), spent
+            except SubtopicGenerationError as exc:
+                raise SubtopicGenerationError(
+                    str(exc), records=[*unlogged_records(outcomes.values(), spent), *exc.records]
+                ) from exc
+
+    return [outcomes[index] for index in range(len(topics))], spent
+
+
+def fill_refused(
+    outcomes: Dict[int, Tuple[List[str], Dict[str, Any] | None]],
+    count: int,
+) -> List[Tuple[List[str], Dict[str, Any] | None]]:
+    """Return ``outcomes`` in order, with an empty outcome for each topic the budget refused."""
+
+    return [outcomes.get(index, ([], None)) for index in range(count)]
+
+
+def _request_json(
+    client: ChatClient | None,
+    api_key: str,
+    model: str,
+    temperature: float,
+    system_prompt: str,
+    user_prompt: str,
+    budget: BudgetTracker | None = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Send one chat completion and return its JSON payload and usage metadata.
+
+    The completion is reserved against ``budget`` before it is sent
+    (``BudgetRefused`` is raised when there is no room) and charged as soon
+    as it returns, whether or not its reply is usable.
+    """
+
+    client = client or get_client()
+    if budget is not None and not budget.reserve():
+        raise BudgetRefused(budget.exhausted or "Budget reached.")
+    try:
+        try:
+            start_time = time.monotonic()
+            response = client.create_chat_completion(
+                api_key=api_key,
+                model=model,
+                messages=chat_messages(system_prompt, user_prompt),
+                temperature=temperature,
+            )
+            elapsed = time.monotonic() - start_time
+        except Exception as exc:  # pragma: no cover - network errors not unit tested
+            raise SubtopicGenerationError(str(exc)) from exc
+        try:
+            payload, response_metadata = parse_response(response, elapsed)
+        except SubtopicGenerationError as exc:
+            charge_records(exc.records, model, budget)
+            raise
+        charge_records([response_metadata], model, budget)
+        return payload, response_metadata
+    finally:
+        # Released only after charging so parallel reservations never see a gap.
+        if budget is not None:
+            budget.release()
+
+
+def chat_messages(system_prompt: str, user_prompt: str) -> List[Dict[str, str]]:
+    """Return the chat completion messages for one prompt."""
+
+    return [
+        {
+            "role": "system",
+            "content": system_prompt,
+        },
+        {
+            "role": "user",
+            "content": user_prompt,
+        },
+    ]
+
+
+def parse_response(response: Any, elapsed: float) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Return a completion's JSON payload and its usage metadata."""
 
     usage = getattr(response, "usage", None)
     if usage is not None:
@@ -179,27 +1075,91 @@ def _fetch_subtopics(
     else:
         response_metadata = {"mode": "live", "elapsed_seconds": round(elapsed, 2)}
 
-    response_metadata.update({"topic": topic, "parent_path": parent_path})
-
     message = response["choices"][0]["message"]["content"]
     try:
         json_payload = json.loads(message)
     except json.JSONDecodeError as exc:
-        raise SubtopicGenerationError("Model returned a non-JSON response.") from exc
+        raise _unusable("Model returned a non-JSON response.", response_metadata) from exc
+    if not isinstance(json_payload, dict):
+        raise _unusable("Model returned a non-JSON response.", response_metadata)
+
+    return json_payload, response_metadata
+
 
-    subtopics = json_payload.get("subtopics")
+def parse_subtopics(payload: Dict[str, Any], response_metadata: Dict[str, Any]) -> List[str]:
+    """Return the cleaned ``subtopics`` list of a single-topic reply.
+
+    Raises ``SubtopicGenerationError`` carrying ``response_metadata`` (the
+    completion was still paid for) when the reply holds no usable list.
+    """
+
+    subtopics = payload.get("subtopics")
     if not isinstance(subtopics, list):
-        raise SubtopicGenerationError("Response JSON does not include a 'subtopics' list.")
+        raise _unusable("Response JSON does not include a 'subtopics' list.", response_metadata)
 
-    cleaned = [str(item).strip() for item in subtopics if str(item).strip()]
+    cleaned = _clean_subtopics(subtopics)
 
     if not cleaned:
-        raise SubtopicGenerationError("No subtopics were returned by the model.")
+        raise _unusable("No subtopics were returned by the model.", response_metadata)
+    return cleaned
 
-    return cleaned, response_metadata
+
+def _unusable(message: str, response_metadata: Dict[str, Any]) -> SubtopicGenerationError:
+    response_metadata["error"] = message
+    return SubtopicGenerationError(message, records=[response_metadata])
+
+
+def unlogged_records(
+    outcomes: Iterable[Tuple[Iterable[str], Dict[str, Any] | None]],
+    spent: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """Return the live records of a batch whose chunk is about to fail as a whole."""
+
+    return [
+        record
+        for record in [*distinct_records(list(outcomes)), *spent]
+        if record.get("mode") == "live"
+    ]
+
+
+def parse_batch(
+    payload: Dict[str, Any],
+    response_metadata: Dict[str, Any],
+    batch_topics: List[str],
+    parent_path: str,
+) -> Dict[str, List[str]]:
+    """Map each batched topic to its cleaned children, matching keys case-insensitively.
+
+    Topics the reply left out or answered with something other than a
+    non-empty list are omitted. ``response_metadata`` is updated in place to
+    describe the batch.
+    """
+
+    mapping = payload.get("subtopics")
+    answers: Dict[str, Any] = {}
+    if isinstance(mapping, dict):
+        answers = {str(key).strip().casefold(): value for key, value in mapping.items()}
+    response_metadata.update(
+        {
+            "topics": batch_topics,
+            "batch_size": len(batch_topics),
+            "parent_path": parent_path,
+        }
+    )
+    results: Dict[str, List[str]] = {}
+    for topic in batch_topics:
+        answer = answers.get(topic.strip().casefold())
+        cleaned = _clean_subtopics(answer) if isinstance(answer, list) else []
+        if cleaned:
+            results[topic] = cleaned
+    return results
+
+
+def _clean_subtopics(subtopics: List[Any]) -> List[str]:
+    return [str(item).strip() for item in subtopics if str(item).strip()]
 
 
-def _demo_subtopics(topic: str) -> List[str]:
+def demo_subtopics(topic: str) -> List[str]:
     """Generate deterministic mock subtopics for demo mode."""
     digest = md5(topic.encode("utf-8"))
     anchors = [
@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import json
+import struct
+import sys
+import zlib
+from array import array
+from typing import Any, Dict, List, Tuple
+
+# Blob layout: MAGIC, a version byte and a compression byte, then the body
+# (zlib-compressed when the compression byte is COMPRESSION_ZLIB):
+#
+#   header    <IIII> node count, string count, string table byte count,
+#             extras byte count
+#   strings   topic table: a JSON array of the distinct topics, in order of
+#             first use
+#   parents   u32 per node in depth-first order; ROOT marks a root tree
+#   topics    u32 per node: index into the topic table
+#   flags     u8 per node (FLAG_*)
+#   calls     u32 per node: its call log index, or NO_CALL
+#   extras    JSON object mapping node index to any other keys (ref, error, ...)
+#
+# Nodes are stored in depth-first order, so every subtree is a contiguous run
+# of nodes and can be materialized without building the rest of the tree.
+#
+# Version 1 blobs front-coded a sorted topic table instead (shared-prefix
+# lengths, suffix lengths, then the UTF-8 suffixes). That was smaller before
+# compression but had to be rebuilt topic by topic in Python on every read;
+# zlib removes most of the same redundancy, and a JSON table is parsed in C.
+# Version 1 blobs are still read.
+MAGIC = b"RSTC"
+VERSION = 2
+LEGACY_VERSIONS = (1,)
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+
+ROOT = 0xFFFFFFFF
+NO_CALL = 0xFFFFFFFF
+FLAG_CHILDREN = 1  # the node has a "children" key (possibly empty)
+FLAG_EXTRAS = 2
+
+_PREAMBLE = struct.Struct("<4sBB")
+_HEADER = struct.Struct("<IIII")
+_OWN_KEYS = ("topic", "children", "call")
+
+
+class TreeCodecError(ValueError):
+    """Raised for blobs that were not written by ``encode_trees``."""
+
+
+def is_encoded(blob: bytes) -> bool:
+    return bytes(blob[: len(MAGIC)]) == MAGIC
+
+
+def encode_trees(trees: List[Dict[str, Any]], compress: bool = True, level: int = 1) -> bytes:
+    """Serialize a list of topic trees into the compact binary layout.
+
+    ``level`` is the zlib level; level 1 already shrinks trees about tenfold
+    against compact JSON and costs a fraction of the default level's time.
+    """
+
+    topic_ids: Dict[str, int] = {}
+    parents: List[int] = []
+    topics: List[int] = []
+    flags = bytearray()
+    calls: List[int] = []
+    extras: Dict[str, Dict[str, Any]] = {}
+    add_parent, add_topic, add_flag, add_call = parents.append, topics.append, flags.append, calls.append
+
+    stack: List[Tuple[Dict[str, Any], int]] = [(tree, ROOT) for tree in reversed(trees or [])]
+    while stack:
+        node, parent = stack.pop()
+        index = len(parents)
+        add_parent(parent)
+        topic = node.get("topic", "")
+        if topic.__class__ is not str:
+            topic = str(topic)
+        topic_id = topic_ids.get(topic)
+        if topic_id is None:
+            topic_id = topic_ids[topic] = len(topic_ids)
+        add_topic(topic_id)
+        flag = FLAG_CHILDREN if "children" in node else 0
+        has_call = "call" in node
+        call = node["call"] if has_call else NO_CALL
+        stored = isinstance(call, int) and 0 <= call < NO_CALL
+        add_call(call if stored else NO_CALL)
+        # Only nodes with keys beyond the ones stored in columns need a dict of extras.
+        if len(node) > ("topic" in node) + flag + has_call or (has_call and not stored):
+            other = {key: value for key, value in node.items() if key not in _OWN_KEYS}
+            if has_call and not stored:
+                other["call"] = call
+            flag |= FLAG_EXTRAS
+            extras[str(index)] = other
+        add_flag(flag)
+        children = node.get("children")
+        if children:
+            stack.extend([(child, index) for child in reversed(children)])
+
+    strings = json.dumps(list(topic_ids), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    extras_bytes = json.dumps(extras, separators=(",", ":")).encode("utf-8") if extras else b""
+    body = b"".join(
+        (
+            _HEADER.pack(len(parents), len(topic_ids), len(strings), len(extras_bytes)),
+            strings,
+            _to_bytes(array("I", parents)),
+            _to_bytes(array("I", topics)),
+            bytes(flags),
+            _to_bytes(array("I", calls)),
+            extras_bytes,
+        )
+    )
+    if compress:
+        return _PREAMBLE.pack(MAGIC, VERSION, COMPRESSION_ZLIB) + zlib.compress(body, level)
+    return _PREAMBLE.pack(MAGIC, VERSION, COMPRESSION_NONE) + body
+
+
+def decode_trees(blob: bytes) -> List[Dict[str, Any]]:
+    """Rebuild the full list of topic trees from ``encode_trees`` output."""
+
+    table = TreeColumns(blob)
+    return table.materialize(0, table.count)
+
+
+def decode_subtree(blob: bytes, path: Tuple[int, ...]) -> Dict[str, Any] | None:
+    """Return only the node at ``path`` (child indices from the roots) with its subtree.
+
+    Only the nodes of that subtree are turned into dicts; ``None`` means
+    the path does not exist.
+    """
+
+    if not path:
+        return None
+    table = TreeColumns(blob)
+    sizes = table.subtree_sizes()
+    start, end = 0, table.count
+    for index in path:
+        if index < 0:
+            return None
+        position = start
+        for _ in range(index):
+            if position >= end:
+                return None
+            position += sizes[position]
+        if position >= end:
+            return None
+        start, end = position + 1, position + sizes[position]
+        node_at = position
+    return table.materialize(node_at, node_at + sizes[node_at])[0]
+
+
+class TreeColumns:
+    """Column arrays parsed from one ``encode_trees`` blob."""
+
+    def __init__(self, blob: bytes):
+        preamble = bytes(blob[: _PREAMBLE.size])
+        if len(preamble) < _PREAMBLE.size:
+            raise TreeCodecError("Tree blob is truncated.")
+        magic, version, compression = _PREAMBLE.unpack(preamble)
+        if magic != MAGIC or (version != VERSION and version not in LEGACY_VERSIONS):
+            raise TreeCodecError("Not an encoded tree blob.")
+        body = memoryview(blob)[_PREAMBLE.size :]
+        if compression == COMPRESSION_ZLIB:
+            body = memoryview(zlib.decompress(body))
+        elif compression != COMPRESSION_NONE:
+            raise TreeCodecError(f"Unknown tree blob compression {compression}.")
+
+        try:
+            count, string_count, string_size, extras_size = _HEADER.unpack_from(body)
+            offset = _HEADER.size
+            if version == VERSION:
+                self.topics: List[str] = json.loads(bytes(body[offset : offset + string_size]))
+                offset += string_size
+            else:
+                self.topics, offset = _read_front_coded(body, offset, string_count, string_size)
+            self.parents, offset = _read_u32(body, offset, count)
+            self.topic_ids, offset = _read_u32(body, offset, count)
+            self.flags = bytes(body[offset : offset + count])
+            offset += count
+            self.calls, offset = _read_u32(body, offset, count)
+            extras = bytes(body[offset : offset + extras_size])
+        except (struct.error, ValueError) as exc:
+            raise TreeCodecError("Tree blob is truncated.") from exc
+
+        self.count = count
+        self.extras: Dict[str, Dict[str, Any]] = json.loads(extras) if extras else {}
+
+    def subtree_sizes(self) -> array:
+        sizes = array("I", [1]) * self.count
+        parents = self.parents
+        for index in range(self.count - 1, -1, -1):
+            parent = parents[index]
+            if parent != ROOT:
+                sizes[parent] += sizes[index]
+        return sizes
+
+    def materialize(self, start: int, end: int) -> List[Dict[str, Any]]:
+        """Build dicts for nodes ``start:end`` and return the top-level ones."""
+
+        # Each key is filled in its own pass over the run, in the order the
+        # encoder read them, so most of the work stays inside comprehensions.
+        topics = self.topics
+        nodes = [{"topic": topics[topic_id]} for topic_id in self.topic_ids[start:end]]
+        flags = self.flags[start:end]
+        for position in _positions(flags, FLAG_CHILDREN):
+            nodes[position]["children"] = []
+        for position, call in enumerate(self.calls[start:end]):
+            if call != NO_CALL:
+                nodes[position]["call"] = call
+        if self.extras:
+            extras = self.extras
+            for position in _positions(flags, FLAG_EXTRAS):
+                nodes[position].update(extras.get(str(start + position), {}))
+
+        top: List[Dict[str, Any]] = []
+        for node, parent in zip(nodes, self.parents[start:end]):
+            if parent == ROOT or parent < start:
+                top.append(node)
+            else:
+                nodes[parent - start].setdefault("children", []).append(node)
+        return top
+
+
+def _positions(flags: bytes, flag: int) -> List[int]:
+    return [position for position, value in enumerate(flags) if value & flag]
+
+
+def _read_front_coded(body: memoryview, offset: int, count: int, size: int) -> Tuple[List[str], int]:
+    # Version 1 topic table; see the layout notes at the top.
+    prefixes, offset = _read_u32(body, offset, count)
+    suffix_lengths, offset = _read_u32(body, offset, count)
+    suffixes = bytes(body[offset : offset + size])
+    topics: List[str] = []
+    previous, cursor = b"", 0
+    for shared, length in zip(prefixes, suffix_lengths):
+        previous = previous[:shared] + suffixes[cursor : cursor + length]
+        cursor += length
+        topics.append(previous.decode("utf-8"))
+    return topics, offset + size
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _read_u32(body: memoryview, offset: int, count: int) -> Tuple[array, int]:
+    end = offset + 4 * count
+    if end > len(body):
+        raise ValueError("short read")
+    values = array("I")
+    values.frombytes(body[offset:end])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values, end
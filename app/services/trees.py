@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+
+def summarize_trees(trees: List[Dict[str, Any]]) -> Dict[str, int]:
+    summary = {
+        "total_nodes": 0,
+        "leaf_nodes": 0,
+        "max_depth": 0,
+    }
+
+    stack: List[Tuple[Dict[str, Any], int]] = [(tree, 1) for tree in trees or []]
+    while stack:
+        node, depth = stack.pop()
+        summary["total_nodes"] += 1
+        summary["max_depth"] = max(summary["max_depth"], depth)
+        children = node.get("children", []) or []
+        if not children:
+            summary["leaf_nodes"] += 1
+        stack.extend((child, depth + 1) for child in children)
+
+    return summary
+
+
+def iter_node_paths(
+    trees: Iterable[Dict[str, Any]],
+) -> Iterator[Tuple[str, Tuple[str, ...]]]:
+    """Yield ``(topic, path)`` for every node in depth-first order."""
+
+    stack: List[Tuple[Dict[str, Any], Tuple[str, ...]]] = [
+        (tree, ()) for tree in reversed(list(trees or []))
+    ]
+    while stack:
+        node, ancestry = stack.pop()
+        topic = str(node.get("topic", ""))
+        path = ancestry + (topic,)
+        yield topic, path
+        stack.extend((child, path) for child in reversed(node.get("children") or []))
+
+
+def has_refs(trees: Iterable[Dict[str, Any]]) -> bool:
+    """Return whether any node below ``trees`` shares another node's subtree."""
+
+    stack = list(trees or [])
+    while stack:
+        node = stack.pop()
+        if node.get("ref"):
+            return True
+        stack.extend(node.get("children") or [])
+    return False
+
+
+def summarize_calls(call_log: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate an entry's call log into usage totals."""
+
+    usage: Dict[str, Any] = {
+        "total_calls": 0,
+        "live_calls": 0,
+        "cached_calls": 0,
+        "demo_calls": 0,
+        "batched_calls": 0,
+        "total_tokens": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "elapsed_seconds": 0.0,
+    }
+    for record in call_log or []:
+        usage["total_calls"] += 1
+        mode = record.get("mode")
+        if mode == "live":
+            usage["live_calls"] += 1
+            if record.get("batch_size"):
+                usage["batched_calls"] += 1
+            usage["total_tokens"] += record.get("total_tokens") or 0
+            usage["prompt_tokens"] += record.get("prompt_tokens") or 0
+            usage["completion_tokens"] += record.get("completion_tokens") or 0
+            usage["elapsed_seconds"] += record.get("elapsed_seconds") or 0
+        elif mode == "cache":
+            usage["cached_calls"] += 1
+        elif mode == "demo":
+            usage["demo_calls"] += 1
+    usage["elapsed_seconds"] = round(usage["elapsed_seconds"], 2)
+    return usage
+
+
+def is_legacy_entry(entry: Dict[str, Any]) -> bool:
+    trees = entry.get("trees") or []
+    return "call_log" not in entry and any("metadata" in tree for tree in trees)
+
+
+def compact_entry(entry: Dict[str, Any]) -> bool:
+    """Rewrite legacy per-node ``metadata`` lists into ``call`` + ``call_log``.
+
+    Older entries stored, on every node, the records of every call made for
+    its whole subtree, so each record was repeated once per ancestor. An
+    expanded node's own record is the first item of its list. Returns
+    ``True`` when the entry was rewritten.
+    """
+
+    if not is_legacy_entry(entry):
+        return False
+
+    call_log: List[Dict[str, Any]] = []
+    stack = list(reversed(entry.get("trees") or []))
+    while stack:
+        node = stack.pop()
+        metadata = node.pop("metadata", None) or []
+        children = node.get("children") or []
+        if metadata and children:
+            node["call"] = len(call_log)
+            call_log.append(metadata[0])
+        stack.extend(reversed(children))
+    entry["call_log"] = call_log
+    return True
+
+
+def find_node(
+    trees: List[Dict[str, Any]],
+    path: Tuple[int, ...],
+) -> Tuple[Dict[str, Any], Tuple[str, ...]] | None:
+    """Return the node at ``path`` and the topics of its ancestors.
+
+    ``path`` holds child indices starting from the list of root trees.
+    """
+
+    if not path:
+        return None
+    siblings = trees or []
+    ancestry: Tuple[str, ...] = ()
+    node: Dict[str, Any] | None = None
+    for index in path:
+        if index < 0 or index >= len(siblings):
+            return None
+        if node is not None:
+            ancestry += (str(node.get("topic", "")),)
+        node = siblings[index]
+        siblings = node.get("children") or []
+    return node, ancestry
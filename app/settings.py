@@ -1,10 +1,16 @@
 from __future__ import annotations
+import copy
 import json
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
 from flask import current_app
 
+from .fileio import atomic_write_text, file_lock
+from .metrics import SETTINGS_LOAD_SECONDS
+
 DEFAULT_SETTINGS: Dict[str, Any] = {
     "api_key": "",
     "default_model": "gpt-3.5-turbo",
@@ -15,12 +21,42 @@ DEFAULT_SETTINGS: Dict[str, Any] = {
 }
 
 
+# Parsed settings per file, keyed by path and tagged with the file's
+# (mtime_ns, size) so edits made by other processes invalidate the entry.
+_cache: Dict[Path, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+_cache_lock = threading.Lock()
+_stats = {"disk_reads": 0, "cache_hits": 0}
+
+
 class SettingsStore:
     def __init__(self, path: Path):
         self.path = path
         self.path.parent.mkdir(parents=True, exist_ok=True)
 
     def load(self) -> Dict[str, Any]:
+        """Return the settings, re-reading the file only when it has changed."""
+
+        start = time.perf_counter()
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return DEFAULT_SETTINGS.copy()
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with _cache_lock:
+            cached = _cache.get(self.path)
+            if cached is not None and cached[0] == signature:
+                _stats["cache_hits"] += 1
+                settings = copy.deepcopy(cached[1])
+                SETTINGS_LOAD_SECONDS.observe(time.perf_counter() - start, source="cache")
+                return settings
+            _stats["disk_reads"] += 1
+        settings = self._read()
+        with _cache_lock:
+            _cache[self.path] = (signature, copy.deepcopy(settings))
+        SETTINGS_LOAD_SECONDS.observe(time.perf_counter() - start, source="disk")
+        return settings
+
+    def _read(self) -> Dict[str, Any]:
         if not self.path.exists():
             return DEFAULT_SETTINGS.copy()
 
@@ -50,6 +86,12 @@ class SettingsStore:
         return normalized
 
     def save(self, payload: Dict[str, Any]) -> None:
+        # Hold the lock across the read-modify-write so concurrent saves from
+        # other workers are not lost; the atomic rename keeps readers lock-free.
+        with file_lock(self.path):
+            self._save(payload)
+
+    def _save(self, payload: Dict[str, Any]) -> None:
         current = self.load()
         current.update({k: v for k, v in payload.items() if k in DEFAULT_SETTINGS})
         current["default_topics"] = _ensure_topic_list(payload.get("default_topics", current["default_topics"]))
@@ -68,7 +110,9 @@ class SettingsStore:
         current["default_demo_mode"] = bool(payload.get("default_demo_mode", False))
         current["api_key"] = str(payload.get("api_key", current["api_key"])).strip()
         current["default_model"] = str(payload.get("default_model", current["default_model"])).strip()
-        self.path.write_text(json.dumps(current, indent=2), encoding="utf-8")
+        atomic_write_text(self.path, json.dumps(current, indent=2))
+        with _cache_lock:
+            _cache.pop(self.path, None)
 
 
 def get_settings_store() -> SettingsStore:
@@ -79,6 +123,11 @@ def load_settings() -> Dict[str, Any]:
     return get_settings_store().load()
 
 
+def settings_cache_stats() -> Dict[str, int]:
+    with _cache_lock:
+        return dict(_stats)
+
+
 def mask_api_key(value: str) -> str:
     value = value.strip()
     if not value:
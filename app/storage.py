@@ -1,59 +1,834 @@
 from __future__ import annotations
 
+import functools
 import json
+import re
+import sqlite3
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
 
 from flask import current_app
 
+from .fileio import append_line, atomic_write_text, file_lock
+from .metrics import HISTORY_BYTES, HISTORY_OPERATION_SECONDS
+from .services.flat_tree import FlatTree
+from .services.tree_codec import MAGIC, decode_subtree, decode_trees, encode_trees, is_encoded
+from .services.trees import compact_entry, find_node, iter_node_paths, summarize_trees
+
+# Fields copied into the listing projection used by the dashboard and history
+# pages; everything else (trees, call log) is only read when an entry is opened.
+LISTING_FIELDS = (
+    "id",
+    "topics",
+    "max_level",
+    "temperature",
+    "model",
+    "use_demo_mode",
+    "lazy",
+    "created_at",
+    "is_favorite",
+    "summary",
+)
+
+
+_Method = TypeVar("_Method", bound=Callable[..., Any])
+
+
+def _timed(operation: str) -> Callable[[_Method], _Method]:
+    """Record the wrapped store method's duration under ``operation``."""
+
+    def decorator(method: _Method) -> _Method:
+        @functools.wraps(method)
+        def wrapper(self: "BaseHistoryStore", *args: Any, **kwargs: Any) -> Any:
+            with HISTORY_OPERATION_SECONDS.time(backend=self.backend, operation=operation):
+                return method(self, *args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
 
-class HistoryStore:
-    def __init__(self, path: Path):
-        self.path = path
+
+class BaseHistoryStore:
+    """Interface shared by every history backend.
+
+    Entries are returned newest first. ``update_entry`` merges ``updates`` into
+    the stored entry and reports whether the entry existed. ``list_entries``
+    and ``search`` return listing projections (see ``LISTING_FIELDS``) rather
+    than full entries, so listing pages never deserialize a tree.
+    """
+
+    backend = "base"
 
     def load(self) -> List[Dict[str, Any]]:
-        if not self.path.exists():
-            return []
-        try:
-            entries = json.loads(self.path.read_text(encoding="utf-8"))
-        except json.JSONDecodeError:
-            return []
-        return [self._normalize_entry(entry) for entry in entries]
+        raise NotImplementedError
 
     def save(self, entries: List[Dict[str, Any]]) -> None:
-        self.path.write_text(json.dumps(entries, indent=2), encoding="utf-8")
+        raise NotImplementedError
 
     def add_entry(self, entry: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get_entry(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update_entry(self, entry_id: str, updates: Dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    def get_flat_entry(self, entry_id: str) -> Optional[Tuple[Dict[str, Any], FlatTree]]:
+        """Return an entry without its ``trees``, plus those trees as a ``FlatTree``."""
+
+        entry = self.get_entry(entry_id)
+        if entry is None:
+            return None
+        return entry, FlatTree.from_dicts(entry.pop("trees", []))
+
+    def get_subtree(
+        self, entry_id: str, path: Tuple[int, ...]
+    ) -> Optional[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+        """Return an entry without its ``trees``, plus the node at ``path`` with its subtree.
+
+        The node is ``None`` when the path does not exist.
+        """
+
+        entry = self.get_entry(entry_id)
+        if entry is None:
+            return None
+        located = find_node(entry.pop("trees", []), path)
+        return entry, located[0] if located else None
+
+    def clear(self) -> None:
+        self.save([])
+
+    @_timed("list_entries")
+    def list_entries(
+        self,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        favorites_only: bool = False,
+    ) -> List[Dict[str, Any]]:
+        listings = self._load_listings()
+        if favorites_only:
+            listings = [listing for listing in listings if listing.get("is_favorite")]
+        end = None if limit is None else offset + limit
+        return listings[offset:end]
+
+    def count_entries(self, favorites_only: bool = False) -> int:
+        return len(self.list_entries(favorites_only=favorites_only))
+
+    def iter_entries(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        favorites_only: bool = False,
+    ) -> Iterator[Dict[str, Any]]:
+        """Yield full entries newest first, filtered by ``created_at`` and favorite flag.
+
+        ``since`` and ``until`` are inclusive ISO timestamps compared as
+        strings. This fallback loads every entry; SQLite streams rows.
+        """
+
+        for entry in self.load():
+            if _entry_matches(entry, since, until, favorites_only):
+                yield entry
+
+    @_timed("search")
+    def search(self, query: str) -> List[Tuple[Dict[str, Any], List[List[str]]]]:
+        """Return ``(listing, matched_paths)`` pairs for nodes matching ``query``.
+
+        Every whitespace separated term must prefix-match a word of the same
+        node topic. Each matched path lists the topics from the tree root down
+        to the matching node. This fallback walks every stored tree; indexed
+        backends override it.
+        """
+
+        terms = search_terms(query)
+        if not terms:
+            return []
+        results = []
+        for entry in self.load():
+            paths = [
+                list(path)
+                for topic, path in iter_node_paths(entry.get("trees", []))
+                if topic_matches(topic, terms)
+            ]
+            if paths:
+                results.append((listing_projection(entry), paths))
+        return results
+
+    def compact(self) -> int:
+        """Rewrite legacy entries into the compact call-log layout.
+
+        Returns the number of entries written back to storage.
+        """
+
         entries = self.load()
-        entries.insert(0, self._normalize_entry(entry))
         self.save(entries)
+        return len(entries)
+
+    def _load_listings(self) -> List[Dict[str, Any]]:
+        return [listing_projection(entry) for entry in self.load()]
+
+    def _normalize_entry(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        entry.setdefault("is_favorite", False)
+        compact_entry(entry)
+        return entry
+
+    def _prepare_new_entry(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        if entry.get("summary") is None:
+            entry["summary"] = summarize_trees(entry.get("trees", []))
+        return self._normalize_entry(entry)
+
+
+class HistoryStore(BaseHistoryStore):
+    """JSON file backend that is safe to share between worker processes.
+
+    Writers hold an exclusive lock on ``<name>.json.lock`` and replace the
+    file atomically, so concurrent generations never drop each other's
+    entries and a crash never leaves a truncated history. New entries are
+    appended to ``<name>.log`` (one JSON line each) instead of rewriting the
+    whole file; the log is folded back into the main file by any full write
+    or once it grows past ``APPEND_LOG_MAX_BYTES``.
+
+    Every full write also stores ``<name>.listing.json`` next to the history
+    file, holding the listing projection of each entry, so listing pages read
+    a small file instead of every tree. Appends add their row to that file
+    under the same lock, so listing right after a generation never has to
+    decode the history.
+    """
+
+    APPEND_LOG_MAX_BYTES = 4 * 1024 * 1024
+    backend = "json"
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.log_path = self.path.with_name(f"{self.path.stem}.log")
+        self.listing_path = self.path.with_name(f"{self.path.stem}.listing.json")
 
+    @_timed("load")
+    def load(self) -> List[Dict[str, Any]]:
+        with file_lock(self.path, shared=True):
+            entries = self._read()
+        return [self._normalize_entry(entry) for entry in entries]
+
+    @_timed("save")
+    def save(self, entries: List[Dict[str, Any]]) -> None:
+        with file_lock(self.path):
+            self._write(entries)
+
+    @_timed("add_entry")
+    def add_entry(self, entry: Dict[str, Any]) -> None:
+        entry = self._prepare_new_entry(entry)
+        with file_lock(self.path):
+            listings = self._current_listings()
+            line = json.dumps(entry)
+            size = append_line(self.log_path, line)
+            HISTORY_BYTES.inc(len(line) + 1, backend=self.backend, direction="write")
+            if size > self.APPEND_LOG_MAX_BYTES:
+                self._write(self._read())
+            elif listings is not None and all(row.get("id") != entry.get("id") for row in listings):
+                # Written after the log line, so the listing stays fresh.
+                self._save_listings([listing_projection(entry), *listings])
+
+    @_timed("get_entry")
     def get_entry(self, entry_id: str) -> Optional[Dict[str, Any]]:
         for entry in self.load():
             if entry.get("id") == entry_id:
                 return entry
         return None
 
+    @_timed("update_entry")
     def update_entry(self, entry_id: str, updates: Dict[str, Any]) -> bool:
-        entries = self.load()
-        updated = False
-        for index, entry in enumerate(entries):
-            if entry.get("id") == entry_id:
-                entry.update(updates)
-                entries[index] = self._normalize_entry(entry)
-                updated = True
-                break
-        if updated:
-            self.save(entries)
-        return updated
+        with file_lock(self.path):
+            entries = self._read()
+            for index, entry in enumerate(entries):
+                if entry.get("id") == entry_id:
+                    if "trees" in updates:
+                        entry["tree_version"] = int(entry.get("tree_version", 0)) + 1
+                    entry.update(updates)
+                    entries[index] = self._normalize_entry(entry)
+                    self._write(entries)
+                    return True
+        return False
+
+    def _read(self) -> List[Dict[str, Any]]:
+        """Return the main file's entries preceded by the newer logged ones."""
+
+        entries: List[Dict[str, Any]] = []
+        if self.path.exists():
+            text = self.path.read_text(encoding="utf-8")
+            HISTORY_BYTES.inc(len(text), backend=self.backend, direction="read")
+            try:
+                entries = json.loads(text)
+            except json.JSONDecodeError:
+                entries = []
+        if not self.log_path.exists():
+            return entries
+        known = {entry.get("id") for entry in entries}
+        appended: List[Dict[str, Any]] = []
+        with open(self.log_path, encoding="utf-8") as handle:
+            for line in handle:
+                HISTORY_BYTES.inc(len(line), backend=self.backend, direction="read")
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a torn line left by a crash mid-append
+                if entry.get("id") not in known:
+                    known.add(entry.get("id"))
+                    appended.append(entry)
+        return list(reversed(appended)) + entries
+
+    def _write(self, entries: List[Dict[str, Any]]) -> None:
+        """Checkpoint ``entries`` into the main file; callers hold the write lock."""
+
+        text = json.dumps(entries, indent=2)
+        atomic_write_text(self.path, text)
+        HISTORY_BYTES.inc(len(text), backend=self.backend, direction="write")
+        if self.log_path.exists():
+            self.log_path.unlink()
+        self._save_listings([listing_projection(entry) for entry in entries])
+
+    def _load_listings(self) -> List[Dict[str, Any]]:
+        if self._listings_fresh():
+            listings = self._read_listings()
+            if listings is not None:
+                return listings
+        # Appended entries (or a hand-edited history file) are newer than the
+        # listing, so rebuild it while holding the write lock.
+        with file_lock(self.path):
+            entries = [self._normalize_entry(entry) for entry in self._read()]
+            listings = [listing_projection(entry) for entry in entries]
+            if entries or self.path.exists() or self.log_path.exists():
+                self._save_listings(listings)
+        return listings
+
+    def _current_listings(self) -> Optional[List[Dict[str, Any]]]:
+        """Return the listing file's rows if they match the history, else ``None``."""
+
+        if not self.path.exists() and not self.log_path.exists():
+            return []
+        return self._read_listings() if self._listings_fresh() else None
+
+    def _read_listings(self) -> Optional[List[Dict[str, Any]]]:
+        try:
+            text = self.listing_path.read_text(encoding="utf-8")
+            HISTORY_BYTES.inc(len(text), backend=self.backend, direction="read")
+            return json.loads(text)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _listings_fresh(self) -> bool:
+        try:
+            listing_mtime = self.listing_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+        for source in (self.path, self.log_path):
+            try:
+                if source.stat().st_mtime_ns > listing_mtime:
+                    return False
+            except FileNotFoundError:
+                continue
+        return True
+
+    def _save_listings(self, listings: List[Dict[str, Any]]) -> None:
+        text = json.dumps(listings)
+        atomic_write_text(self.listing_path, text)
+        HISTORY_BYTES.inc(len(text), backend=self.backend, direction="write")
+
+
+class SQLiteHistoryStore(BaseHistoryStore):
+    """History backend storing one row per entry in an SQLite database.
+
+    Scalar entry fields live in the ``data`` JSON column while trees are kept
+    in a separate ``trees`` blob (see ``services.tree_codec``), so favorites and other metadata updates
+    touch a single row without re-serializing any tree. The ``entry_listing``
+    table mirrors each entry's listing projection and is kept in sync on
+    every write; listing queries page through it without touching
+    ``entries``.
+    """
+
+    backend = "sqlite"
+
+    _SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS entries (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            created_at TEXT NOT NULL DEFAULT '',
+            is_favorite INTEGER NOT NULL DEFAULT 0,
+            data TEXT NOT NULL,
+            trees BLOB NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS entries_created_at ON entries (created_at)",
+        "CREATE INDEX IF NOT EXISTS entries_is_favorite ON entries (is_favorite, created_at)",
+        """
+        CREATE TABLE IF NOT EXISTS entry_listing (
+            id TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL,
+            created_at TEXT NOT NULL DEFAULT '',
+            is_favorite INTEGER NOT NULL DEFAULT 0,
+            data TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS entry_listing_order ON entry_listing (created_at, seq)",
+        "CREATE INDEX IF NOT EXISTS entry_listing_favorite "
+        "ON entry_listing (is_favorite, created_at, seq)",
+    )
+
+    _SCHEMA_VERSION = 4
+
+    # Deletes one entry's block of ``node_index`` rows by rowid range.
+    UNINDEX_SQL = "DELETE FROM node_index WHERE rowid BETWEEN ? AND ?"
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            for statement in self._SCHEMA:
+                connection.execute(statement)
+            self.has_node_index = self._create_node_index(connection)
+            (version,) = connection.execute("PRAGMA user_version").fetchone()
+            if version < self._SCHEMA_VERSION:
+                if version < 4 and self.has_node_index:
+                    self._rebuild_node_index(connection)
+                if version < 3:
+                    self._rebuild_listing(connection)
+                connection.execute(f"PRAGMA user_version = {self._SCHEMA_VERSION}")
+
+    @_timed("load")
+    def load(self) -> List[Dict[str, Any]]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT data, trees FROM entries ORDER BY created_at DESC, seq DESC"
+            ).fetchall()
+        return [self._row_to_entry(data, trees) for data, trees in rows]
+
+    @_timed("save")
+    def save(self, entries: List[Dict[str, Any]]) -> None:
+        with self._connect() as connection:
+            connection.execute("DELETE FROM entries")
+            connection.execute("DELETE FROM entry_listing")
+            if self.has_node_index:
+                connection.execute("DELETE FROM node_index")
+                connection.execute("DELETE FROM node_index_ranges")
+            for entry in reversed(entries):
+                self._insert(connection, self._normalize_entry(entry))
+
+    @_timed("add_entry")
+    def add_entry(self, entry: Dict[str, Any]) -> None:
+        with self._connect() as connection:
+            self._insert(connection, self._prepare_new_entry(entry))
+
+    @_timed("get_entry")
+    def get_entry(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT data, trees FROM entries WHERE id = ?",
+                (entry_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return self._row_to_entry(*row)
+
+    @_timed("update_entry")
+    def update_entry(self, entry_id: str, updates: Dict[str, Any]) -> bool:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT data FROM entries WHERE id = ?",
+                (entry_id,),
+            ).fetchone()
+            if row is None:
+                return False
+            data = json.loads(row[0])
+            if "trees" in updates:
+                data["tree_version"] = int(data.get("tree_version", 0)) + 1
+            data.update({key: value for key, value in updates.items() if key != "trees"})
+            data = self._normalize_entry(data)
+            assignments = ["data = ?", "created_at = ?", "is_favorite = ?"]
+            values: List[Any] = [
+                json.dumps(data),
+                str(data.get("created_at", "")),
+                int(bool(data.get("is_favorite"))),
+            ]
+            if "trees" in updates:
+                assignments.append("trees = ?")
+                values.append(_encode_trees(updates["trees"]))
+            written = len(values[0]) + (len(values[-1]) if "trees" in updates else 0)
+            HISTORY_BYTES.inc(written, backend=self.backend, direction="write")
+            connection.execute(
+                f"UPDATE entries SET {', '.join(assignments)} WHERE id = ?",
+                (*values, entry_id),
+            )
+            connection.execute(
+                "UPDATE entry_listing SET created_at = ?, is_favorite = ?, data = ? WHERE id = ?",
+                (values[1], values[2], json.dumps(listing_projection(data)), entry_id),
+            )
+            if "trees" in updates and self.has_node_index:
+                self._unindex_entry(connection, entry_id)
+                self._index_trees(connection, entry_id, updates["trees"])
+        return True
 
     def clear(self) -> None:
-        self.save([])
+        with self._connect() as connection:
+            connection.execute("DELETE FROM entries")
+            connection.execute("DELETE FROM entry_listing")
+            if self.has_node_index:
+                connection.execute("DELETE FROM node_index")
+                connection.execute("DELETE FROM node_index_ranges")
 
-    def _normalize_entry(self, entry: Dict[str, Any]) -> Dict[str, Any]:
-        entry.setdefault("is_favorite", False)
-        return entry
+    @_timed("list_entries")
+    def list_entries(
+        self,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        favorites_only: bool = False,
+    ) -> List[Dict[str, Any]]:
+        sql = "SELECT data FROM entry_listing"
+        if favorites_only:
+            sql += " WHERE is_favorite = 1"
+        sql += " ORDER BY created_at DESC, seq DESC LIMIT ? OFFSET ?"
+        with self._connect() as connection:
+            rows = connection.execute(
+                sql,
+                (-1 if limit is None else limit, offset),
+            ).fetchall()
+        HISTORY_BYTES.inc(sum(len(data) for (data,) in rows), backend=self.backend, direction="read")
+        return [json.loads(data) for (data,) in rows]
+
+    def iter_entries(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        favorites_only: bool = False,
+    ) -> Iterator[Dict[str, Any]]:
+        """Yield entries one row at a time so exports never hold the whole history."""
+
+        clauses: List[str] = []
+        params: List[Any] = []
+        if since:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until:
+            clauses.append("created_at <= ?")
+            params.append(until)
+        if favorites_only:
+            clauses.append("is_favorite = 1")
+        sql = "SELECT data, trees FROM entries"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created_at DESC, seq DESC"
+        with self._connect() as connection:
+            for data, trees in connection.execute(sql, params):
+                yield self._row_to_entry(data, trees)
+
+    @_timed("count_entries")
+    def count_entries(self, favorites_only: bool = False) -> int:
+        sql = "SELECT COUNT(*) FROM entry_listing"
+        if favorites_only:
+            sql += " WHERE is_favorite = 1"
+        with self._connect() as connection:
+            (count,) = connection.execute(sql).fetchone()
+        return count
+
+    @_timed("search")
+    def search(self, query: str) -> List[Tuple[Dict[str, Any], List[List[str]]]]:
+        """Look up matching nodes through the FTS5 ``node_index`` table."""
+
+        if not self.has_node_index:
+            return super().search(query)
+        terms = search_terms(query)
+        if not terms:
+            return []
+        match = " AND ".join(f'"{term}"*' for term in terms)
+        paths_by_entry: Dict[str, List[List[str]]] = {}
+        with self._connect() as connection:
+            for entry_id, path in connection.execute(
+                "SELECT entry_id, path FROM node_index WHERE node_index MATCH ? ORDER BY rowid",
+                (match,),
+            ):
+                paths_by_entry.setdefault(entry_id, []).append(json.loads(path))
+            if not paths_by_entry:
+                return []
+            placeholders = ", ".join("?" for _ in paths_by_entry)
+            rows = connection.execute(
+                f"SELECT id, data FROM entry_listing WHERE id IN ({placeholders}) "
+                "ORDER BY created_at DESC, seq DESC",
+                tuple(paths_by_entry),
+            ).fetchall()
+        return [(json.loads(data), paths_by_entry[entry_id]) for entry_id, data in rows]
+
+    @_timed("get_flat_entry")
+    def get_flat_entry(self, entry_id: str) -> Optional[Tuple[Dict[str, Any], FlatTree]]:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT data, trees FROM entries WHERE id = ?",
+                (entry_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        data, trees = row
+        if not is_encoded(trees):
+            entry = self._row_to_entry(data, trees)
+            return entry, FlatTree.from_dicts(entry.pop("trees"))
+        HISTORY_BYTES.inc(len(data) + len(trees), backend=self.backend, direction="read")
+        # The tree columns are loaded as arrays; no node dicts are built.
+        return self._normalize_entry(json.loads(data)), FlatTree.from_blob(trees)
+
+    @_timed("get_subtree")
+    def get_subtree(
+        self, entry_id: str, path: Tuple[int, ...]
+    ) -> Optional[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT data, trees FROM entries WHERE id = ?",
+                (entry_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        data, trees = row
+        HISTORY_BYTES.inc(len(data) + len(trees), backend=self.backend, direction="read")
+        entry = self._normalize_entry(json.loads(data))
+        if is_encoded(trees):
+            # Only the requested branch is turned into dicts.
+            return entry, decode_subtree(trees, path)
+        located = find_node(_decode_trees(trees), path)
+        return entry, located[0] if located else None
+
+    def compact(self) -> int:
+        """Rewrite rows still stored as JSON trees or with per-node ``metadata`` lists."""
+
+        compacted = 0
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT id, data, trees FROM entries WHERE substr(trees, 1, ?) != ?",
+                (len(MAGIC), MAGIC),
+            ).fetchall()
+            for entry_id, data, trees in rows:
+                entry = json.loads(data)
+                entry["trees"] = _decode_trees(trees)
+                compact_entry(entry)
+                trees = entry.pop("trees")
+                connection.execute(
+                    "UPDATE entries SET data = ?, trees = ? WHERE id = ?",
+                    (json.dumps(entry), _encode_trees(trees), entry_id),
+                )
+                compacted += 1
+        return compacted
+
+    def import_entries(self, entries: List[Dict[str, Any]]) -> int:
+        """Insert ``entries`` whose ids are not stored yet and return the count."""
+
+        imported = 0
+        with self._connect() as connection:
+            for entry in reversed(entries):
+                if not entry.get("id"):
+                    continue
+                cursor = self._insert(connection, self._normalize_entry(entry), ignore=True)
+                imported += cursor.rowcount
+        return imported
+
+    def _create_node_index(self, connection: sqlite3.Connection) -> bool:
+        """Create the FTS5 ``node_index`` and the rowid range of each entry's nodes.
+
+        FTS5 cannot look rows up by an ``UNINDEXED`` column, so each entry's
+        nodes get a contiguous block of rowids recorded in
+        ``node_index_ranges``; deleting an entry's nodes is then a rowid
+        range delete instead of a scan of every indexed node.
+        """
+
+        try:
+            connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS node_index USING fts5("
+                "topic, entry_id UNINDEXED, path UNINDEXED, tokenize = 'unicode61')"
+            )
+        except sqlite3.OperationalError:  # pragma: no cover - SQLite built without FTS5
+            return False
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS node_index_ranges (
+                entry_id TEXT PRIMARY KEY,
+                first_rowid INTEGER NOT NULL,
+                last_rowid INTEGER NOT NULL
+            )
+            """
+        )
+        return True
+
+    def _rebuild_listing(self, connection: sqlite3.Connection) -> None:
+        """Fill ``entry_listing`` from ``entries``, backfilling missing summaries."""
+
+        connection.execute("DELETE FROM entry_listing")
+        rows = connection.execute("SELECT seq, id, data, trees FROM entries").fetchall()
+        for seq, entry_id, data, trees in rows:
+            entry = json.loads(data)
+            if entry.get("summary") is None:
+                entry["summary"] = summarize_trees(_decode_trees(trees))
+                connection.execute(
+                    "UPDATE entries SET data = ? WHERE seq = ?",
+                    (json.dumps(entry), seq),
+                )
+            self._write_listing(connection, seq, self._normalize_entry(entry))
+
+    def _write_listing(
+        self,
+        connection: sqlite3.Connection,
+        seq: int,
+        entry: Dict[str, Any],
+    ) -> None:
+        connection.execute(
+            "INSERT OR REPLACE INTO entry_listing (id, seq, created_at, is_favorite, data) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                str(entry.get("id", "")),
+                seq,
+                str(entry.get("created_at", "")),
+                int(bool(entry.get("is_favorite"))),
+                json.dumps(listing_projection(entry)),
+            ),
+        )
+
+    def _rebuild_node_index(self, connection: sqlite3.Connection) -> None:
+        connection.execute("DELETE FROM node_index")
+        connection.execute("DELETE FROM node_index_ranges")
+        for entry_id, trees in connection.execute("SELECT id, trees FROM entries").fetchall():
+            self._index_trees(connection, entry_id, _decode_trees(trees))
+
+    def _index_trees(
+        self,
+        connection: sqlite3.Connection,
+        entry_id: str,
+        trees: List[Dict[str, Any]],
+    ) -> None:
+        # Callers already hold the write transaction, so no other writer can
+        # take rowids between reading the maximum and inserting.
+        (last,) = connection.execute("SELECT COALESCE(MAX(rowid), 0) FROM node_index").fetchone()
+        first = last + 1
+        rows = [
+            (rowid, topic, entry_id, json.dumps(list(path)))
+            for rowid, (topic, path) in enumerate(iter_node_paths(trees), start=first)
+        ]
+        if not rows:
+            return
+        connection.executemany(
+            "INSERT INTO node_index (rowid, topic, entry_id, path) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        connection.execute(
+            "INSERT OR REPLACE INTO node_index_ranges (entry_id, first_rowid, last_rowid) "
+            "VALUES (?, ?, ?)",
+            (entry_id, first, first + len(rows) - 1),
+        )
+
+    def _unindex_entry(self, connection: sqlite3.Connection, entry_id: str) -> None:
+        row = connection.execute(
+            "SELECT first_rowid, last_rowid FROM node_index_ranges WHERE entry_id = ?",
+            (entry_id,),
+        ).fetchone()
+        if row is None:
+            return
+        connection.execute(self.UNINDEX_SQL, row)
+        connection.execute("DELETE FROM node_index_ranges WHERE entry_id = ?", (entry_id,))
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(str(self.path), timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _insert(
+        self,
+        connection: sqlite3.Connection,
+        entry: Dict[str, Any],
+        ignore: bool = False,
+    ) -> sqlite3.Cursor:
+        data = json.dumps({key: value for key, value in entry.items() if key != "trees"})
+        trees = _encode_trees(entry.get("trees", []))
+        entry_id = str(entry.get("id", ""))
+        verb = "INSERT OR IGNORE" if ignore else "INSERT OR REPLACE"
+        cursor = connection.execute(
+            f"{verb} INTO entries (id, created_at, is_favorite, data, trees) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                entry_id,
+                str(entry.get("created_at", "")),
+                int(bool(entry.get("is_favorite"))),
+                data,
+                trees,
+            ),
+        )
+        HISTORY_BYTES.inc(len(data) + len(trees), backend=self.backend, direction="write")
+        if cursor.rowcount:
+            self._write_listing(connection, cursor.lastrowid, entry)
+            if self.has_node_index:
+                self._unindex_entry(connection, entry_id)
+                self._index_trees(connection, entry_id, entry.get("trees", []))
+        return cursor
+
+    def _row_to_entry(self, data: str, trees: bytes) -> Dict[str, Any]:
+        HISTORY_BYTES.inc(len(data) + len(trees), backend=self.backend, direction="read")
+        entry = json.loads(data)
+        entry["trees"] = _decode_trees(trees)
+        return self._normalize_entry(entry)
+
+
+def listing_projection(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the fields of ``entry`` shown on listing pages."""
+
+    listing = {key: entry[key] for key in LISTING_FIELDS if key in entry}
+    listing["is_favorite"] = bool(entry.get("is_favorite"))
+    if listing.get("summary") is None:
+        listing["summary"] = summarize_trees(entry.get("trees", []))
+    return listing
+
+
+def _entry_matches(
+    entry: Dict[str, Any],
+    since: Optional[str],
+    until: Optional[str],
+    favorites_only: bool,
+) -> bool:
+    created_at = str(entry.get("created_at", ""))
+    if since and created_at < since:
+        return False
+    if until and created_at > until:
+        return False
+    return not favorites_only or bool(entry.get("is_favorite"))
+
+
+def search_terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query.casefold())
+
+
+def topic_matches(topic: str, terms: List[str]) -> bool:
+    words = re.findall(r"\w+", topic.casefold())
+    return all(any(word.startswith(term) for word in words) for term in terms)
+
+
+def _encode_trees(trees: List[Dict[str, Any]]) -> bytes:
+    return encode_trees(trees or [])
+
+
+def _decode_trees(blob: bytes) -> List[Dict[str, Any]]:
+    # Rows written before the binary codec hold compact JSON.
+    if is_encoded(blob):
+        return decode_trees(blob)
+    return json.loads(blob)
+
+
+def migrate_json_history(json_path: Path, store: SQLiteHistoryStore) -> int:
+    """Copy entries from a legacy ``history.json`` file into ``store``.
+
+    Entries already present in the database are left untouched, so the
+    migration can be re-run safely. Returns the number of imported entries.
+    """
+
+    return store.import_entries(HistoryStore(Path(json_path)).load())
 
 
-def get_store() -> HistoryStore:
-    return HistoryStore(current_app.config["HISTORY_PATH"])
+def get_store() -> BaseHistoryStore:
+    return current_app.extensions["history_store"]
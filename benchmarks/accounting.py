@@ -0,0 +1,171 @@
+"""Check that every paid completion is logged and charged, whatever its reply.
+
+Run from the repository root::
+
+    python -m benchmarks.accounting
+
+A scripted chat client answers batched requests with an empty object or
+with text that is not JSON, and answers some single-topic requests badly
+too, so generations fall back and fail part-way. For the synchronous and
+the asyncio engine, the number of completions the client served must equal
+the live records in the entry's ``call_log`` and the calls charged to its
+budget. Call budgets are then checked at their boundary: ``max_calls=3``
+(per request or per day) must let exactly three completions through,
+whether they are reserved one after another or all at once, and however
+many single-topic fallbacks an unusable batch reply triggers. Nothing is
+sent over the network.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import tempfile
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List
+
+from app.services.async_subtopics import agenerate_topic_tree
+from app.services.budget import Budget, BudgetTracker, DailyUsageStore
+from app.services.subtopics import (
+    BATCH_SYSTEM_PROMPT,
+    GenerationRequest,
+    SubtopicGenerationError,
+    generate_topic_tree,
+)
+
+# Replies sent to batched requests, and to single-topic requests for topics
+# whose name contains "Broken".
+SCENARIOS = {
+    "empty_batch": ("{}", None),
+    "non_json_batch": ("not json", None),
+    "non_json_fallback": ("{}", "not json"),
+    "empty_fallback": ("not json", '{"subtopics": []}'),
+}
+
+
+class _Response(dict):
+    def __init__(self, content: str):
+        super().__init__(choices=[{"message": {"content": content}}])
+        self.usage = {"total_tokens": 10, "prompt_tokens": 7, "completion_tokens": 3}
+
+
+class ScriptedClient:
+    """Chat client stand-in that counts the completions it serves."""
+
+    def __init__(self, batch_reply: str, broken_reply: str | None):
+        self.batch_reply = batch_reply
+        self.broken_reply = broken_reply
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create_chat_completion(
+        self,
+        api_key: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+    ) -> Any:
+        with self._lock:
+            self.calls += 1
+        if messages[0]["content"] == BATCH_SYSTEM_PROMPT:
+            return _Response(self.batch_reply)
+        topic = messages[-1]["content"].rsplit("Topic: ", 1)[-1]
+        if self.broken_reply is not None and "Broken" in topic:
+            return _Response(self.broken_reply)
+        return _Response(json.dumps({"subtopics": ["Alpha", "Broken beta"]}))
+
+    async def acreate_chat_completion(self, *args: Any, **kwargs: Any) -> Any:
+        return self.create_chat_completion(*args, **kwargs)
+
+
+def _request() -> GenerationRequest:
+    return GenerationRequest(
+        topics=["History", "Art", "Broken physics"],
+        max_level=3,
+        temperature=0.2,
+        model="gpt-3.5-turbo",
+        use_demo_mode=False,
+        concurrency=2,
+        batch_size=2,
+    )
+
+
+def _live_records(entry: Dict[str, Any]) -> int:
+    return sum(1 for record in entry["call_log"] if record.get("mode") == "live")
+
+
+def check_scenario(name: str, engine: str) -> Dict[str, Any]:
+    client = ScriptedClient(*SCENARIOS[name])
+    budget = BudgetTracker()
+    if engine == "sync":
+        entry = generate_topic_tree(_request(), "sk-test", client=client, budget=budget)
+    else:
+        entry = asyncio.run(agenerate_topic_tree(_request(), "sk-test", client=client, budget=budget))
+    logged = _live_records(entry)
+    assert client.calls == logged, f"{engine}/{name}: {client.calls} calls, {logged} logged"
+    assert budget.used["calls"] == client.calls, f"{engine}/{name}: budget charged {budget.used['calls']}"
+    return {"scenario": name, "engine": engine, "calls": client.calls, "logged": logged}
+
+
+def check_call_budget(max_calls: int = 3) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        trackers = {
+            "request": lambda: BudgetTracker(request_budget=Budget(max_calls=max_calls)),
+            "daily": lambda: BudgetTracker(
+                daily_budget=Budget(max_calls=max_calls),
+                daily_store=DailyUsageStore(Path(directory) / f"usage-{uuid.uuid4().hex}.sqlite3"),
+            ),
+        }
+        allowed = {}
+        for scope, create in trackers.items():
+            budget = create()
+            sequential = 0
+            while budget.reserve():
+                budget.record({"mode": "live", "total_tokens": 1})
+                budget.release()
+                sequential += 1
+            assert sequential == max_calls, f"{scope}: {sequential} sequential calls allowed"
+
+            budget = create()
+            parallel = sum(budget.reserve() for _ in range(max_calls * 2))
+            assert parallel == max_calls, f"{scope}: {parallel} parallel reservations allowed"
+
+            # Unusable batch replies make every topic of a chunk fall back to
+            # its own completion, each of which needs its own reservation.
+            for batch_size in (1, 4):
+                for engine in ("sync", "async"):
+                    label = f"{scope}/{engine}/batch_size={batch_size}"
+                    client = ScriptedClient("{}", None)
+                    request = _request()
+                    request.topics = ["History", "Art", "Physics", "Music"]
+                    request.batch_size = batch_size
+                    budget = create()
+                    if engine == "sync":
+                        entry = generate_topic_tree(request, "sk-test", client=client, budget=budget)
+                    else:
+                        entry = asyncio.run(
+                            agenerate_topic_tree(request, "sk-test", client=client, budget=budget)
+                        )
+                    assert client.calls == max_calls, f"{label}: generation made {client.calls} calls"
+                    assert budget.used["calls"] == max_calls, f"{label}: budget charged {budget.used['calls']}"
+                    assert entry.get("budget_exhausted"), f"{label}: budget not reported as reached"
+            allowed[scope] = sequential
+    return {"max_calls": max_calls, "allowed": allowed}
+
+
+def main() -> None:
+    report: List[Dict[str, Any]] = []
+    for name in SCENARIOS:
+        for engine in ("sync", "async"):
+            try:
+                report.append(check_scenario(name, engine))
+            except SubtopicGenerationError as exc:
+                raise AssertionError(f"{engine}/{name} failed outright: {exc}") from exc
+    report.append(check_call_budget())
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
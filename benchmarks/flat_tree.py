@@ -0,0 +1,100 @@
+"""Compare memory and traversal time of nested dict trees and ``FlatTree``.
+
+Run from the repository root::
+
+    python -m benchmarks.flat_tree --nodes 50000 --fanout 8
+
+A synthetic tree is built in memory, so no API key or history is needed.
+The report lists the memory each layout holds, how long summary, path
+lookup and JSON conversion take on both, and how long loading a stored
+blob takes as dicts versus as a ``FlatTree``. A degenerate chain deeper than
+the recursion limit is converted both ways to show nothing recurses.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from app.services.flat_tree import FlatTree
+from app.services.tree_codec import decode_trees, encode_trees
+from app.services.trees import find_node, summarize_trees
+from benchmarks.render_tree import build_entry
+
+
+def held_bytes(build: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    value = build()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del value
+    return held
+
+
+def median_ms(function: Callable[[], Any], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return round(samples[len(samples) // 2] * 1000, 3)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=50_000)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    text = json.dumps(build_entry(args.nodes, args.fanout)["trees"])
+    trees: List[Dict[str, Any]] = json.loads(text)
+    tree = FlatTree.from_dicts(trees)
+    assert tree.to_dicts() == trees and tree.summary() == summarize_trees(trees)
+    blob = encode_trees(trees)
+    deepest = max(tree.walk(), key=lambda item: len(item[1]))[1]
+
+    chain_depth = sys.getrecursionlimit() * 2
+    chain: Dict[str, Any] = {"topic": "0", "children": []}
+    node = chain
+    for depth in range(1, chain_depth):
+        child: Dict[str, Any] = {"topic": str(depth), "children": []}
+        node["children"].append(child)
+        node = child
+    chain_tree = FlatTree.from_dicts([chain])
+
+    report = {
+        "nodes": len(tree),
+        "held_bytes": {
+            "dicts": held_bytes(lambda: json.loads(text)),
+            "flat_tree": held_bytes(lambda: FlatTree.from_dicts(trees)),
+        },
+        "summary_ms": {
+            "dicts": median_ms(lambda: summarize_trees(trees), args.repeat),
+            "flat_tree": median_ms(tree.summary, args.repeat),
+        },
+        "find_deepest_ms": {
+            "dicts": median_ms(lambda: find_node(trees, deepest), args.repeat),
+            "flat_tree": median_ms(lambda: tree.find(deepest), args.repeat),
+        },
+        "to_dicts_ms": median_ms(tree.to_dicts, args.repeat),
+        "load_blob_ms": {
+            "dicts": median_ms(lambda: decode_trees(blob), args.repeat),
+            "flat_tree": median_ms(lambda: FlatTree.from_blob(blob), args.repeat),
+        },
+        "deep_chain": {
+            "depth": chain_depth,
+            "summary": chain_tree.summary(),
+            "round_trip": FlatTree.from_dicts(chain_tree.to_dicts()).summary() == chain_tree.summary(),
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Hammer the JSON history backend from several processes and count lost writes.
+
+Run from the repository root::
+
+    python -m benchmarks.history_stress --processes 8 --entries 50
+
+Each process appends its own entries and then toggles the favorite flag on
+every entry it wrote, so both the append-log path and the locked
+read-modify-write path run in parallel. The script exits non-zero when any
+entry or favorite update is missing from the final history.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+from app.storage import HistoryStore
+
+
+def make_entry(worker: int, index: int) -> Dict[str, Any]:
+    return {
+        "id": f"w{worker}-{index}",
+        "topics": [f"Topic {worker}.{index}"],
+        "max_level": 1,
+        "temperature": 0.2,
+        "model": "gpt-3.5-turbo",
+        "use_demo_mode": True,
+        "created_at": datetime.utcnow().isoformat(),
+        "trees": [{"topic": f"Topic {worker}.{index}", "children": []}],
+        "call_log": [],
+    }
+
+
+def work(args: Tuple[str, int, int]) -> None:
+    path, worker, entries = args
+    store = HistoryStore(Path(path))
+    for index in range(entries):
+        store.add_entry(make_entry(worker, index))
+    for index in range(0, entries, 2):
+        store.update_entry(f"w{worker}-{index}", {"is_favorite": True})
+
+
+def run(processes: int, entries: int, path: Path) -> Dict[str, Any]:
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        pool.map(work, [(str(path), worker, entries) for worker in range(processes)])
+    elapsed = time.perf_counter() - start
+
+    stored = HistoryStore(path).load()
+    ids = [entry["id"] for entry in stored]
+    favorites = {entry["id"] for entry in stored if entry.get("is_favorite")}
+    expected_favorites = {
+        f"w{worker}-{index}" for worker in range(processes) for index in range(0, entries, 2)
+    }
+    return {
+        "processes": processes,
+        "writes": processes * entries + len(expected_favorites),
+        "elapsed_seconds": round(elapsed, 3),
+        "stored_entries": len(ids),
+        "lost_entries": processes * entries - len(set(ids)),
+        "duplicate_entries": len(ids) - len(set(ids)),
+        "lost_favorite_updates": len(expected_favorites - favorites),
+        "history_parses": _parses(path),
+    }
+
+
+def _parses(path: Path) -> bool:
+    try:
+        json.loads(path.read_text(encoding="utf-8")) if path.exists() else []
+    except json.JSONDecodeError:
+        return False
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--entries", type=int, default=50, help="entries written per process")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        report = run(args.processes, args.entries, Path(directory) / "history.json")
+    print(json.dumps(report, indent=2))
+    if report["lost_entries"] or report["duplicate_entries"] or report["lost_favorite_updates"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Compare stored size of the legacy and compact call metadata layouts.
+
+Run from the repository root::
+
+    python -m benchmarks.metadata_size --depth 4 --topics 17
+
+Demo mode is used, so no API key or network access is needed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import tracemalloc
+from typing import Any, Dict, List
+
+from app.services.subtopics import GenerationRequest, generate_topic_tree
+from config import DEFAULT_TOPICS
+
+
+def to_legacy(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Rebuild the pre-compaction layout where every node lists its subtree's calls."""
+
+    legacy = copy.deepcopy(entry)
+    call_log: List[Dict[str, Any]] = legacy.pop("call_log")
+
+    def expand(node: Dict[str, Any]) -> List[Dict[str, Any]]:
+        collected = [call_log[node.pop("call")]] if "call" in node else []
+        for child in node["children"]:
+            collected.extend(expand(child))
+        node["metadata"] = collected
+        return collected
+
+    for tree in legacy["trees"]:
+        expand(tree)
+    return legacy
+
+
+def measure(entry: Dict[str, Any]) -> Dict[str, int]:
+    payload = json.dumps(entry, indent=2)
+    tracemalloc.start()
+    json.loads(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"json_bytes": len(payload.encode("utf-8")), "parse_peak_bytes": peak}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--topics", type=int, default=len(DEFAULT_TOPICS))
+    args = parser.parse_args()
+
+    report = []
+    for depth in range(1, args.depth + 1):
+        entry = generate_topic_tree(
+            GenerationRequest(
+                topics=DEFAULT_TOPICS[: args.topics],
+                max_level=depth,
+                temperature=0.2,
+                model="gpt-3.5-turbo",
+                use_demo_mode=True,
+            ),
+            api_key="",
+        )
+        legacy = measure(to_legacy(entry))
+        compact = measure(entry)
+        report.append(
+            {
+                "depth": depth,
+                "calls": len(entry["call_log"]),
+                "legacy": legacy,
+                "compact": compact,
+                "size_reduction": round(1 - compact["json_bytes"] / legacy["json_bytes"], 3),
+            }
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
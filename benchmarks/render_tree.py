@@ -0,0 +1,124 @@
+"""Time rendering a large topic tree with the old recursive template and the new renderer.
+
+Run from the repository root::
+
+    python -m benchmarks.render_tree --nodes 10000 --fanout 10
+
+A synthetic entry is built in memory, so no API key or history is needed.
+The report compares the recursive ``partials/tree.html`` include the detail
+page used to render, the iterative renderer drawing the full tree, the
+budgeted first paint the detail page now sends, and a render-cache hit.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List
+
+from jinja2 import DictLoader, Environment
+
+from app.services.flat_tree import FlatTree
+from app.services.render import DEFAULT_NODE_BUDGET, RenderCache, render_tree_html
+from app.services.trees import find_node, summarize_trees
+
+# The recursive include removed from app/templates/partials/tree.html.
+LEGACY_TEMPLATE = """\
+{% set source = resolve_node(entry['trees'], tree) %}
+{% set source_path = tree['ref'] if tree.get('ref') else path %}
+<li data-path="{{ source_path|join('.') }}">
+  <div class="tree-node">
+    <span class="tree-toggle">{{ tree['topic'] }}</span>
+    {% if source.get('children') %}
+      <span class="badge bg-light text-dark ms-2">{{ source['children']|length }} subtopics</span>
+    {% endif %}
+  </div>
+  {% if source.get('children') %}
+  <ul>
+    {% for child in source['children'] %}
+      {% with tree=child, path=source_path + [loop.index0] %}
+        {% include 'tree.html' %}
+      {% endwith %}
+    {% endfor %}
+  </ul>
+  {% endif %}
+</li>
+"""
+
+PAGE_TEMPLATE = """\
+{% for tree in entry['trees'] %}{% with path=[loop.index0] %}{% include 'tree.html' %}{% endwith %}{% endfor %}
+"""
+
+
+def resolve_node(trees: List[Dict[str, Any]], node: Dict[str, Any]) -> Dict[str, Any]:
+    """Follow ``ref`` links the way the removed template did."""
+
+    seen = 0
+    while node.get("ref") and seen < 64:
+        located = find_node(trees, tuple(node["ref"]))
+        if located is None:
+            break
+        node = located[0]
+        seen += 1
+    return node
+
+
+def build_entry(nodes: int, fanout: int) -> Dict[str, Any]:
+    """Build a breadth-first filled tree with ``nodes`` nodes under ``fanout`` roots."""
+
+    trees: List[Dict[str, Any]] = [{"topic": f"Topic {index}", "children": []} for index in range(fanout)]
+    frontier, count = list(trees), len(trees)
+    while count < nodes:
+        next_frontier = []
+        for node in frontier:
+            for index in range(fanout):
+                if count >= nodes:
+                    break
+                child = {"topic": f"{node['topic']}.{index}", "children": []}
+                node["children"].append(child)
+                next_frontier.append(child)
+                count += 1
+        frontier = next_frontier
+    return {"id": "benchmark", "max_level": 6, "trees": trees}
+
+
+def timed(function: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = function()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {"median_ms": round(samples[len(samples) // 2] * 1000, 3), "html_bytes": len(str(output))}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=10_000)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--budget", type=int, default=DEFAULT_NODE_BUDGET)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    entry = build_entry(args.nodes, args.fanout)
+    environment = Environment(loader=DictLoader({"tree.html": LEGACY_TEMPLATE, "page.html": PAGE_TEMPLATE}))
+    environment.globals["resolve_node"] = resolve_node
+    page = environment.get_template("page.html")
+    # The detail page loads trees as a FlatTree, so conversion is not timed.
+    tree = FlatTree.from_dicts(entry["trees"])
+    cache = RenderCache(node_budget=args.budget)
+    cache.render(entry, tree=tree)
+
+    report = {
+        "nodes": summarize_trees(entry["trees"])["total_nodes"],
+        "recursive_template": timed(lambda: page.render(entry=entry), args.repeat),
+        "iterative_full": timed(lambda: render_tree_html(entry, node_budget=args.nodes, tree=tree), args.repeat),
+        "iterative_budgeted": timed(lambda: render_tree_html(entry, node_budget=args.budget, tree=tree), args.repeat),
+        "cache_hit": timed(lambda: cache.render(entry, tree=tree), args.repeat),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
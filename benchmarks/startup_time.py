@@ -0,0 +1,78 @@
+"""Measure how long ``create_app`` takes to return.
+
+Run from the repository root::
+
+    python -m benchmarks.startup_time --runs 5
+
+An API key is configured and ``OPENAI_API_BASE`` points at an address that
+never answers, which used to stall start-up on the model listing request.
+Model discovery now happens in the background after the first page view, so
+``create_app`` should return in milliseconds regardless.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from app import create_app
+
+# TEST-NET-1 (RFC 5737): packets are dropped, so connections hang until timeout.
+UNREACHABLE_API_BASE = "http://192.0.2.1/v1"
+
+
+def build_app(directory: Path) -> Any:
+    return create_app(
+        {
+            "TESTING": True,
+            "OPENAI_API_KEY": "sk-benchmark",
+            "OPENAI_API_BASE": UNREACHABLE_API_BASE,
+            "HISTORY_PATH": directory / "history.json",
+            "HISTORY_DB_PATH": directory / "history.sqlite3",
+            "SETTINGS_PATH": directory / "settings.json",
+            "CACHE_PATH": directory / "expansion_cache.sqlite3",
+            "JOBS_DB_PATH": directory / "jobs.sqlite3",
+            "MODEL_CACHE_PATH": directory / "models.json",
+        }
+    )
+
+
+def run(runs: int) -> Dict[str, Any]:
+    timings: List[float] = []
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(runs):
+            start = time.perf_counter()
+            app = build_app(Path(directory))
+            timings.append((time.perf_counter() - start) * 1000)
+
+        # The first render only schedules discovery; it must not wait on the API.
+        start = time.perf_counter()
+        status = app.test_client().get("/").status_code
+        first_request_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        "runs": runs,
+        "create_app_ms": {
+            "min": round(min(timings), 2),
+            "median": round(statistics.median(timings), 2),
+            "max": round(max(timings), 2),
+        },
+        "first_request_ms": round(first_request_ms, 2),
+        "first_request_status": status,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.runs), indent=2))
+
+
+if __name__ == "__main__":
+    main()
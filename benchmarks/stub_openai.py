@@ -0,0 +1,177 @@
+"""Deterministic OpenAI-compatible chat completion server for offline benchmarks.
+
+Run it on its own from the repository root::
+
+    python -m benchmarks.stub_openai --port 8001 --latency-ms 80 --error-rate 0.05 --fanout 5
+
+then point the app at it with ``OPENAI_API_BASE=http://127.0.0.1:8001/v1``.
+``POST /v1/chat/completions`` answers single-topic and batched subtopic
+prompts with ``fanout`` children per topic; ``GET /v1/models`` lists a few
+chat models. Latency and injected failures are drawn from a generator
+seeded by the prompt and its attempt number, so a run is reproducible no
+matter in which order concurrent requests arrive.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 50.0
+    # Latency is drawn uniformly from latency_ms * (1 +/- jitter).
+    jitter: float = 0.5
+    error_rate: float = 0.0
+    fanout: int = 5
+    seed: int = 0
+
+
+class StubServer:
+    """Threaded stub server; use as a context manager or call ``start``/``stop``."""
+
+    def __init__(self, config: StubConfig, host: str = "127.0.0.1", port: int = 0):
+        self.config = config
+        self.requests = 0
+        self.errors = 0
+        self._attempts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _handler_for(self))
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def api_base(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def plan(self, prompt: str) -> Tuple[float, bool]:
+        """Return (latency seconds, should fail) for the next attempt at ``prompt``."""
+
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            attempt = self._attempts.get(digest, 0)
+            self._attempts[digest] = attempt + 1
+            self.requests += 1
+        rng = random.Random(f"{self.config.seed}:{digest}:{attempt}")
+        spread = self.config.jitter * (2 * rng.random() - 1)
+        latency = max(0.0, self.config.latency_ms * (1 + spread)) / 1000
+        fail = rng.random() < self.config.error_rate
+        if fail:
+            with self._lock:
+                self.errors += 1
+        return latency, fail
+
+    def subtopics(self, topic: str) -> List[str]:
+        return [f"{topic} {index + 1}" for index in range(self.config.fanout)]
+
+
+def _handler_for(stub: StubServer) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            if self.path.rstrip("/").endswith("/models"):
+                models = ["gpt-3.5-turbo", "gpt-4", "gpt-stub"]
+                self._send(200, {"object": "list", "data": [{"id": model, "object": "model"} for model in models]})
+            else:
+                self._send(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+        def do_POST(self) -> None:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            messages = body.get("messages") or []
+            prompt = str(messages[-1].get("content", "")) if messages else ""
+            latency, fail = stub.plan(prompt)
+            time.sleep(latency)
+            if fail:
+                self._send(500, {"error": {"message": "Injected stub failure", "type": "server_error"}})
+                return
+            content = json.dumps({"subtopics": _answer(stub, prompt)})
+            prompt_tokens = max(1, len(prompt) // 4)
+            completion_tokens = max(1, len(content) // 4)
+            self._send(
+                200,
+                {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "model": body.get("model", "gpt-stub"),
+                    "choices": [
+                        {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                },
+            )
+
+        def _send(self, status: int, payload: Dict[str, Any]) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def _answer(stub: StubServer, prompt: str) -> Any:
+    # Prompts end with "Topic: <name>" or, when batched, "Topics: <JSON list>".
+    if "Topics: " in prompt:
+        topics = json.loads(prompt.rsplit("Topics: ", 1)[1])
+        return {topic: stub.subtopics(topic) for topic in topics}
+    return stub.subtopics(prompt.rsplit("Topic: ", 1)[-1].strip())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=StubConfig.latency_ms)
+    parser.add_argument("--jitter", type=float, default=StubConfig.jitter)
+    parser.add_argument("--error-rate", type=float, default=StubConfig.error_rate)
+    parser.add_argument("--fanout", type=int, default=StubConfig.fanout)
+    parser.add_argument("--seed", type=int, default=StubConfig.seed)
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency_ms, args.jitter, args.error_rate, args.fanout, args.seed)
+    server = StubServer(config, args.host, args.port)
+    print(f"Serving stub completions on {server.api_base}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""Offline benchmark suite: generation engines, history stores and Flask routes.
+
+Run from the repository root::
+
+    python -m benchmarks.suite --depths 2 3 --fanouts 3 5 --history-sizes 100 1000 \\
+        --latency-ms 50 --error-rate 0.02 --output report.json
+
+Live generations talk to the local stub in ``benchmarks.stub_openai``, so no
+API key or network access is needed. Every scenario runs in a fresh
+process, which keeps its peak RSS separate from the others. The JSON report
+records the commit it was taken on, so reports from two commits can be
+compared directly.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from benchmarks.stub_openai import StubConfig, StubServer
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Return nearest-rank p50/p95/max of ``samples`` (seconds) in milliseconds."""
+
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+
+    def rank(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+    return {
+        "p50": round(rank(0.50) * 1000, 3),
+        "p95": round(rank(0.95) * 1000, 3),
+        "max": round(ordered[-1] * 1000, 3),
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def timed(function: Callable[[], Any], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def generation_scenario(params: Dict[str, Any]) -> Dict[str, Any]:
+    from app.services.async_subtopics import agenerate_topic_tree
+    from app.services.client import ChatClient
+    from app.services.subtopics import GenerationRequest, generate_topic_tree
+    from app.services.trees import summarize_calls, summarize_trees
+
+    client = ChatClient(
+        requests_per_minute=1_000_000,
+        tokens_per_minute=1_000_000_000,
+        backoff_base=0.01,
+        backoff_max=0.1,
+        api_base=params["api_base"],
+    )
+    request = GenerationRequest(
+        topics=[f"Benchmark {index}" for index in range(params["roots"])],
+        max_level=params["depth"],
+        temperature=0.2,
+        model="gpt-stub",
+        use_demo_mode=False,
+        concurrency=params["concurrency"],
+        batch_size=params["batch_size"],
+    )
+    start = time.perf_counter()
+    if params["engine"] == "async":
+        entry = asyncio.run(agenerate_topic_tree(request, "sk-benchmark", client=client))
+    else:
+        entry = generate_topic_tree(request, "sk-benchmark", client=client)
+    wall = time.perf_counter() - start
+
+    usage = summarize_calls(entry["call_log"])
+    # Per-call latency as recorded in the call log (10 ms resolution, retries included).
+    latencies = [record["elapsed_seconds"] for record in entry["call_log"] if record.get("mode") == "live"]
+    return {
+        "nodes": summarize_trees(entry["trees"])["total_nodes"],
+        "calls": usage["live_calls"],
+        "retries": client.retries,
+        "failed_nodes": sum(1 for _ in _failed_nodes(entry["trees"])),
+        "wall_seconds": round(wall, 3),
+        "calls_per_second": round(usage["live_calls"] / wall, 2) if wall else 0.0,
+        "call_latency_ms": percentiles(latencies),
+        "total_tokens": usage["total_tokens"],
+    }
+
+
+def history_scenario(params: Dict[str, Any]) -> Dict[str, Any]:
+    from app.storage import HistoryStore, SQLiteHistoryStore
+
+    directory = Path(params["directory"])
+    if params["backend"] == "json":
+        store = HistoryStore(directory / "history.json")
+    else:
+        store = SQLiteHistoryStore(directory / "history.sqlite3")
+    template = _demo_entry(params["depth"])
+
+    add_samples = []
+    for index in range(params["size"]):
+        entry = dict(template, id=uuid.uuid4().hex, topics=[f"Topic {index}"])
+        start = time.perf_counter()
+        store.add_entry(entry)
+        add_samples.append(time.perf_counter() - start)
+
+    entry_id = store.list_entries(limit=1)[0]["id"]
+    repeat = params["repeat"]
+    return {
+        "add_entry_ms": percentiles(add_samples),
+        "update_trees_ms": percentiles(
+            timed(lambda: store.update_entry(entry_id, {"trees": template["trees"]}), max(1, repeat // 5))
+        ),
+        "list_page_ms": percentiles(timed(lambda: store.list_entries(limit=25), repeat)),
+        "get_entry_ms": percentiles(timed(lambda: store.get_entry(entry_id), repeat)),
+        "search_ms": percentiles(timed(lambda: store.search("Topic 1"), repeat)),
+        "ops_per_second": round(len(add_samples) / sum(add_samples), 2) if add_samples else 0.0,
+    }
+
+
+def routes_scenario(params: Dict[str, Any]) -> Dict[str, Any]:
+    from app import create_app
+    from app.storage import SQLiteHistoryStore
+
+    directory = Path(params["directory"])
+    store = SQLiteHistoryStore(directory / "history.sqlite3")
+    template = _demo_entry(params["depth"])
+    entry_id = ""
+    for index in range(params["size"]):
+        entry_id = uuid.uuid4().hex
+        store.add_entry(dict(template, id=entry_id, topics=[f"Topic {index}"]))
+
+    app = create_app(
+        {
+            "TESTING": True,
+            "OPENAI_API_KEY": "sk-benchmark",
+            "OPENAI_API_BASE": params["api_base"],
+            "OPENAI_REQUESTS_PER_MINUTE": 1_000_000,
+            "OPENAI_TOKENS_PER_MINUTE": 1_000_000_000,
+            "HISTORY_DB_PATH": directory / "history.sqlite3",
+            "HISTORY_PATH": directory / "history.json",
+            "SETTINGS_PATH": directory / "settings.json",
+            "CACHE_PATH": directory / "cache.sqlite3",
+            "JOBS_DB_PATH": directory / "jobs.sqlite3",
+            "USAGE_DB_PATH": directory / "usage.sqlite3",
+            "CHECKPOINT_DB_PATH": directory / "checkpoints.sqlite3",
+            "MODEL_CACHE_PATH": directory / "models.json",
+        }
+    )
+    client = app.test_client()
+    repeat = params["repeat"]
+    urls = {
+        "dashboard": "/",
+        "history": "/history",
+        "detail": f"/history/{entry_id}",
+        "search": "/history?q=Topic",
+    }
+
+    def stream_generation() -> None:
+        # A fresh topic per run keeps the expansion cache cold.
+        job = client.post("/generate", json={"topics": uuid.uuid4().hex, "depth": params["depth"]}).get_json()
+        body = client.get(job["stream_url"]).data
+        assert b"event: done" in body, body[-200:]
+
+    results: Dict[str, Any] = {}
+    for name, url in urls.items():
+        samples = timed(lambda: client.get(url).data, repeat)
+        results[f"{name}_ms"] = percentiles(samples)
+        results[f"{name}_requests_per_second"] = round(len(samples) / sum(samples), 2)
+    samples = timed(stream_generation, max(1, repeat // 10))
+    results["stream_generation_ms"] = percentiles(samples)
+    results["stream_generation_requests_per_second"] = round(len(samples) / sum(samples), 2)
+    return results
+
+
+SCENARIOS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    "generation": generation_scenario,
+    "history": history_scenario,
+    "routes": routes_scenario,
+}
+
+
+def _run_isolated(scenario: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        result = SCENARIOS[scenario](dict(params, directory=directory))
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def _demo_entry(depth: int) -> Dict[str, Any]:
+    from app.services.subtopics import GenerationRequest, generate_topic_tree
+
+    return generate_topic_tree(GenerationRequest(["Benchmark"], depth, 0.2, "gpt-stub", True), "")
+
+
+def _failed_nodes(trees: List[Dict[str, Any]]):
+    stack = list(trees)
+    while stack:
+        node = stack.pop()
+        if node.get("error"):
+            yield node
+        stack.extend(node.get("children") or [])
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument("--depths", nargs="+", type=int, default=[2, 3])
+    parser.add_argument("--fanouts", nargs="+", type=int, default=[3, 5])
+    parser.add_argument("--history-sizes", nargs="+", type=int, default=[100, 1000])
+    parser.add_argument("--engines", nargs="+", choices=["sync", "async"], default=["sync", "async"])
+    parser.add_argument("--roots", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=50, help="samples per timed read or route")
+    parser.add_argument("--output", type=Path, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    runs: List[Dict[str, Any]] = []
+    for scenario in args.scenarios:
+        if scenario == "generation":
+            for engine in args.engines:
+                for depth in args.depths:
+                    for fanout in args.fanouts:
+                        runs.append(
+                            {
+                                "scenario": scenario,
+                                "engine": engine,
+                                "depth": depth,
+                                "fanout": fanout,
+                                "roots": args.roots,
+                                "concurrency": args.concurrency,
+                                "batch_size": args.batch_size,
+                            }
+                        )
+        elif scenario == "history":
+            for backend in ("sqlite", "json"):
+                for size in args.history_sizes:
+                    runs.append(
+                        {"scenario": scenario, "backend": backend, "size": size, "depth": 2, "repeat": args.repeat}
+                    )
+        else:
+            for size in args.history_sizes:
+                runs.append(
+                    {
+                        "scenario": scenario,
+                        "size": size,
+                        "depth": max(args.depths),
+                        "fanout": max(args.fanouts),
+                        "repeat": args.repeat,
+                    }
+                )
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for run in runs:
+        # Routes run against the stub too, so they get its fan-out.
+        stub_config = StubConfig(args.latency_ms, args.jitter, args.error_rate, run.get("fanout", 5), args.seed)
+        with StubServer(stub_config) as stub, context.Pool(1) as pool:
+            started = time.perf_counter()
+            metrics = pool.apply(_run_isolated, (run["scenario"], dict(run, api_base=stub.api_base)))
+            run_seconds = time.perf_counter() - started
+            metrics["stub_requests"] = stub.requests
+            metrics["stub_errors"] = stub.errors
+        results.append({**run, "run_seconds": round(run_seconds, 3), "metrics": metrics})
+        print(f"{run} done in {run_seconds:.1f}s", file=sys.stderr)
+
+    report = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "stub": {
+            "latency_ms": args.latency_ms,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Compare the binary tree codec with the JSON layouts history trees used to be stored in.
+
+Run from the repository root::
+
+    python -m benchmarks.tree_codec --depth 4 --topics 17
+
+Demo mode is used, so no API key or network access is needed. Every
+encoding is first checked to round-trip exactly (whole trees and every
+subtree of the first root) before sizes and parse times are reported.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.services.subtopics import GenerationRequest, generate_topic_tree
+from app.services.tree_codec import decode_subtree, decode_trees, encode_trees
+from app.services.trees import find_node, summarize_trees
+from config import DEFAULT_TOPICS
+
+
+def check_round_trip(trees: List[Dict[str, Any]]) -> None:
+    for compress in (False, True):
+        blob = encode_trees(trees, compress=compress)
+        assert decode_trees(blob) == trees, "full decode differs"
+    assert decode_trees(encode_trees([])) == []
+
+    blob = encode_trees(trees)
+    stack: List[Tuple[int, ...]] = [(0,)]
+    while stack:
+        path = stack.pop()
+        located = find_node(trees, path)
+        assert decode_subtree(blob, path) == (located[0] if located else None), f"subtree {path} differs"
+        if located:
+            stack.extend(path + (index,) for index in range(len(located[0].get("children") or [])))
+    assert decode_subtree(blob, (len(trees),)) is None
+    assert decode_subtree(blob, (0, 10_000)) is None
+
+
+def median_ms(function: Callable[[], Any], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return round(samples[len(samples) // 2] * 1000, 3)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--topics", type=int, default=len(DEFAULT_TOPICS))
+    parser.add_argument("--repeat", type=int, default=9)
+    args = parser.parse_args()
+
+    report = []
+    for depth in range(1, args.depth + 1):
+        entry = generate_topic_tree(
+            GenerationRequest(
+                topics=DEFAULT_TOPICS[: args.topics],
+                max_level=depth,
+                temperature=0.2,
+                model="gpt-3.5-turbo",
+                use_demo_mode=True,
+            ),
+            "",
+        )
+        trees = entry["trees"]
+        check_round_trip(trees)
+
+        indented = json.dumps(trees, indent=2).encode("utf-8")
+        compact = json.dumps(trees, separators=(",", ":")).encode("utf-8")
+        raw = encode_trees(trees, compress=False)
+        packed = encode_trees(trees)
+        deep_path = (0,) * depth
+        report.append(
+            {
+                "depth": depth,
+                "nodes": summarize_trees(trees)["total_nodes"],
+                "bytes": {
+                    "json_indent_2": len(indented),
+                    "json_compact": len(compact),
+                    "binary": len(raw),
+                    "binary_zlib": len(packed),
+                },
+                "parse_ms": {
+                    "json_indent_2": median_ms(lambda: json.loads(indented), args.repeat),
+                    "json_compact": median_ms(lambda: json.loads(compact), args.repeat),
+                    "binary": median_ms(lambda: decode_trees(raw), args.repeat),
+                    "binary_zlib": median_ms(lambda: decode_trees(packed), args.repeat),
+                    "binary_zlib_subtree": median_ms(lambda: decode_subtree(packed, deep_path), args.repeat),
+                },
+                "encode_ms": {
+                    "json_compact": median_ms(lambda: json.dumps(trees, separators=(",", ":")), args.repeat),
+                    "binary_zlib": median_ms(lambda: encode_trees(trees), args.repeat),
+                },
+            }
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
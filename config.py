@@ -2,8 +2,44 @@
 
 import os
 
+
+def _optional_number(name, cast=int):
+    value = os.environ.get(name, "")
+    return cast(value) if value else None
+
+
 API_KEY = os.environ.get("OPENAI_API_KEY", "")
 
+# Maximum number of subtopic requests issued in parallel for each tree level.
+GENERATION_CONCURRENCY = int(os.environ.get("GENERATION_CONCURRENCY", "8"))
+
+# Number of sibling topics expanded by a single chat completion. Batching cuts
+# round-trips per level; set to 1 to send one request per topic.
+GENERATION_BATCH_SIZE = int(os.environ.get("GENERATION_BATCH_SIZE", "1"))
+
+# Engine that runs background generation jobs: "threads" expands each level on
+# a thread pool, "asyncio" runs every request of a job on one event loop with
+# a pooled aiohttp session and cancels in-flight requests when it is cancelled.
+GENERATION_ENGINE = os.environ.get("GENERATION_ENGINE", "threads")
+
+# Generation budgets. A generation that reaches a limit stops early and keeps
+# the partial tree. Leave a variable unset for no limit; daily limits count
+# live completions across all generations per UTC day.
+REQUEST_MAX_CALLS = _optional_number("REQUEST_MAX_CALLS")
+REQUEST_MAX_TOKENS = _optional_number("REQUEST_MAX_TOKENS")
+REQUEST_MAX_SECONDS = _optional_number("REQUEST_MAX_SECONDS", float)
+DAILY_MAX_CALLS = _optional_number("DAILY_MAX_CALLS")
+DAILY_MAX_TOKENS = _optional_number("DAILY_MAX_TOKENS")
+DAILY_MAX_SECONDS = _optional_number("DAILY_MAX_SECONDS", float)
+
+# Per-model OpenAI quotas used by the rate limiter. Models not listed here fall
+# back to OPENAI_REQUESTS_PER_MINUTE / OPENAI_TOKENS_PER_MINUTE.
+OPENAI_REQUESTS_PER_MINUTE = int(os.environ.get("OPENAI_REQUESTS_PER_MINUTE", "3500"))
+OPENAI_TOKENS_PER_MINUTE = int(os.environ.get("OPENAI_TOKENS_PER_MINUTE", "90000"))
+OPENAI_MODEL_RATE_LIMITS = {
+    "gpt-4": {"rpm": 500, "tpm": 10000},
+}
+
 DEFAULT_TOPICS = [
     "Agriculture",
     "Anthropology",